@@ -0,0 +1,137 @@
+"""
+Content-addressed artifact store shared across jobs: key = source SHA1 + stage + params hash + model version, LRU eviction by size.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import uuid
+from typing import Any, Dict, Optional
+
+CACHE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'cache', 'artifacts'))
+CACHE_MAX_BYTES = int(float(os.environ.get("ARTIFACT_CACHE_MAX_MB", 20480)) * 1024 * 1024)
+
+
+class ArtifactStore:
+    """
+    Каждый артефакт — каталог `{root}/{key}/` с файлами и meta.json.
+    Попадание обновляет mtime каталога (LRU), при превышении лимита удаляются самые старые.
+    Счётчики hit/miss — файлы, в которые дописывается по байту: дозапись атомарна между
+    процессами пулов стадий, значение счётчика = размер файла.
+    """
+    def __init__(self, root: str = CACHE_ROOT, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(source_sha1: str, stage: str, params: Optional[Dict] = None, version: str = "1") -> str:
+        params_json = json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+        params_hash = hashlib.sha1(params_json.encode("utf-8")).hexdigest()
+        return hashlib.sha1(f"{source_sha1}:{stage}:{params_hash}:{version}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _count(self, stage: str, kind: str):
+        with open(os.path.join(self.root, f".{kind}_{stage}"), "ab") as f:
+            f.write(b".")
+
+    def get_dir(self, key: str, stage: str) -> Optional[str]:
+        """Путь к каталогу артефакта при попадании, иначе None."""
+        entry = self.path(key)
+        if os.path.exists(os.path.join(entry, "meta.json")):
+            now = time.time()
+            os.utime(entry, (now, now))
+            self._count(stage, "hits")
+            return entry
+        self._count(stage, "misses")
+        return None
+
+    def put_dir(self, key: str, stage: str, files: Dict[str, str], params: Optional[Dict] = None) -> str:
+        """Кладёт файлы ({имя в артефакте: исходный путь}) под ключ; запись атомарна через rename."""
+        entry = self.path(key)
+        tmp = os.path.join(self.root, f".tmp_{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        for name, src in files.items():
+            shutil.copyfile(src, os.path.join(tmp, name))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"stage": stage, "params": params or {}, "created": time.time()}, f, ensure_ascii=False, default=str)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Параллельный процесс уже положил тот же артефакт
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return entry
+
+    def fetch_files(self, key: str, stage: str, targets: Dict[str, str]) -> bool:
+        """При попадании копирует файлы артефакта ({имя: путь назначения}) и возвращает True."""
+        entry = self.get_dir(key, stage)
+        if entry is None:
+            return False
+        for name, dst in targets.items():
+            shutil.copyfile(os.path.join(entry, name), dst)
+        return True
+
+    def get_json(self, key: str, stage: str) -> Optional[Any]:
+        entry = self.get_dir(key, stage)
+        if entry is None:
+            return None
+        with open(os.path.join(entry, "data.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def put_json(self, key: str, stage: str, data: Any, params: Optional[Dict] = None):
+        tmp_path = os.path.join(self.root, f".tmp_{uuid.uuid4().hex}.json")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        try:
+            self.put_dir(key, stage, {"data.json": tmp_path}, params)
+        finally:
+            os.remove(tmp_path)
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            entry = os.path.join(self.root, name)
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            yield entry, os.path.getmtime(entry), size
+
+    def evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        evicted = 0
+        for entry, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            with open(os.path.join(self.root, ".evictions"), "ab") as f:
+                f.write(b"." * evicted)
+
+    def stats(self) -> Dict:
+        stages: Dict[str, Dict[str, int]] = {}
+        for name in os.listdir(self.root):
+            for kind in ("hits", "misses"):
+                prefix = f".{kind}_"
+                if name.startswith(prefix):
+                    stage = name[len(prefix):]
+                    stages.setdefault(stage, {"hits": 0, "misses": 0})[kind] = os.path.getsize(os.path.join(self.root, name))
+        entries = list(self._entries())
+        evictions_path = os.path.join(self.root, ".evictions")
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "hits": sum(s["hits"] for s in stages.values()),
+            "misses": sum(s["misses"] for s in stages.values()),
+            "evictions": os.path.getsize(evictions_path) if os.path.exists(evictions_path) else 0,
+            "stages": stages,
+        }
+
+
+artifacts = ArtifactStore()
@@ -0,0 +1,110 @@
+"""
+Stage executor: runs blocking pipeline stages (ASR, audio/scene analysis, CV) in process pools off the event loop.
+"""
+import asyncio
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+from .models.registry import registry
+
+# process — отдельные процессы (по умолчанию), thread — потоки (удобно для --reload/отладки)
+STAGE_EXECUTOR = os.environ.get("STAGE_EXECUTOR", "process")
+
+# Размеры пулов по группам стадий
+POOL_SIZES = {
+    "asr": int(os.environ.get("ASR_PROCESSES", 1)),
+    "analysis": int(os.environ.get("ANALYSIS_PROCESSES", 1)),
+    "vision": int(os.environ.get("VISION_PROCESSES", max(1, (os.cpu_count() or 2) // 2))),
+}
+
+# Какая стадия в каком пуле выполняется
+STAGE_POOLS = {
+    "transcript": "asr",
+    "highlights": "analysis",
+    "captions": "analysis",
+    "reframing": "vision",
+    "previews": "vision",
+}
+
+# Модели реестра, которые загружаются один раз при старте каждого процесса пула
+POOL_MODELS = {
+    "asr": ["whisper", "whisper_batched", "silero_vad"],
+    "analysis": ["keybert"],
+    "vision": ["face_detector"],
+}
+
+_pools: Dict[str, object] = {}
+
+
+def _init_worker(names):
+    """Инициализатор процесса пула: заранее загружает модели своей группы (ошибки — ленивая загрузка позже)."""
+    registry.warmup(names)
+
+
+def _warm_models(names):
+    return os.getpid(), registry.warmup(names)
+
+
+def _models_status():
+    return os.getpid(), registry.status()
+
+
+def get_pool(name: str):
+    pool = _pools.get(name)
+    if pool is None:
+        size = max(1, POOL_SIZES.get(name, 1))
+        if STAGE_EXECUTOR == "thread":
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"stage-{name}")
+        else:
+            # spawn: безопасно для CUDA/torch и не наследует состояние event loop
+            pool = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(POOL_MODELS.get(name, []),),
+            )
+        _pools[name] = pool
+    return pool
+
+
+async def run_stage(stage: str, func: Callable, *args):
+    """
+    Выполняет блокирующую функцию стадии в пуле своей группы, не блокируя event loop.
+    Стадии без собственного пула (скачивание, ffmpeg) уходят в стандартный пул потоков.
+    """
+    loop = asyncio.get_running_loop()
+    pool_name: Optional[str] = STAGE_POOLS.get(stage)
+    pool = get_pool(pool_name) if pool_name else None
+    return await loop.run_in_executor(pool, func, *args)
+
+
+async def _per_process(pool_name: str, func: Callable, *args) -> Dict:
+    """Вызывает func в пуле столько раз, сколько в нём процессов; результаты по pid."""
+    loop = asyncio.get_running_loop()
+    pool = get_pool(pool_name)
+    size = max(1, POOL_SIZES.get(pool_name, 1))
+    results = await asyncio.gather(*(loop.run_in_executor(pool, func, *args) for _ in range(size)))
+    return {str(pid): status for pid, status in results}
+
+
+async def warmup(pool_names: Optional[Iterable[str]] = None) -> Dict:
+    """Загружает модели во всех процессах пулов (пулы создаются при необходимости)."""
+    out = {}
+    for name in pool_names or POOL_MODELS:
+        out[name] = await _per_process(name, _warm_models, POOL_MODELS.get(name, []))
+    return out
+
+
+async def models_status() -> Dict:
+    """Состояние моделей в процессе API и в уже запущенных пулах (новые пулы не создаются)."""
+    out = {"api": {str(os.getpid()): registry.status()}}
+    for name in list(_pools):
+        out[name] = await _per_process(name, _models_status)
+    return out
+
+
+def shutdown():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    _pools.clear()
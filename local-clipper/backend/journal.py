@@ -0,0 +1,106 @@
+"""
+Durable job journal: SQLite in WAL mode records submitted jobs, per-stage completion with artifact paths and final status, so unfinished jobs resume after a restart.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+JOURNAL_PATH = os.environ.get(
+    "JOB_JOURNAL_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'work', 'jobs.sqlite3')),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    job_data TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id TEXT NOT NULL REFERENCES jobs(job_id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    artifacts TEXT NOT NULL,
+    finished REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+"""
+
+
+class JobJournal:
+    """
+    Одно соединение на процесс (вызовы идут из event loop, запись — доли миллисекунды).
+    WAL + synchronous=NORMAL: коммит не ждёт fsync основного файла, а читатели не блокируют запись;
+    после сбоя процесса теряется не больше последней транзакции.
+    """
+    def __init__(self, path: str = JOURNAL_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql: str, *params):
+        with self._lock:
+            self._db.execute(sql, params)
+
+    # --- Запись ---
+    def submit(self, job_id: str, job_data: Dict[str, Any]):
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO jobs (job_id, job_data, status, error, created, updated) VALUES (?, ?, 'queued', NULL, ?, ?)",
+            job_id, json.dumps(job_data, ensure_ascii=False), now, now)
+
+    def stage_done(self, job_id: str, stage: str, seq: int, artifacts: Dict[str, Any], job_data: Dict[str, Any]):
+        """Стадия завершена: её артефакты и актуальный job_data (стадии дописывают в него SHA1) — одной транзакцией."""
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO stages (job_id, stage, seq, artifacts, finished) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, stage, seq, json.dumps(artifacts, ensure_ascii=False), now))
+                self._db.execute(
+                    "UPDATE jobs SET job_data = ?, status = 'processing', updated = ? WHERE job_id = ?",
+                    (json.dumps(job_data, ensure_ascii=False), now, job_id))
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        self._write("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE job_id = ?", status, error, time.time(), job_id)
+
+    # --- Чтение ---
+    def stages(self, job_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._db.execute("SELECT stage, artifacts FROM stages WHERE job_id = ? ORDER BY seq", (job_id,)).fetchall()
+        return [(stage, json.loads(artifacts)) for stage, artifacts in rows]
+
+    def unfinished(self) -> List[Tuple[str, Dict[str, Any], List[Tuple[str, Dict[str, Any]]]]]:
+        """Задачи, не дошедшие до ready/error: (job_id, job_data, завершённые стадии по порядку)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, job_data FROM jobs WHERE status NOT IN ('ready', 'error') ORDER BY created").fetchall()
+        return [(job_id, json.loads(job_data), self.stages(job_id)) for job_id, job_data in rows]
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Статус задачи в формате JobQueue.progress (для задач, которых уже нет в памяти)."""
+        with self._lock:
+            row = self._db.execute("SELECT status, error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        status = {"status": row[0], "steps": [{"step": stage, "status": "done"} for stage, _ in self.stages(job_id)]}
+        if row[1]:
+            status["error"] = row[1]
+        return status
@@ -4,19 +4,35 @@ FastAPI backend: API routes, static files, CORS, error handling.
 from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import os
 import uuid
-import shutil
 import json
+import asyncio
 
 from .workers import job_queue
-from .services import downloader, transcript, highlight, reframing, captions, styling, title_hook_tags, virality, render
+from .progress import TERMINAL_STATUSES
+from . import executor
+from .cache import artifacts
+from .services import downloader, ingest, transcript, highlight, reframing, captions, previews, styling, title_hook_tags, virality, render
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def on_startup():
+    # Воркеры очереди стартуют внутри работающего event loop
+    job_queue.start_workers()
+    # Задачи, прерванные прошлым перезапуском, продолжаются с первой незавершённой стадии
+    await job_queue.resume()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    executor.shutdown()
+    await title_hook_tags.client.close()
+    job_queue.close_journal()
+
 # --- Pydantic models ---
 class JobRequestUrl(BaseModel):
     url: str
@@ -27,6 +43,7 @@ class JobRequestUrl(BaseModel):
     aspect: Optional[str] = "9:16"
     emojis: Optional[bool] = True
     po_token: Optional[str] = None  # Добавлено поле для po_token
+    streaming: Optional[bool] = None  # None — автоматически для длинных записей
 
 class RenderSegment(BaseModel):
     id: str
@@ -35,11 +52,19 @@ class RenderSegment(BaseModel):
     style: Optional[str] = None
     captions: Optional[bool] = True
     overlays: Optional[List[str]] = None
+    reframe: Optional[bool] = True
+    loudnorm: Optional[bool] = True
+    scale: Optional[bool] = True  # False — без масштабирования (при отсутствии кропа/сабов/loudnorm возможен -c copy)
 
 class RenderRequest(BaseModel):
     segments: List[RenderSegment]
     resolution: int = 720
     format: str = "mp4"
+    # Настройки энкодера (None — значения по умолчанию из render.DEFAULT_OPTIONS)
+    preset: Optional[str] = None
+    crf: Optional[int] = None
+    threads: Optional[int] = None
+    bitrate: Optional[str] = None
 
 # CORS
 app.add_middleware(
@@ -69,55 +94,157 @@ async def job_from_url(req: JobRequestUrl, background_tasks: BackgroundTasks):
     # Сохранить job, добавить в очередь
     job_data = req.dict()
     job_data["job_id"] = job_id
-    job_queue.progress[job_id] = {"status": "queued", "steps": []}
-    await job_queue.queue.put((job_id, job_data))
+    await job_queue.submit(job_id, job_data)
     return {"job_id": job_id}
 
 @app.post("/api/job/from_file")
-async def job_from_file(file: UploadFile = File(...), lang: Optional[str] = Form(None), max_clips: Optional[int] = Form(None), clip_len: Optional[int] = Form(None), style_preset: Optional[str] = Form(None), aspect: Optional[str] = Form("9:16"), emojis: Optional[bool] = Form(True), po_token: Optional[str] = Form(None), background_tasks: BackgroundTasks = None):
+async def job_from_file(file: UploadFile = File(...), lang: Optional[str] = Form(None), max_clips: Optional[int] = Form(None), clip_len: Optional[int] = Form(None), style_preset: Optional[str] = Form(None), aspect: Optional[str] = Form("9:16"), emojis: Optional[bool] = Form(True), po_token: Optional[str] = Form(None), streaming: Optional[bool] = Form(None), background_tasks: BackgroundTasks = None):
     job_id = str(uuid.uuid4())
-    # Сохранить файл
-    source_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source'))
-    os.makedirs(source_dir, exist_ok=True)
-    file_path = os.path.join(source_dir, f"{job_id}_{file.filename}")
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    # Сохранить файл: потоково, с SHA1 на лету и дедупликацией по содержимому
+    file_path, source_sha1 = await ingest.ingest_upload(file)
     job_data = {
         "job_id": job_id,
         "file_path": file_path,
+        "source_sha1": source_sha1,
         "lang": lang,
         "max_clips": max_clips,
         "clip_len": clip_len,
         "style_preset": style_preset,
         "aspect": aspect,
         "emojis": emojis,
-        "po_token": po_token
+        "po_token": po_token,
+        "streaming": streaming
     }
-    job_queue.progress[job_id] = {"status": "queued", "steps": []}
-    await job_queue.queue.put((job_id, job_data))
+    await job_queue.submit(job_id, job_data)
     return {"job_id": job_id}
 
 @app.get("/api/job/{job_id}")
 async def get_job_status(job_id: str):
-    status = job_queue.progress.get(job_id)
+    status = job_queue.status(job_id)
     if not status:
         raise HTTPException(status_code=404, detail="Job not found")
     return status
 
+# Пустой комментарий раз в N секунд, чтобы прокси не закрывали простаивающее соединение
+SSE_KEEPALIVE = 15.0
+
+@app.get("/api/job/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events: снимок статуса задачи сразу и затем при каждом изменении
+    (стадии, проценты, предварительные хайлайты). Поток закрывается на ready/error.
+    """
+    if job_id not in job_queue.progress:
+        # Задача завершилась в прошлом запуске: один финальный снимок из журнала
+        status = job_queue.status(job_id)
+        if not status:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return StreamingResponse(iter([f"data: {json.dumps(status, ensure_ascii=False)}\n\n"]), media_type="text/event-stream")
+    queue = job_queue.bus.subscribe(job_id)
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    status = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(status, ensure_ascii=False)}\n\n"
+                if status.get("status") in TERMINAL_STATUSES:
+                    break
+        finally:
+            job_queue.bus.unsubscribe(job_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+async def load_segment_texts(job_id: str, seg_id: Optional[str] = None):
+    """[(seg_id, текст)] хайлайтов задачи (или одного сегмента) по индексу транскрипта."""
+    from .services import transcript_index
+    MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'work'))
+    highlights_json = os.path.join(MEDIA_WORK, job_id, "highlights.json")
+    if not os.path.exists(highlights_json):
+        raise HTTPException(status_code=404, detail="Highlights not found for this job")
+    with open(highlights_json, encoding='utf-8') as f:
+        segments = [s for s in json.load(f) if seg_id is None or s["id"] == seg_id]
+    if not segments:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    _, index = await asyncio.to_thread(transcript_index.load_job_transcript, job_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Transcript not found for this job")
+    return [(s["id"], index.text(s["start"], s["end"])) for s in segments]
+
+@app.post("/api/job/{job_id}/meta")
+async def generate_meta_all(job_id: str):
+    """Мета для всех хайлайтов задачи: запросы к Ollama идут параллельно в пределах OLLAMA_CONCURRENCY."""
+    texts = await load_segment_texts(job_id)
+    return {"meta": await title_hook_tags.generate_meta_bulk(job_id, texts)}
+
 @app.post("/api/job/{job_id}/meta/{seg_id}")
 async def generate_meta(job_id: str, seg_id: str):
-    # Заглушка: вызвать title_hook_tags.generate_meta
-    return {"titles": [], "hooks": [], "hashtags": []}
+    """Заголовки/хуки/хэштеги для сегмента по его тексту (запрос по времени к индексу транскрипта)."""
+    [(_, text)] = await load_segment_texts(job_id, seg_id)
+    return await title_hook_tags.generate_meta(job_id, seg_id, text)
+
+@app.get("/api/job/{job_id}/meta/{seg_id}/stream")
+async def stream_meta(job_id: str, seg_id: str):
+    """Server-Sent Events: токены ответа модели по мере генерации, последним событием — разобранная мета."""
+    [(_, text)] = await load_segment_texts(job_id, seg_id)
+
+    async def stream():
+        async for event in title_hook_tags.stream_meta(job_id, seg_id, text):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.post("/api/job/{job_id}/render")
-async def render_job(job_id: str, req: RenderRequest):
-    # Заглушка: вызвать render.render_segments
-    return {"result": "ok"}
+async def render_job(job_id: str, req: RenderRequest, background_tasks: BackgroundTasks):
+    """
+    Запускает рендер в фоне и сразу возвращает манифест: клипы, уже отрендеренные с теми же
+    параметрами, готовы мгновенно; статус остальных — в GET /api/job/{job_id}/result.
+    """
+    options = {"preset": req.preset, "crf": req.crf, "threads": req.threads, "bitrate": req.bitrate}
+    segments = [seg.dict() for seg in req.segments]
+    try:
+        plan = await asyncio.to_thread(render.plan_render, job_id, segments, req.resolution, req.format, options)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    manifest = await asyncio.to_thread(render.start_manifest, plan, uuid.uuid4().hex[:12])
+    if manifest["status"] != "ready":
+        background_tasks.add_task(render.execute_render, plan, manifest)
+    return manifest
 
 @app.get("/api/job/{job_id}/result")
-async def get_job_result(job_id: str):
-    # Заглушка: вернуть пути к рендерам
-    return {"outputs": []}
+async def get_job_result(job_id: str, render_id: Optional[str] = None):
+    """Манифест рендера (по умолчанию последнего): файлы, размеры, длительности, статусы."""
+    manifest = await asyncio.to_thread(render.load_manifest, job_id, render_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Render not found for this job")
+    return manifest
+
+@app.get("/api/job/{job_id}/clips/{name}")
+async def get_clip(job_id: str, name: str):
+    """
+    Готовый клип задачи; FileResponse отвечает на Range (206), так что браузер перематывает без полной загрузки.
+    Выходы общие для всех задач (кэш по ключу), поэтому отдаются только клипы из манифестов рендеров этой задачи.
+    """
+    path = os.path.join(render.MEDIA_OUTPUTS, name)
+    if not await asyncio.to_thread(render.job_owns_clip, job_id, name) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Clip not found")
+    return FileResponse(path, filename=f"{job_id}_{name}")
+
+@app.post("/api/models/warmup")
+async def warmup_models(pools: Optional[List[str]] = None):
+    """Загрузка моделей в процессах пулов стадий: время загрузки и память по каждой модели."""
+    return await executor.warmup(pools)
+
+@app.get("/api/models/status")
+async def get_models_status():
+    return await executor.models_status()
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return artifacts.stats()
 
 @app.get("/api/presets")
 async def get_presets():
@@ -131,13 +258,18 @@ async def get_job_highlights(job_id: str):
     """
     Возвращает highlights.json для job_id или запускает детекцию, если файл отсутствует.
     """
-    from .services import highlight, transcript
-    MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
+    from .services import highlight, transcript_index
+    MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'work'))
     job_dir = os.path.join(MEDIA_WORK, job_id)
     cache_json = os.path.join(job_dir, "highlights.json")
     if os.path.exists(cache_json):
         with open(cache_json, encoding='utf-8') as f:
             return json.load(f)
+    # Пока идёт потоковая транскрипция — предварительные хайлайты
+    partial_json = os.path.join(job_dir, "highlights.partial.json")
+    if os.path.exists(partial_json):
+        with open(partial_json, encoding='utf-8') as f:
+            return json.load(f)["highlights"]
     # Попробовать найти необходимые данные для запуска детекции
     video_path = None
     transcript_result = None
@@ -146,15 +278,12 @@ async def get_job_highlights(job_id: str):
         if fname.endswith(('.mp4', '.mkv', '.mov', '.avi')):
             video_path = os.path.join(job_dir, fname)
             break
-    # Поиск транскрипта
-    transcript_json = os.path.join(job_dir, "transcript.json")
-    if os.path.exists(transcript_json):
-        with open(transcript_json, encoding='utf-8') as f:
-            transcript_result = json.load(f)
+    # Поиск транскрипта (transcript_{sha1}.json)
+    transcript_result, _ = transcript_index.load_job_transcript(job_id)
     if not video_path or not transcript_result:
         raise HTTPException(status_code=404, detail="Video or transcript not found for this job")
     # Запуск детекции
-    highlights = await highlight.detect_highlights(video_path, transcript_result, {"job_id": job_id})
+    highlights = await executor.run_stage("highlights", highlight.detect_highlights, video_path, transcript_result, {"job_id": job_id})
     return highlights
 
 # --- Error handlers ---
@@ -0,0 +1,89 @@
+"""
+Model registry: lazy, one-instance-per-process loading of ASR/VAD/NLP/CV models with load time and memory stats.
+"""
+import importlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+_PACKAGE = __package__.rsplit(".", 1)[0]
+
+# Имя модели -> "модуль:фабрика" (модуль относительно пакета backend, импортируется при первой загрузке)
+MODEL_LOADERS = {
+    "whisper": "services.transcript:create_whisper_model",
+    "whisper_batched": "services.transcript:create_batched_pipeline",
+    "silero_vad": "services.transcript:create_vad",
+    "keybert": "services.highlight:create_keybert",
+    "face_detector": "services.reframing:create_face_detector",
+    "vader": "services.virality:create_sentiment_analyzer",
+}
+
+
+def _rss_bytes() -> Optional[int]:
+    """Текущий RSS процесса (psutil, если установлен; иначе /proc на Linux)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ModelRegistry:
+    """
+    Модели создаются при первом get() и живут до конца процесса. В каждом процессе пула стадий
+    свой экземпляр реестра, поэтому модель загружается ровно один раз на процесс.
+    """
+    def __init__(self, loaders: Dict[str, str] = None):
+        self.loaders = dict(loaders or MODEL_LOADERS)
+        self._models: Dict[str, object] = {}
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                module_name, func_name = self.loaders[name].split(":")
+                factory = getattr(importlib.import_module(f"{_PACKAGE}.{module_name}"), func_name)
+                rss_before = _rss_bytes()
+                t0 = time.perf_counter()
+                self._models[name] = factory()
+                rss_after = _rss_bytes()
+                self._stats[name] = {
+                    "load_time": round(time.perf_counter() - t0, 3),
+                    "memory_mb": round((rss_after - rss_before) / 2**20, 1) if rss_before is not None and rss_after is not None else None,
+                    "loaded_at": time.time(),
+                }
+            return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict:
+        errors = {}
+        for name in names or self.loaders:
+            try:
+                self.get(name)
+            except Exception as e:
+                errors[name] = str(e)
+        status = self.status()
+        for name, error in errors.items():
+            status[name]["error"] = error
+        return status
+
+    def status(self) -> Dict:
+        return {
+            name: {"loaded": name in self._models, **self._stats.get(name, {})}
+            for name in self.loaders
+        }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,127 @@
+"""
+In-process job progress bus: push updates to SSE subscribers, debounced batched status.json persistence, throttled progress reports.
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Set
+
+WORK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'work'))
+
+# Как часто сбрасывать изменённые статусы на диск (сек)
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 1.0))
+# Минимальный интервал между отчётами о процентах одной стадии (сек)
+PROGRESS_MIN_INTERVAL = float(os.environ.get("PROGRESS_MIN_INTERVAL", 0.5))
+TERMINAL_STATUSES = ("ready", "error")
+
+
+def write_status(job_id: str, status: Dict, work_dir: str = WORK_DIR):
+    job_dir = os.path.join(work_dir, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    status_path = os.path.join(job_dir, "status.json")
+    tmp_path = status_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, status_path)
+
+
+class ProgressBus:
+    """
+    Статусы задач живут в памяти (`statuses`), изменения рассылаются подписчикам сразу,
+    а на диск пишутся пачкой не чаще раза в PROGRESS_FLUSH_INTERVAL; финальные статусы — сразу.
+    Методы, кроме report(), вызываются из event loop; report() безопасен из потоков стадий.
+    """
+    def __init__(self, work_dir: str = WORK_DIR, flush_interval: float = PROGRESS_FLUSH_INTERVAL,
+                 min_interval: float = PROGRESS_MIN_INTERVAL):
+        self.work_dir = work_dir
+        self.flush_interval = flush_interval
+        self.min_interval = min_interval
+        self.statuses: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._last_report: Dict[tuple, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        status = self.statuses.get(job_id)
+        if status is not None:
+            queue.put_nowait(copy.deepcopy(status))
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def publish(self, job_id: str):
+        """Статус задачи изменился: разослать снимок и запланировать запись на диск."""
+        self._loop = asyncio.get_running_loop()
+        status = self.statuses.get(job_id)
+        if status is None:
+            return
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(copy.deepcopy(status))
+        self._dirty.add(job_id)
+        if status.get("status") in TERMINAL_STATUSES:
+            self._schedule_flush(0)
+        elif self._flush_handle is None:
+            self._schedule_flush(self.flush_interval)
+
+    def report(self, job_id: str, step: str, progress: int):
+        """
+        Процент выполнения стадии (из любого потока). Отчёты чаще min_interval отбрасываются,
+        кроме 0 и 100; обновление применяется в event loop.
+        """
+        key = (job_id, step)
+        now = time.monotonic()
+        if progress not in (0, 100) and now - self._last_report.get(key, 0.0) < self.min_interval:
+            return
+        self._last_report[key] = now
+        if progress == 100:
+            self._last_report.pop(key, None)
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._apply_progress, job_id, step, progress)
+
+    def _apply_progress(self, job_id: str, step: str, progress: int):
+        status = self.statuses.get(job_id)
+        if status is None:
+            return
+        for entry in reversed(status.get("steps", [])):
+            if entry.get("step") == step:
+                if entry.get("progress") == progress:
+                    return
+                entry["progress"] = progress
+                self.publish(job_id)
+                return
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = self._loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Пишет все изменённые статусы одним заходом в пул потоков."""
+        if not self._dirty:
+            return
+        batch = {job_id: copy.deepcopy(self.statuses[job_id]) for job_id in self._dirty if job_id in self.statuses}
+        self._dirty.clear()
+
+        def write_all():
+            for job_id, status in batch.items():
+                write_status(job_id, status, self.work_dir)
+        await asyncio.to_thread(write_all)
+
+
+progress_bus = ProgressBus()
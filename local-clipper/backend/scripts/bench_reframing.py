@@ -0,0 +1,68 @@
+"""
+Benchmark: reframing face sampling, per-sample seeks (old) vs one sequential downscaled pass (new).
+
+Usage (from local-clipper/):
+    python -m backend.scripts.bench_reframing source.mp4 [--clips 15] [--clip-len 30]
+
+A 1-hour 1080p test source can be generated with:
+    ffmpeg -f lavfi -i testsrc2=size=1920x1080:rate=30 -t 3600 -c:v libx264 -g 250 source_1h.mp4
+"""
+import argparse
+import time
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from backend.services import reframing
+
+
+def make_highlights(duration, clips, clip_len):
+    starts = np.linspace(0, max(0.0, duration - clip_len), clips)
+    return [{"id": f"seg_{i+1}", "start": float(s), "end": float(s + clip_len)} for i, s in enumerate(starts)]
+
+
+def bench_seek(video_path, highlights):
+    """Старый путь: seek на каждый сэмпл и новый FaceDetection на каждый сегмент."""
+    cap = cv2.VideoCapture(video_path)
+    n = 0
+    for seg in highlights:
+        with mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5) as face_det:
+            for t in np.arange(seg["start"], seg["end"], reframing.SAMPLE_STEP):
+                cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+                ret, frame = cap.read()
+                if not ret:
+                    continue
+                face_det.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                n += 1
+    cap.release()
+    return n
+
+
+def bench_sequential(video_path, highlights):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    times = reframing.sample_times(highlights)
+    indices = sorted(set(int(i) for t in times.values() for i in np.round(t * fps)))
+    return len(reframing.detect_sampled(video_path, indices))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--clips", type=int, default=15)
+    parser.add_argument("--clip-len", type=float, default=30.0)
+    args = parser.parse_args()
+    cap = cv2.VideoCapture(args.video)
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 25.0)
+    cap.release()
+    highlights = make_highlights(duration, args.clips, args.clip_len)
+    for name, fn in (("seek-per-sample", bench_seek), ("sequential", bench_sequential)):
+        t0 = time.perf_counter()
+        n = fn(args.video, highlights)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:16s} frames={n:5d} time={elapsed:7.2f}s fps={n / elapsed:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
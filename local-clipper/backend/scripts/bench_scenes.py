@@ -0,0 +1,63 @@
+"""
+Benchmark: scene detection, PySceneDetect ContentDetector at full frame rate (old) vs low-res ffmpeg-pipe detector (new).
+
+Usage (from local-clipper/):
+    python -m backend.scripts.bench_scenes source.mp4 [--tolerance 0.5]
+
+Accuracy: cuts of the old detector are the reference; a new cut matches if it lies within --tolerance seconds.
+"""
+import argparse
+import time
+import numpy as np
+
+from backend.services import scenes
+
+
+def detect_reference(video_path):
+    """Старый путь: ContentDetector по каждому кадру."""
+    from scenedetect import open_video, SceneManager
+    from scenedetect.detectors import ContentDetector
+    video = open_video(video_path)
+    scene_manager = SceneManager()
+    scene_manager.add_detector(ContentDetector())
+    scene_manager.detect_scenes(video)
+    return [start.get_seconds() for start, _ in scene_manager.get_scene_list()[1:]]
+
+
+def detect_new(video_path):
+    scores, _ = scenes.decode_scores(video_path, scenes.SCENE_FPS)
+    return scenes.scene_cuts(scores)
+
+
+def match(reference, found, tolerance):
+    """(precision, recall) с жадным сопоставлением склеек в пределах tolerance."""
+    if not reference or not found:
+        return (1.0 if not found else 0.0), (1.0 if not reference else 0.0)
+    ref = np.asarray(reference)
+    used = np.zeros(len(ref), dtype=bool)
+    hits = 0
+    for t in found:
+        dist = np.where(used, np.inf, np.abs(ref - t))
+        i = int(np.argmin(dist))
+        if dist[i] <= tolerance:
+            used[i] = True
+            hits += 1
+    return hits / len(found), hits / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+    results = {}
+    for name, fn in (("contentdetector", detect_reference), ("ffmpeg-pipe", detect_new)):
+        t0 = time.perf_counter()
+        results[name] = fn(args.video)
+        print(f"{name:16s} cuts={len(results[name]):5d} time={time.perf_counter() - t0:7.2f}s")
+    precision, recall = match(results["contentdetector"], results["ffmpeg-pipe"], args.tolerance)
+    print(f"precision={precision:.3f} recall={recall:.3f} (tolerance {args.tolerance}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark: ASR real-time factor, per-window transcription vs batched windows (CPU int8, `small` by default).
+
+Usage (from local-clipper/):
+    python -m backend.scripts.bench_transcript audio_16k.wav [--model small] [--batch-size 8]
+
+RTF = processing time / audio duration (меньше — быстрее; 0.1 = в 10 раз быстрее реального времени).
+"""
+import argparse
+import os
+import time
+
+# Модель/устройство задаются до импорта сервиса (он читает env при импорте)
+parser = argparse.ArgumentParser()
+parser.add_argument("audio")
+parser.add_argument("--model", default="small")
+parser.add_argument("--batch-size", type=int, default=8)
+args = parser.parse_args()
+os.environ.update({"MODEL_SIZE": args.model, "DEVICE": "cpu", "WHISPER_COMPUTE": "int8"})
+
+from backend.services import transcript  # noqa: E402
+
+
+def main():
+    audio = transcript.read_audio(args.audio, sampling_rate=transcript.VAD_SAMPLE_RATE)
+    sr = transcript.VAD_SAMPLE_RATE
+    duration = len(audio) / sr
+    speech = transcript.vad_split(audio, sr)
+    windows = transcript.merge_windows(speech, sr)
+    audio_np = audio.numpy() if hasattr(audio, "numpy") else audio
+    transcript.load_model()
+    print(f"audio={duration:.1f}s vad_regions={len(speech)} windows={len(windows)} model={args.model} cpu/int8")
+    for name, batch_size in (("per-window", 1), (f"batched x{args.batch_size}", args.batch_size)):
+        t0 = time.perf_counter()
+        segments, language = transcript.run_asr(audio_np, windows, sr, batch_size=batch_size)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:14s} segments={len(segments):5d} lang={language} time={elapsed:7.1f}s RTF={elapsed / duration:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: virality scoring, per-candidate virality_score calls (old) vs one virality_batch pass (new);
+also times sentence-snapped sliding windows + interval NMS over the whole transcript.
+
+Usage (from local-clipper/):
+    python -m backend.scripts.bench_virality [--candidates 2000] [--minutes 60]
+
+Uses a synthetic transcript; the old path needs nltk (punkt) and vaderSentiment installed.
+"""
+import argparse
+import time
+import numpy as np
+
+from backend.services import candidates, virality
+from backend.services.transcript_index import TranscriptIndex
+
+VOCAB = "this is really amazing what happened next nobody expected it why did he do that wow great terrible".split()
+
+
+def synthetic_transcript(minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    t, segments = 0.0, []
+    while t < minutes * 60:
+        words = []
+        for _ in range(int(rng.integers(4, 14))):
+            d = float(rng.uniform(0.15, 0.5))
+            words.append({"word": " " + VOCAB[rng.integers(len(VOCAB))], "start": t, "end": t + d, "confidence": 0.9})
+            t += d + 0.05
+        words[-1]["word"] += "?!."[rng.integers(3)]
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": "", "words": words})
+        t += float(rng.uniform(0.1, 0.8))
+    return {"segments": segments, "language": "en"}
+
+
+def legacy_score(segment, audio_var, scene_count):
+    """Старый virality_score: новый анализатор VADER и nltk-токенизация на каждый вызов."""
+    import nltk
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    text = " ".join([w["word"] for w in segment["words"]])
+    words = nltk.word_tokenize(text)
+    keyword_density = len(set(words)) / (len(words) + 1e-6)
+    duration = segment["end"] - segment["start"]
+    question, exclaim = int("?" in text), int("!" in text)
+    sentiment = SentimentIntensityAnalyzer().polarity_scores(text)["compound"]
+    readability = min(1.0, len(words) / (duration * 2 + 1e-6))
+    score = 20 * keyword_density + 20 * audio_var + 20 * (scene_count / 3) + 20 * readability + 10 * (question + exclaim) + 10 * sentiment
+    return max(0, min(100, int(score)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=2000)
+    parser.add_argument("--minutes", type=float, default=60.0)
+    args = parser.parse_args()
+    transcript = synthetic_transcript(args.minutes)
+    index = TranscriptIndex.from_transcript(transcript)
+    starts, ends = candidates.sentence_bounds(transcript["segments"])
+    t0 = time.perf_counter()
+    first, last = candidates.sliding_windows(starts, ends)
+    keep = candidates.nms_intervals(starts[first], ends[last], np.random.default_rng(0).random(len(first)), max_keep=50)
+    print(f"{'windows+nms':16s} time={(time.perf_counter() - t0) * 1000:9.1f} ms windows={len(first)} kept={len(keep)}")
+    pick = np.random.default_rng(1).choice(len(first), min(args.candidates, len(first)), replace=False)
+    win_starts, win_ends = starts[first[pick]], ends[last[pick]]
+    audio_var = np.random.default_rng(2).random(len(pick))
+    scenes = np.zeros(len(pick))
+    print(f"candidates={len(pick)} words={len(index)}")
+
+    t0 = time.perf_counter()
+    _, batch_scores = virality.virality_batch(win_starts, win_ends, index, audio_var, scenes)
+    print(f"{'batch':16s} time={(time.perf_counter() - t0) * 1000:9.1f} ms")
+
+    t0 = time.perf_counter()
+    for s, e, v in zip(win_starts, win_ends, audio_var):
+        # Старый путь: слова окна перебором всего транскрипта, токенизация и анализатор на каждый вызов
+        words = [w for seg in transcript["segments"] for w in seg["words"] if w["start"] >= s and w["end"] <= e]
+        legacy_score({"start": s, "end": e, "words": words}, v, 0)
+    print(f"{'per-candidate':16s} time={(time.perf_counter() - t0) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Shared audio feature store: frame-level RMS/flux/ZCR computed once per source SHA1, cached as memory-mapped .npy, O(1) window means via prefix sums.
+"""
+import os
+import numpy as np
+from typing import Optional
+from ..utils import cached_sha1
+
+MEDIA_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'cache', 'features'))
+os.makedirs(MEDIA_CACHE, exist_ok=True)
+
+# Аудио после extract_audio: 16 kHz моно. Шаг кадра 800 сэмплов = 50 мс (20 кадров/с)
+FEATURE_SR = 16000
+FEATURE_HOP = 800
+FEATURE_FRAME = 1600
+FEATURE_NAMES = ("rms", "flux", "zcr")
+
+
+class AudioFeatures:
+    """
+    Кадровые признаки (n_frames x len(FEATURE_NAMES)) с префиксными суммами:
+    среднее/дисперсия по любому окну [start, end) считается за O(1).
+    """
+    def __init__(self, frames: np.ndarray, sr: int = FEATURE_SR, hop: int = FEATURE_HOP):
+        self.frames = frames
+        self.sr = sr
+        self.hop = hop
+        zero = np.zeros((1, frames.shape[1]))
+        self.prefix = np.vstack([zero, np.cumsum(frames, axis=0, dtype=np.float64)])
+        self.prefix_sq = np.vstack([zero, np.cumsum(np.square(frames, dtype=np.float64), axis=0)])
+
+    @property
+    def duration(self) -> float:
+        return len(self.frames) * self.hop / self.sr
+
+    def time_to_frame(self, t):
+        idx = np.round(np.asarray(t, dtype=np.float64) * self.sr / self.hop).astype(np.int64)
+        return np.clip(idx, 0, len(self.frames))
+
+    def _window_sums(self, prefix, starts, ends):
+        i0 = self.time_to_frame(starts)
+        i1 = np.maximum(self.time_to_frame(ends), i0)
+        n = np.maximum(i1 - i0, 1)[:, None]
+        return (prefix[i1] - prefix[i0]), n
+
+    def window_mean(self, starts, ends) -> np.ndarray:
+        """Средние признаков по окнам (секунды), массив (n_windows x n_features)."""
+        sums, n = self._window_sums(self.prefix, np.atleast_1d(starts), np.atleast_1d(ends))
+        return sums / n
+
+    def window_var(self, starts, ends) -> np.ndarray:
+        starts, ends = np.atleast_1d(starts), np.atleast_1d(ends)
+        sums, n = self._window_sums(self.prefix, starts, ends)
+        sq, _ = self._window_sums(self.prefix_sq, starts, ends)
+        return np.maximum(sq / n - np.square(sums / n), 0.0)
+
+
+def feature_path(audio_sha1: str) -> str:
+    return os.path.join(MEDIA_CACHE, f"{audio_sha1}_sr{FEATURE_SR}_h{FEATURE_HOP}.npy")
+
+
+def compute_features(y: np.ndarray, sr: int = FEATURE_SR) -> np.ndarray:
+    # librosa импортируется только при реальном расчёте (кэш-попадание его не требует)
+    import librosa
+    rms = librosa.feature.rms(y=y, frame_length=FEATURE_FRAME, hop_length=FEATURE_HOP)[0]
+    flux = librosa.onset.onset_strength(y=y, sr=sr, hop_length=FEATURE_HOP)
+    zcr = librosa.feature.zero_crossing_rate(y, frame_length=FEATURE_FRAME, hop_length=FEATURE_HOP)[0]
+    n = min(len(rms), len(flux), len(zcr))
+    return np.stack([rms[:n], flux[:n], zcr[:n]], axis=1).astype(np.float32)
+
+
+def load_features(audio_path: str, audio_sha1: Optional[str] = None) -> AudioFeatures:
+    """
+    Возвращает признаки для аудио из кэша по SHA1 (memory-mapped), при промахе
+    один раз декодирует WAV и сохраняет .npy.
+    """
+    audio_sha1 = audio_sha1 or cached_sha1(audio_path)
+    path = feature_path(audio_sha1)
+    if not os.path.exists(path):
+        import soundfile as sf
+        y, sr = sf.read(audio_path, dtype='float32', always_2d=False)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+        if sr != FEATURE_SR:
+            import librosa
+            y = librosa.resample(y, orig_sr=sr, target_sr=FEATURE_SR)
+        frames = compute_features(y, FEATURE_SR)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, frames)
+        os.replace(tmp_path, path)
+    return AudioFeatures(np.load(path, mmap_mode='r'))
@@ -0,0 +1,101 @@
+"""
+Highlight candidate engine: dense sentence-snapped sliding windows, array scoring over precomputed features, sorted-interval NMS.
+"""
+import bisect
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Границы длины клипа по умолчанию (сек)
+CLIP_MIN_LEN = 20.0
+CLIP_MAX_LEN = 60.0
+# Без транскрипта окна строятся по сетке с этим шагом (сек)
+GRID_STEP = 5.0
+# Бонус окну, начинающемуся на склейке сцены (в пределах SCENE_SNAP сек), к скору в [0, 1]
+SCENE_BONUS = 0.05
+SCENE_SNAP = 1.0
+# Доли вовлечённости (аудио + ключевые фразы) и вирусности в итоговом скоре
+ENGAGEMENT_WEIGHT = 0.5
+VIRALITY_WEIGHT = 0.5
+
+
+def clip_bounds(clip_len: Optional[float]) -> Tuple[float, float]:
+    """Допустимая длина окна: вокруг желаемой длины клипа или 20-60 с по умолчанию."""
+    if not clip_len:
+        return CLIP_MIN_LEN, CLIP_MAX_LEN
+    return max(5.0, clip_len * 0.75), clip_len * 1.25
+
+
+def sentence_bounds(segments: Sequence[Dict], duration: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Начала и концы фраз транскрипта; без речи — равномерная сетка по длительности."""
+    if segments:
+        starts = np.fromiter((s["start"] for s in segments), dtype=np.float64, count=len(segments))
+        ends = np.fromiter((s["end"] for s in segments), dtype=np.float64, count=len(segments))
+        return starts, np.maximum.accumulate(ends)
+    starts = np.arange(0.0, max(duration - GRID_STEP, 0.0) + 1e-9, GRID_STEP)
+    return starts, np.minimum(starts + GRID_STEP, duration)
+
+
+def sliding_windows(starts: np.ndarray, ends: np.ndarray, min_len: float = CLIP_MIN_LEN,
+                    max_len: float = CLIP_MAX_LEN) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Все окна [starts[i], ends[j]] с длиной в [min_len, max_len]: начало и конец окна — границы фраз.
+    Возвращает индексы (i, j) фраз; ends должен быть неубывающим.
+    """
+    lo = np.searchsorted(ends, starts + min_len, side="left")
+    hi = np.searchsorted(ends, starts + max_len, side="right")
+    hi = np.maximum(hi, lo)
+    counts = hi - lo
+    first = np.repeat(np.arange(len(starts)), counts)
+    # j = lo[i] + 0..counts[i]-1 без цикла: сдвиг от начала группы
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return first, np.repeat(lo, counts) + offsets
+
+
+def minmax(columns: np.ndarray) -> np.ndarray:
+    """Нормировка столбцов в [0, 1] по всем кандидатам задачи (постоянный столбец -> 0)."""
+    lo = columns.min(axis=0) if len(columns) else 0.0
+    span = columns.max(axis=0) - lo if len(columns) else 1.0
+    return (columns - lo) / np.where(span > 0, span, 1.0)
+
+
+def scene_counts(win_starts: np.ndarray, win_ends: np.ndarray, cuts: Sequence[float]) -> np.ndarray:
+    """Число склеек сцен строго внутри каждого окна."""
+    cuts = np.asarray(cuts, dtype=np.float64)
+    return np.searchsorted(cuts, win_ends, side="left") - np.searchsorted(cuts, win_starts, side="right")
+
+
+def scene_start_bonus(win_starts: np.ndarray, cuts: Sequence[float]) -> np.ndarray:
+    """SCENE_BONUS окнам, начало которых ближе SCENE_SNAP к склейке сцены."""
+    if not len(cuts):
+        return np.zeros(len(win_starts))
+    cuts = np.asarray(cuts, dtype=np.float64)
+    idx = np.searchsorted(cuts, win_starts)
+    left = cuts[np.clip(idx - 1, 0, len(cuts) - 1)]
+    right = cuts[np.clip(idx, 0, len(cuts) - 1)]
+    nearest = np.minimum(np.abs(left - win_starts), np.abs(right - win_starts))
+    return np.where(nearest <= SCENE_SNAP, SCENE_BONUS, 0.0)
+
+
+def nms_intervals(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, max_keep: int,
+                  max_overlap: float = 2.0) -> List[int]:
+    """
+    Жадный NMS по убыванию скора. Выбранные интервалы хранятся отсортированными по началу;
+    т.к. каждый длиннее max_overlap, их концы тоже упорядочены, и перекрытие достаточно
+    проверить с двумя соседями по bisect: O(n log k) вместо O(n·k).
+    """
+    sel_starts: List[float] = []
+    sel_ends: List[float] = []
+    keep: List[int] = []
+    for i in np.argsort(-np.asarray(scores), kind="stable"):
+        s, e = float(starts[i]), float(ends[i])
+        pos = bisect.bisect_left(sel_starts, s)
+        if pos > 0 and min(e, sel_ends[pos - 1]) - max(s, sel_starts[pos - 1]) > max_overlap:
+            continue
+        if pos < len(sel_starts) and min(e, sel_ends[pos]) - max(s, sel_starts[pos]) > max_overlap:
+            continue
+        sel_starts.insert(pos, s)
+        sel_ends.insert(pos, e)
+        keep.append(int(i))
+        if len(keep) >= max_keep:
+            break
+    return keep
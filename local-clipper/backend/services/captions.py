@@ -3,11 +3,17 @@ Generate SRT/ASS captions for segments, style presets, emoji injection, safe-are
 """
 import os
 import json
+import unicodedata
+from functools import lru_cache
 from typing import List, Dict
-import cv2
+from ..cache import artifacts
+from .transcript_index import load_index, transcript_fingerprint
+from . import styling
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 os.makedirs(MEDIA_WORK, exist_ok=True)
+# Версия формата субтитров в общем кэше артефактов
+CAPTIONS_VERSION = "3"
 
 # Emoji-словарь (пример)
 EMOJI_DICT = {
@@ -15,31 +21,165 @@ EMOJI_DICT = {
     "happy": "😃", "sad": "😢", "fire": "🔥", "star": "⭐"
 }
 
-async def generate_captions(transcript_result, highlights, job_data):
+# Пауза между словами, после которой начинается новая строка субтитров (сек)
+PAUSE_BREAK = 0.6
+# Сколько строка остаётся на экране после последнего слова, если следующая не началась (сек)
+LINE_HOLD = 0.4
+
+def generate_captions(transcript_result, highlights, job_data):
     job_id = job_data["job_id"]
     job_dir = os.path.join(MEDIA_WORK, job_id)
     os.makedirs(job_dir, exist_ok=True)
-    style = job_data.get("style_preset", "clean")
+    style = job_data.get("style_preset") or "clean"
     emojis = job_data.get("emojis", True)
+    index = load_index(transcript_result, job_id)
+    preset = styling.get_style_preset(style)
+    header = styling.generate_ass_header(style)
     for seg in highlights:
         seg_id = seg["id"]
         start, end = seg["start"], seg["end"]
-        # Фильтруем слова по времени
-        words = []
-        for s in transcript_result["segments"]:
-            for w in s["words"]:
-                if w["start"] >= start and w["end"] <= end:
-                    words.append(w)
-        # Генерируем текст с эмодзи
-        text = " ".join([inject_emoji(w["word"], emojis) for w in words])
-        # SRT
         srt_path = os.path.join(job_dir, f"{seg_id}.srt")
-        with open(srt_path, "w", encoding="utf-8") as f:
-            f.write(f"1\n{format_time(start)} --> {format_time(end)}\n{text}\n\n")
-        # ASS (стилизация)
         ass_path = os.path.join(job_dir, f"{seg_id}.ass")
+        # Общий кэш: тот же транскрипт, границы и стиль дают те же файлы
+        params = {"start": start, "end": end, "style": style, "preset": preset, "emojis": emojis,
+                  "lang": transcript_result.get("language"), "transcript": transcript_fingerprint(transcript_result)}
+        cache_key = artifacts.key(transcript_result.get("audio_sha1") or job_id, "captions", params, CAPTIONS_VERSION)
+        if artifacts.fetch_files(cache_key, "captions", {"caption.srt": srt_path, "caption.ass": ass_path}):
+            continue
+        # Слова сегмента — диапазонный запрос к индексу транскрипта
+        words = index.words_in(start, end)
+        for w in words:
+            w["word"] = inject_emoji(w["word"], emojis)
+        lines = layout_lines(words, start, end, preset)
+        with open(srt_path, "w", encoding="utf-8") as f:
+            f.write(generate_srt(lines))
         with open(ass_path, "w", encoding="utf-8") as f:
-            f.write(generate_ass(text, start, end, style))
+            f.write(header + generate_ass_events(lines))
+        artifacts.put_dir(cache_key, "captions", {"caption.srt": srt_path, "caption.ass": ass_path}, params)
+
+class GlyphMetrics:
+    """
+    Ширина текста в пикселях PlayRes для шрифта и кегля. Ширина каждого символа измеряется один раз
+    (Pillow, если установлен и шрифт найден; иначе оценка по классу символа) и кэшируется.
+    """
+    def __init__(self, font: str, size: int, bold: bool = False):
+        self.size = size
+        self.bold = bold
+        self.widths = {}
+        self._font = None
+        try:
+            from PIL import ImageFont
+            self._font = ImageFont.truetype(f"{font}.ttf", size)
+        except (ImportError, OSError):
+            pass
+
+    def char_width(self, ch: str) -> float:
+        width = self.widths.get(ch)
+        if width is None:
+            if self._font is not None:
+                width = float(self._font.getlength(ch))
+            elif unicodedata.east_asian_width(ch) in ("W", "F") or ord(ch) > 0x1F000:
+                width = self.size * 1.0
+            elif ch.isspace():
+                width = self.size * 0.28
+            elif ch.isupper() or ch.isdigit():
+                width = self.size * 0.66
+            else:
+                width = self.size * 0.55
+            if self.bold and self._font is None:
+                width *= 1.05
+            self.widths[ch] = width
+        return width
+
+    def text_width(self, text: str) -> float:
+        return sum(self.char_width(ch) for ch in text)
+
+@lru_cache(maxsize=32)
+def get_metrics(font: str, size: int, bold: bool = False) -> GlyphMetrics:
+    return GlyphMetrics(font, size, bold)
+
+def wrap_words(words, metrics, max_width):
+    """Жадный перенос слов по ширине: список строк (списков слов)."""
+    rows, row, row_width = [], [], 0.0
+    space = metrics.char_width(" ")
+    for w in words:
+        width = metrics.text_width(w["word"])
+        if row and row_width + space + width > max_width:
+            rows.append(row)
+            row, row_width = [], 0.0
+        row_width += (space if row else 0.0) + width
+        row.append(w)
+    if row:
+        rows.append(row)
+    return rows
+
+def layout_lines(words, clip_start, clip_end, preset):
+    """
+    Разбивает слова клипа на экранные строки: не больше max_words слов и max_lines рядов по ширине
+    кадра, разрыв на паузах и концах предложений. Времена переводятся в отсчёт от начала клипа.
+    Возвращает [{"start", "end", "rows": [[word, ...], ...]}], у слов — относительные start/end.
+    """
+    metrics = get_metrics(preset["font"], preset["size"], preset["bold"])
+    max_width = styling.PLAY_RES[0] - styling.SAFE_MARGINS["left"] - styling.SAFE_MARGINS["right"]
+    duration = clip_end - clip_start
+    rel = [
+        {**w, "start": min(max(w["start"] - clip_start, 0.0), duration), "end": min(max(w["end"] - clip_start, 0.0), duration)}
+        for w in words if w["word"]
+    ]
+    chunks, chunk = [], []
+    for i, w in enumerate(rel):
+        candidate = chunk + [w]
+        too_long = len(candidate) > preset["max_words"] or len(wrap_words(candidate, metrics, max_width)) > preset["max_lines"]
+        pause = chunk and w["start"] - chunk[-1]["end"] > PAUSE_BREAK
+        if chunk and (too_long or pause):
+            chunks.append(chunk)
+            candidate = [w]
+        chunk = candidate
+        if w["word"][-1:] in ".!?…" and i + 1 < len(rel):
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    lines = []
+    for i, chunk in enumerate(chunks):
+        next_start = chunks[i + 1][0]["start"] if i + 1 < len(chunks) else duration
+        lines.append({
+            "start": chunk[0]["start"],
+            "end": max(chunk[-1]["end"], min(chunk[-1]["end"] + LINE_HOLD, next_start)),
+            "rows": wrap_words(chunk, metrics, max_width),
+        })
+    return lines
+
+def karaoke_text(line):
+    """Текст строки с тегами {\\kNN} на каждое слово; длительности в сотых от начала строки без накопления ошибки."""
+    parts = []
+    line_cs = round(line["start"] * 100)
+    words = [w for row in line["rows"] for w in row]
+    row_ends = {id(row[-1]) for row in line["rows"][:-1]}
+    for i, w in enumerate(words):
+        # Слово подсвечивается до начала следующего (паузы внутри строки достаются предыдущему слову)
+        until = words[i + 1]["start"] if i + 1 < len(words) else w["end"]
+        start_cs = round(w["start"] * 100) if i else line_cs
+        k = max(0, round(until * 100) - start_cs)
+        sep = "\\N" if id(w) in row_ends else " "
+        parts.append(f"{{\\k{k}}}{ass_escape(w['word'])}" + (sep if i + 1 < len(words) else ""))
+    return "".join(parts)
+
+def ass_escape(text):
+    return text.replace("{", "\\{").replace("}", "\\}")
+
+def generate_ass_events(lines):
+    return "".join(
+        f"Dialogue: 0,{ass_time(line['start'])},{ass_time(line['end'])},Default,,0,0,0,,{karaoke_text(line)}\n"
+        for line in lines
+    )
+
+def generate_srt(lines):
+    cues = []
+    for i, line in enumerate(lines, 1):
+        text = "\n".join(" ".join(w["word"] for w in row) for row in line["rows"])
+        cues.append(f"{i}\n{format_time(line['start'])} --> {format_time(line['end'])}\n{text}\n")
+    return "\n".join(cues) + ("\n" if cues else "")
 
 def inject_emoji(word, enable):
     if not enable:
@@ -47,34 +187,16 @@ def inject_emoji(word, enable):
     return EMOJI_DICT.get(word.lower(), word)
 
 def format_time(seconds):
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int((seconds - int(seconds)) * 1000)
+    total_ms = int(round(seconds * 1000))
+    h, rest = divmod(total_ms, 3600000)
+    m, rest = divmod(rest, 60000)
+    s, ms = divmod(rest, 1000)
     return f"{h:02}:{m:02}:{s:02},{ms:03}"
 
-def generate_ass(text, start, end, style):
-    # Минимальный ASS с одним сабом и стилем
-    return f"""[Script Info]\nTitle: Caption\nScriptType: v4.00+\n\n[V4+ Styles]\nFormat: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\nStyle: Default,Arial,48,&H00FFFFFF,&H00000000,&H00000000,0,0,1,3,1,2,10,10,10,1\n\n[Events]\nFormat: Layer, Start, End, Style, Text\nDialogue: 0,{ass_time(start)},{ass_time(end)},Default,{text}\n"""
-
 def ass_time(seconds):
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    cs = int((seconds - int(seconds)) * 100)
+    # Целые сотые с округлением — те же, что в длительностях \k
+    total_cs = int(round(seconds * 100))
+    h, rest = divmod(total_cs, 360000)
+    m, rest = divmod(rest, 6000)
+    s, cs = divmod(rest, 100)
     return f"{h:01}:{m:02}:{s:02}.{cs:02}"
-
-async def generate_previews(video_path, highlights, job_data):
-    job_id = job_data["job_id"]
-    job_dir = os.path.join(MEDIA_WORK, job_id)
-    os.makedirs(job_dir, exist_ok=True)
-    cap = cv2.VideoCapture(video_path)
-    for seg in highlights:
-        seg_id = seg["id"]
-        mid = (seg["start"] + seg["end"]) / 2
-        cap.set(cv2.CAP_PROP_POS_MSEC, mid * 1000)
-        ret, frame = cap.read()
-        if ret:
-            jpg_path = os.path.join(job_dir, f"{seg_id}_preview.jpg")
-            cv2.imwrite(jpg_path, frame)
-    cap.release()
@@ -1,33 +1,168 @@
 import os
-import hashlib
 import json
-from pytubefix import YouTube
+import hashlib
+import threading
+from ..utils import run_ffmpeg
 
 MEDIA_SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source'))
 os.makedirs(MEDIA_SOURCE, exist_ok=True)
 
 
 def update_progress(job_id, progress):
-    """Обновление прогресса скачивания в status.json"""
-    from ..workers import WORK_DIR
-    job_dir = os.path.join(WORK_DIR, job_id)
-    status_path = os.path.join(job_dir, "status.json")
-    if os.path.exists(status_path):
-        try:
-            with open(status_path, encoding="utf-8") as f:
-                status = json.load(f)
-            for step in status.get("steps", []):
-                if step.get("step") == "download":
-                    step["progress"] = progress
-            with open(status_path, "w", encoding="utf-8") as f:
-                json.dump(status, f, ensure_ascii=False, indent=2)
-        except Exception:
+    """Прогресс скачивания в шину прогресса (частые отчёты отбрасываются шиной)"""
+    from ..progress import progress_bus
+    progress_bus.report(job_id, "download", progress)
+
+
+# Ranged-скачивание: размер куска, число параллельных запросов на все потоки, предел качества
+DOWNLOAD_CHUNK = int(os.environ.get("DOWNLOAD_CHUNK_MB", 8)) * 1024 * 1024
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", 6))
+DOWNLOAD_MAX_HEIGHT = int(os.environ.get("DOWNLOAD_MAX_HEIGHT", 1080))
+DOWNLOAD_RETRIES = 3
+
+
+class RangedDownload:
+    """
+    Файл, скачиваемый кусками по HTTP Range в заранее выделенный `{path}.part`.
+    Готовые куски записываются в `{path}.part.json`, поэтому прерванное скачивание продолжается
+    с недостающих кусков. После последнего куска `.part` переименовывается в `path`.
+    """
+    def __init__(self, url, path, size, chunk_size=DOWNLOAD_CHUNK):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.part_path = path + ".part"
+        self.state_path = path + ".part.json"
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(self.part_path) and os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("size") == size and state.get("chunk_size") == chunk_size:
+                self.done = set(state["done"])
+        with open(self.part_path, "ab") as f:
+            f.truncate(size)
+
+    @property
+    def n_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def pending(self):
+        return [i for i in range(self.n_chunks) if i not in self.done]
+
+    def done_bytes(self):
+        return sum(self.chunk_len(i) for i in self.done)
+
+    def chunk_len(self, i):
+        return min(self.chunk_size, self.size - i * self.chunk_size)
+
+    def fetch_chunk(self, session, i, on_bytes=None):
+        start = i * self.chunk_size
+        end = start + self.chunk_len(i) - 1
+        for attempt in range(DOWNLOAD_RETRIES):
+            try:
+                written = 0
+                with session.get(self.url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=30) as resp:
+                    if resp.status_code != 206 and not (resp.status_code == 200 and start == 0 and end == self.size - 1):
+                        raise RuntimeError(f"HTTP {resp.status_code} на Range {start}-{end}")
+                    with open(self.part_path, "r+b") as f:
+                        f.seek(start)
+                        for data in resp.iter_content(256 * 1024):
+                            f.write(data)
+                            written += len(data)
+                            if on_bytes:
+                                on_bytes(len(data))
+                if written != end - start + 1:
+                    raise RuntimeError(f"Кусок {i}: получено {written} из {end - start + 1} байт")
+                break
+            except Exception:
+                # Неудачная попытка: откатываем учтённый прогресс куска
+                if on_bytes and written:
+                    on_bytes(-written)
+                if attempt == DOWNLOAD_RETRIES - 1:
+                    raise
+        with self._lock:
+            self.done.add(i)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"size": self.size, "chunk_size": self.chunk_size, "done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.state_path)
+
+    def finish(self):
+        os.replace(self.part_path, self.path)
+        os.remove(self.state_path)
+
+
+def fetch_streams(streams, progress=None, connections=DOWNLOAD_CONNECTIONS, chunk_size=DOWNLOAD_CHUNK):
+    """
+    Параллельно скачивает несколько потоков [(url, path, size)]: куски всех потоков идут в общий
+    пул соединений. progress(percent) получает общий процент по суммарному размеру.
+    """
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    downloads = [RangedDownload(url, path, size, chunk_size) for url, path, size in streams]
+    total = sum(d.size for d in downloads) or 1
+    received = [sum(d.done_bytes() for d in downloads)]
+    lock = threading.Lock()
+    last_percent = [-1]
+
+    def on_bytes(n):
+        with lock:
+            received[0] += n
+            percent = min(100, int(received[0] * 100 / total))
+            if progress and percent != last_percent[0]:
+                last_percent[0] = percent
+                progress(percent)
+
+    tasks = [(d, i) for d in downloads for i in d.pending()]
+    # Куски чередуются между потоками, чтобы видео и аудио качались одновременно
+    tasks.sort(key=lambda task: task[1])
+    local = threading.local()
+
+    def run(task):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        task[0].fetch_chunk(local.session, task[1], on_bytes)
+
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+        for _ in pool.map(run, tasks):
             pass
+    for d in downloads:
+        d.finish()
+    return [d.path for d in downloads]
+
+
+def mux(video_path, audio_path, out_path):
+    """Склейка адаптивных видео и аудио без перекодирования."""
+    tmp_path = out_path + ".mux.mp4"
+    run_ffmpeg(["-i", video_path, "-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c", "copy",
+                "-movflags", "+faststart", tmp_path])
+    os.replace(tmp_path, out_path)
+
+
+def select_streams(yt):
+    """
+    Лучшие потоки не выше DOWNLOAD_MAX_HEIGHT: адаптивное видео mp4 + аудио m4a, если видео
+    лучше прогрессивного; иначе прогрессивный mp4. Возвращает (video, audio или None).
+    """
+    progressive = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
+    videos = yt.streams.filter(adaptive=True, only_video=True, file_extension='mp4').order_by('resolution').desc()
+    video = next((v for v in videos if int((v.resolution or "0p")[:-1] or 0) <= DOWNLOAD_MAX_HEIGHT), None)
+    audio = yt.streams.filter(adaptive=True, only_audio=True, file_extension='mp4').order_by('abr').desc().first()
+    progressive_height = int((progressive.resolution or "0p")[:-1] or 0) if progressive else 0
+    if video and audio and int(video.resolution[:-1]) > progressive_height:
+        return video, audio
+    if progressive:
+        return progressive, None
+    raise RuntimeError("Не найден подходящий поток для скачивания.")
 
 
 def download(job_data):
     """
-    Скачивает видео с YouTube через pytubefix, выбирает лучший прогрессивный поток mp4 (видео+звук).
+    Скачивает видео с YouTube через pytubefix. Адаптивные видео и аудио (до DOWNLOAD_MAX_HEIGHT)
+    качаются параллельно кусками по HTTP Range с докачкой и склеиваются ffmpeg -c copy;
+    если адаптивное видео не лучше прогрессивного — качается прогрессивный mp4.
     Обрабатывает ошибки (регион, возраст, DRM).
     Возвращает путь к скачанному видео.
     """
@@ -48,34 +183,23 @@ def download(job_data):
             update_progress(job_id, 100)
         return out_path
 
-    def on_progress(stream, chunk, bytes_remaining):
-        if not job_id:
-            return
-        total = stream.filesize or 1
-        downloaded = total - bytes_remaining
-        percent = int(downloaded * 100 / total)
-        if percent > 100:
-            percent = 100
-        update_progress(job_id, percent)
+    def on_progress(percent):
+        if job_id:
+            update_progress(job_id, percent)
 
     try:
-        yt = YouTube(url, on_progress_callback=on_progress)
-
-        # Ищем прогрессивный mp4 (видео + аудио)
-        video = yt.streams.filter(progressive=True, file_extension='mp4').order_by('resolution').desc().first()
-
-        # Если нет подходящего прогрессивного, пробуем комбинацию адаптивных (отдельное аудио и видео)
-        if not video:
-            video = yt.streams.filter(adaptive=True, only_video=True, file_extension='mp4').order_by('resolution').desc().first()
-            audio = yt.streams.filter(adaptive=True, only_audio=True, file_extension='mp4').order_by('abr').desc().first()
-            if not video or not audio:
-                raise RuntimeError("Не найден подходящий поток для скачивания.")
-            # Скачиваем отдельно и соединяем с помощью ffmpeg (здесь можно доработать, если нужно)
-
-            # Для простоты пока ошибка, т.к. объединение не реализовано в этом коде
-            raise RuntimeError("Найдено только раздельное аудио и видео. Объединение не реализовано.")
-
-        video.download(output_path=MEDIA_SOURCE, filename=f"{sha1}.mp4")
+        from pytubefix import YouTube
+        yt = YouTube(url)
+        video, audio = select_streams(yt)
+        if audio is None:
+            fetch_streams([(video.url, out_path, video.filesize)], on_progress)
+        else:
+            video_path = os.path.join(MEDIA_SOURCE, f"{sha1}.video.mp4")
+            audio_path = os.path.join(MEDIA_SOURCE, f"{sha1}.audio.m4a")
+            fetch_streams([(video.url, video_path, video.filesize), (audio.url, audio_path, audio.filesize)], on_progress)
+            mux(video_path, audio_path, out_path)
+            os.remove(video_path)
+            os.remove(audio_path)
 
         if job_id:
             update_progress(job_id, 100)
@@ -91,27 +215,42 @@ def download(job_data):
     return out_path
 
 
-def extract_audio(video_path, sample_rate=16000):
+def extract_audio(video_path, sample_rate=16000, with_proxy=None):
     """
-    Извлекает аудио из видео в WAV 16kHz моно для распознавания речи.
-    Возвращает путь к аудиофайлу.
+    Извлекает аудио из видео в WAV 16kHz моно для распознавания речи и тем же проходом ffmpeg
+    (одно декодирование исходника) пишет прокси для анализа (см. services/proxy.py).
+    Возвращает путь к аудиофайлу; прокси лежит рядом под proxy.proxy_path(video_path).
     """
     import subprocess
+    from . import proxy
 
+    with_proxy = proxy.PROXY_ENABLED if with_proxy is None else with_proxy
     audio_path = os.path.splitext(video_path)[0] + ".wav"
-    if os.path.exists(audio_path):
+    proxy_out = proxy.proxy_path(video_path) if with_proxy else None
+    if proxy_out and os.path.exists(proxy_out):
+        proxy_out = None
+    if os.path.exists(audio_path) and proxy_out is None:
         return audio_path
 
-    cmd = [
-        "ffmpeg", "-y", "-i", video_path,
-        "-ac", "1",  # 1 канал (моно)
-        "-ar", str(sample_rate),  # частота дискретизации
-        "-vn",  # без видео
-        audio_path
-    ]
+    # Пишем во временные файлы: недописанный WAV/прокси не должен выглядеть как готовый
+    tmp_audio = os.path.splitext(audio_path)[0] + ".tmp.wav"
+    tmp_proxy = proxy_out[:-len(".mp4")] + ".tmp.mp4" if proxy_out else None
+
+    def run(args):
+        return subprocess.run(["ffmpeg", "-y", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    proc = run(proxy.build_ingest_args(video_path, tmp_audio, tmp_proxy, sample_rate))
+    if proc.returncode != 0 and tmp_proxy:
+        # Нет видеопотока (или кодек прокси недоступен) — только аудио, анализ пойдёт по исходнику
+        tmp_proxy = None
+        proc = run(proxy.build_ingest_args(video_path, tmp_audio, None, sample_rate))
     if proc.returncode != 0:
         raise RuntimeError(f"ffmpeg error: {proc.stderr.decode(errors='ignore')}")
 
+    if not os.path.exists(audio_path):
+        os.replace(tmp_audio, audio_path)
+    elif os.path.exists(tmp_audio):
+        os.remove(tmp_audio)
+    if tmp_proxy:
+        os.replace(tmp_proxy, proxy_out)
     return audio_path
@@ -1,20 +1,30 @@
 """
-Highlight detection: scenes (PySceneDetect), audio features (librosa), text signals (RAKE/KeyBERT), scoring, NMS, save highlights.json.
+Highlight detection: scenes (ffmpeg-pipe detector), audio features (shared feature store), text signals (RAKE/KeyBERT), scoring, NMS, save highlights.json.
 """
 import os
 import json
 import numpy as np
-import librosa
-from scenedetect import VideoManager, SceneManager
-from scenedetect.detectors import ContentDetector
-from keybert import KeyBERT
-from rake_nltk import Rake
 from typing import List, Dict
+from . import audio_features
+from . import scenes as scene_detection
+from . import candidates as candidate_engine
+from .transcript_index import load_index, transcript_fingerprint
+from . import virality
+from . import proxy
+from ..utils import cached_sha1
+from ..cache import artifacts
+from ..models.registry import registry
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 os.makedirs(MEDIA_WORK, exist_ok=True)
+# Версия алгоритма отбора (ключ общего кэша артефактов)
+HIGHLIGHT_VERSION = "4"
 
-async def detect_highlights(video_path, transcript_result, job_data):
+def create_keybert():
+    from keybert import KeyBERT
+    return KeyBERT()
+
+def detect_highlights(video_path, transcript_result, job_data):
     job_id = job_data["job_id"]
     job_dir = os.path.join(MEDIA_WORK, job_id)
     os.makedirs(job_dir, exist_ok=True)
@@ -22,64 +32,145 @@ async def detect_highlights(video_path, transcript_result, job_data):
     if os.path.exists(cache_json):
         with open(cache_json, encoding='utf-8') as f:
             return json.load(f)
-    # 1. Сцены (PySceneDetect)
-    video_manager = VideoManager([video_path])
-    scene_manager = SceneManager()
-    scene_manager.add_detector(ContentDetector())
-    video_manager.set_downscale_factor()
-    video_manager.start()
-    scene_manager.detect_scenes(frame_source=video_manager)
-    scene_list = scene_manager.get_scene_list()
-    scenes = [(start.get_seconds(), end.get_seconds()) for start, end in scene_list]
-    video_manager.release()
-    # 2. Аудио признаки (librosa)
+    source_sha1 = job_data.get("source_sha1") or cached_sha1(video_path)
+    cache_params = {"max_clips": job_data.get("max_clips") or 15, "clip_len": job_data.get("clip_len"), "audio_sha1": transcript_result.get("audio_sha1"),
+                    "lang": transcript_result.get("language"), "transcript": transcript_fingerprint(transcript_result)}
+    cache_key = artifacts.key(source_sha1, "highlights", cache_params, HIGHLIGHT_VERSION)
+    selected = artifacts.get_json(cache_key, "highlights")
+    if selected is not None:
+        with open(cache_json, "w", encoding="utf-8") as f:
+            json.dump(selected, f, ensure_ascii=False, indent=2)
+        return selected
+    # 1. Сцены (прокси задачи в низком разрешении + векторные HSV-разницы, кэш по SHA1 исходника)
+    scenes = scene_detection.detect_scenes(proxy.analysis_video(video_path, job_data), source_sha1)
+    # 2. Аудио признаки (общий кэш по SHA1 аудио, кадры по FEATURE_HOP)
     audio_path = os.path.splitext(video_path)[0] + ".wav"
-    y, sr = librosa.load(audio_path, sr=None)
-    rms = librosa.feature.rms(y=y)[0]
-    flux = librosa.onset.onset_strength(y=y, sr=sr)
-    zcr = librosa.feature.zero_crossing_rate(y)[0]
+    features = audio_features.load_features(audio_path, transcript_result.get("audio_sha1"))
     # 3. Текстовые признаки (RAKE/KeyBERT)
     text = " ".join([seg['text'] for seg in transcript_result['segments']])
-    kw_model = KeyBERT()
+    kw_model = registry.get("keybert")
     keywords = kw_model.extract_keywords(text, top_n=10)
+    from rake_nltk import Rake
     rake = Rake()
     rake.extract_keywords_from_text(text)
     rake_keywords = rake.get_ranked_phrases()[:10]
-    # 4. Формирование кандидатов (20-60s)
-    candidates = []
-    for s, e in scenes:
-        if e - s < 20 or e - s > 60:
-            continue
-        candidates.append({"start": s, "end": e})
-    # 5. Считаем скор для каждого кандидата
-    for c in candidates:
-        # Аудио признаки (усреднение по сегменту)
-        idx_start = int(c["start"] * sr)
-        idx_end = int(c["end"] * sr)
-        c["rms"] = float(np.mean(rms[idx_start:idx_end]))
-        c["flux"] = float(np.mean(flux[int(c["start"]):int(c["end"])]))
-        c["zcr"] = float(np.mean(zcr[idx_start:idx_end]))
-        # Текстовые признаки (кол-во ключевых фраз)
-        c["kw_count"] = sum(1 for kw, _ in keywords if kw in text[int(c["start"]):int(c["end"])] )
-        c["rake_count"] = sum(1 for kw in rake_keywords if kw in text[int(c["start"]):int(c["end"])] )
-        # Итоговый скор (простая сумма)
-        c["score"] = c["rms"] + c["flux"] + c["zcr"] + c["kw_count"] + c["rake_count"]
-    # 6. NMS по перекрытиям
-    candidates = sorted(candidates, key=lambda x: -x["score"])
+    # 4. Кандидаты: все окна нужной длины, начинающиеся и заканчивающиеся на границах фраз
+    segments = transcript_result['segments']
+    starts, ends = candidate_engine.sentence_bounds(segments, features.duration)
+    min_len, max_len = candidate_engine.clip_bounds(job_data.get("clip_len"))
+    first, last = candidate_engine.sliding_windows(starts, ends, min_len, max_len)
+    win_starts, win_ends = starts[first], ends[last]
+    # 5. Скоры всех окон массивами: аудио — префиксные суммы признаков,
+    audio_means = features.window_mean(win_starts, win_ends)
+    # текст — попадания ключевых фраз по словам индекса транскрипта и диапазонные суммы по времени
+    index = load_index(transcript_result, job_id)
+    kw_count = index.count_in_ranges(index.phrase_hits([kw for kw, _ in keywords]), win_starts, win_ends)
+    rake_count = index.count_in_ranges(index.phrase_hits(rake_keywords), win_starts, win_ends)
+    scene_cuts = [s for s, _ in scenes[1:]]
+    # Вирусность всех окон одним батчем: общий индекс транскрипта и один анализатор VADER
+    rms_std = np.sqrt(features.window_var(win_starts, win_ends)[:, 0])
+    audio_cv = rms_std / (audio_means[:, 0] + 1e-6)
+    virality_features, virality_scores = virality.virality_batch(
+        win_starts, win_ends, index, audio_cv, candidate_engine.scene_counts(win_starts, win_ends, scene_cuts))
+    # Итоговый скор в [0, 1]: нормированные по задаче сигналы вовлечённости + вирусность
+    engagement = candidate_engine.minmax(np.column_stack([audio_means[:, 0], audio_means[:, 1], kw_count, rake_count])).mean(axis=1)
+    scores = (candidate_engine.ENGAGEMENT_WEIGHT * engagement
+              + candidate_engine.VIRALITY_WEIGHT * virality_scores / 100.0
+              + candidate_engine.scene_start_bonus(win_starts, scene_cuts))
+    # 6. NMS по перекрытиям (отсортированные интервалы)
+    keep = candidate_engine.nms_intervals(win_starts, win_ends, scores, job_data.get("max_clips") or 15)
     selected = []
-    for c in candidates:
-        overlap = False
-        for s in selected:
-            if min(c["end"], s["end"]) - max(c["start"], s["start"]) > 2:
-                overlap = True
-                break
-        if not overlap:
-            selected.append(c)
-        if len(selected) >= (job_data.get("max_clips") or 15):
-            break
+    for i, k in enumerate(keep):
+        selected.append({
+            "start": float(win_starts[k]),
+            "end": float(win_ends[k]),
+            "rms": float(audio_means[k, 0]),
+            "flux": float(audio_means[k, 1]),
+            "zcr": float(audio_means[k, 2]),
+            "kw_count": int(kw_count[k]),
+            "rake_count": int(rake_count[k]),
+            "virality": int(virality_scores[k]),
+            "virality_color": virality.score_color(virality_scores[k]),
+            "virality_features": dict(zip(virality.FEATURE_NAMES, np.round(virality_features[k], 3).tolist())),
+            "score": float(scores[k]),
+            "id": f"seg_{i+1}",
+        })
     # 7. Сохраняем highlights.json
-    for i, seg in enumerate(selected):
-        seg["id"] = f"seg_{i+1}"
     with open(cache_json, "w", encoding="utf-8") as f:
         json.dump(selected, f, ensure_ascii=False, indent=2)
+    artifacts.put_json(cache_key, "highlights", selected, cache_params)
+    return selected
+
+def select_nms(candidates, max_clips, max_overlap=2.0):
+    """Жадный NMS по скору для списка кандидатов-словарей (см. candidates.nms_intervals)."""
+    keep = candidate_engine.nms_intervals(
+        np.array([c["start"] for c in candidates]), np.array([c["end"] for c in candidates]),
+        np.array([c["score"] for c in candidates]), max_clips, max_overlap)
+    selected = [candidates[k] for k in keep]
+    for i, seg in enumerate(selected):
+        seg["id"] = f"seg_{i+1}"
     return selected
+
+# --- Предварительные хайлайты во время потоковой транскрипции ---
+def segment_windows(segments, min_len=20.0, max_len=60.0):
+    """
+    Окна из подряд идущих фраз транскрипта длиной min_len..max_len: от начала каждой фразы
+    набираем фразы, пока окно не станет не короче min_len. Границы окон совпадают с границами фраз.
+    """
+    windows = []
+    j = 0
+    for i, seg in enumerate(segments):
+        j = max(j, i)
+        while j < len(segments) and segments[j]["end"] - seg["start"] < min_len:
+            j += 1
+        if j >= len(segments):
+            break
+        if segments[j]["end"] - seg["start"] <= max_len:
+            windows.append({
+                "start": seg["start"],
+                "end": segments[j]["end"],
+                "text": " ".join(s["text"] for s in segments[i:j + 1]),
+            })
+    return windows
+
+def update_partial_highlights(video_path, new_segments, job_data):
+    """
+    Дополняет предварительные хайлайты по очередному куску транскрипта.
+    Состояние (хвост фраз, кандидаты) хранится в highlights.partial.json папки задачи, потому что
+    вызовы идут в пуле процессов. Окна, начатые в конце куска, досчитываются со следующим куском.
+    Возвращает текущий выбор после NMS.
+    """
+    job_dir = os.path.join(MEDIA_WORK, job_data["job_id"])
+    os.makedirs(job_dir, exist_ok=True)
+    partial_json = os.path.join(job_dir, "highlights.partial.json")
+    state = {"tail": [], "candidates": [], "highlights": []}
+    if os.path.exists(partial_json):
+        with open(partial_json, encoding="utf-8") as f:
+            state = json.load(f)
+    segments = state["tail"] + list(new_segments)
+    windows = segment_windows(segments)
+    # Фразы, с которых ещё не набралось полное окно, ждут следующего куска
+    last_end = segments[-1]["end"] if segments else 0.0
+    first_open = next((i for i, seg in enumerate(segments) if last_end - seg["start"] < 20.0), len(segments))
+    state["tail"] = segments[first_open:]
+    if windows:
+        audio_path = os.path.splitext(video_path)[0] + ".wav"
+        features = audio_features.load_features(audio_path, job_data.get("audio_sha1"))
+        audio_means = features.window_mean([w["start"] for w in windows], [w["end"] for w in windows])
+        from rake_nltk import Rake
+        rake = Rake()
+        rake.extract_keywords_from_text(" ".join(w["text"] for w in windows))
+        rake_keywords = rake.get_ranked_phrases()[:10]
+        for w, (rms, flux, zcr) in zip(windows, audio_means):
+            text = w.pop("text").lower()
+            w["rms"], w["flux"], w["zcr"] = float(rms), float(flux), float(zcr)
+            w["rake_count"] = sum(1 for kw in rake_keywords if kw in text)
+            w["score"] = w["rms"] + w["flux"] + w["zcr"] + w["rake_count"]
+            w["partial"] = True
+        state["candidates"].extend(windows)
+    state["highlights"] = select_nms([dict(c) for c in state["candidates"]], job_data.get("max_clips") or 15)
+    tmp_path = partial_json + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, partial_json)
+    return state["highlights"]
@@ -0,0 +1,50 @@
+"""
+Upload ingest: stream to disk in large chunks with on-the-fly SHA1, dedupe sources by content hash.
+"""
+import os
+import asyncio
+import hashlib
+import uuid
+import aiofiles
+from ..utils import write_sha1_sidecar
+
+MEDIA_SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source'))
+os.makedirs(MEDIA_SOURCE, exist_ok=True)
+
+INGEST_CHUNK = 4 * 1024 * 1024
+VIDEO_EXTS = ('.mp4', '.mkv', '.mov', '.avi', '.webm')
+
+
+async def ingest_upload(upload, source_dir: str = None):
+    """
+    Пишет загружаемый файл на диск кусками по INGEST_CHUNK, параллельно считая SHA1.
+    Одинаковое содержимое хранится один раз: файл называется `{sha1}{ext}`.
+    Возвращает (путь к исходнику, sha1).
+    """
+    source_dir = source_dir or MEDIA_SOURCE
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    if ext not in VIDEO_EXTS:
+        ext = ".mp4"
+    tmp_path = os.path.join(source_dir, f".upload_{uuid.uuid4().hex}.part")
+    h = hashlib.sha1()
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while True:
+                chunk = await upload.read(INGEST_CHUNK)
+                if not chunk:
+                    break
+                # hashlib отпускает GIL на больших буферах: хэш и запись идут одновременно
+                await asyncio.gather(asyncio.to_thread(h.update, chunk), f.write(chunk))
+        digest = h.hexdigest()
+        final_path = os.path.join(source_dir, f"{digest}{ext}")
+        if os.path.exists(final_path):
+            # Такой исходник уже загружали — используем его
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+            write_sha1_sidecar(final_path, digest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return final_path, digest
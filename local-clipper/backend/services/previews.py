@@ -0,0 +1,85 @@
+"""
+Segment previews: keyframe-only thumbnails and optional animated WebP for all highlights in one ffmpeg call, cached by source SHA1 and segment bounds.
+"""
+import os
+import shutil
+from typing import Dict, List
+from ..utils import cached_sha1, run_ffmpeg
+from . import proxy
+
+MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
+MEDIA_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'cache', 'previews'))
+os.makedirs(MEDIA_CACHE, exist_ok=True)
+
+# Ширина превью в UI (карточка 160px, x2 для HiDPI)
+PREVIEW_WIDTH = int(os.environ.get("PREVIEW_WIDTH", 320))
+PREVIEW_ANIMATED = os.environ.get("PREVIEW_ANIMATED", "0") == "1"
+ANIM_SECONDS = 3.0
+ANIM_FPS = 8
+PREVIEWS_VERSION = "2"
+
+
+def cache_path(source_sha1, seg, ext, preview_source=""):
+    """Имя в кэше: исходник, границы, ширина и то, из чего декодировали (прокси или оригинал)."""
+    params = proxy.proxy_params(preview_source)
+    tag = f"_p{params['width']}x{params['fps']:g}" if params else ""
+    return os.path.join(MEDIA_CACHE, f"{source_sha1}_{seg['start']:.2f}_{seg['end']:.2f}_w{PREVIEW_WIDTH}{tag}_v{PREVIEWS_VERSION}.{ext}")
+
+
+def build_preview_args(video_path, jobs):
+    """
+    Аргументы одного вызова ffmpeg: на каждое превью свой вход с быстрым seek до ближайшего
+    ключевого кадра (-ss до -i, -noaccurate_seek, -skip_frame nokey) и свой выход.
+    jobs: список (kind, t, duration, out_path), kind — "jpg" или "webp".
+    """
+    inputs, outputs = [], []
+    scale = f"scale={PREVIEW_WIDTH}:-2"
+    for i, (kind, t, duration, out_path) in enumerate(jobs):
+        if kind == "jpg":
+            inputs += ["-skip_frame", "nokey", "-noaccurate_seek", "-ss", f"{t:.3f}", "-i", video_path]
+            outputs += ["-map", f"{i}:v:0", "-frames:v", "1", "-vf", scale, "-q:v", "4", out_path]
+        else:
+            inputs += ["-ss", f"{t:.3f}", "-t", f"{duration:.3f}", "-i", video_path]
+            outputs += ["-map", f"{i}:v:0", "-vf", f"fps={ANIM_FPS},{scale}", "-an",
+                        "-c:v", "libwebp", "-loop", "0", "-quality", "60", out_path]
+    return inputs + outputs
+
+
+def generate_previews(video_path, highlights: List[Dict], job_data):
+    job_id = job_data["job_id"]
+    job_dir = os.path.join(MEDIA_WORK, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    source_sha1 = job_data.get("source_sha1") or cached_sha1(video_path)
+    animated = job_data.get("animated_previews", PREVIEW_ANIMATED)
+    kinds = ["jpg", "webp"] if animated else ["jpg"]
+    # Прокси декодируется в разы быстрее и с коротким GOP точнее попадает в середину сегмента
+    preview_source = proxy.analysis_video(video_path, job_data) if PREVIEW_WIDTH <= proxy.PROXY_WIDTH else video_path
+    # Только то, чего ещё нет в кэше
+    pending = []
+    for seg in highlights:
+        for kind in kinds:
+            out_path = cache_path(source_sha1, seg, kind, preview_source)
+            if os.path.exists(out_path):
+                continue
+            mid = (seg["start"] + seg["end"]) / 2
+            if kind == "jpg":
+                pending.append((kind, mid, 0.0, out_path))
+            else:
+                duration = min(ANIM_SECONDS, seg["end"] - seg["start"])
+                pending.append((kind, max(seg["start"], mid - duration / 2), duration, out_path))
+    if pending:
+        run_ffmpeg(build_preview_args(preview_source, pending))
+    # Раскладываем из кэша в папку задачи под именами, которые ждёт UI
+    for seg in highlights:
+        for kind in kinds:
+            src = cache_path(source_sha1, seg, kind, preview_source)
+            if not os.path.exists(src):
+                continue
+            suffix = "preview.jpg" if kind == "jpg" else "preview.webp"
+            dst = os.path.join(job_dir, f"{seg['id']}_{suffix}")
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)
@@ -0,0 +1,50 @@
+"""
+Low-res analysis proxy: one ffmpeg pass at ingest writes the 16 kHz WAV and a small, low-fps, short-GOP H.264 proxy that scene detection, reframing and previews decode instead of the source.
+"""
+import os
+from typing import Dict, List, Optional
+
+# Прокси: ширина (не больше исходной; совпадает с шириной кадра детектора лиц), частота кадров,
+# ключевой кадр раз в PROXY_GOP кадров — seek в любой момент декодирует не больше секунды
+PROXY_ENABLED = os.environ.get("PROXY_ENABLED", "1") == "1"
+PROXY_WIDTH = int(os.environ.get("PROXY_WIDTH", 640))
+PROXY_FPS = float(os.environ.get("PROXY_FPS", 10))
+PROXY_GOP = int(os.environ.get("PROXY_GOP", PROXY_FPS))
+PROXY_CRF = 26
+
+
+def proxy_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + ".proxy.mp4"
+
+
+def proxy_params(path: str) -> Optional[Dict]:
+    """Параметры прокси для ключей кэша стадий, читающих видео (None — анализ шёл по исходнику)."""
+    if not path.endswith(".proxy.mp4"):
+        return None
+    return {"width": PROXY_WIDTH, "fps": PROXY_FPS, "gop": PROXY_GOP}
+
+
+def analysis_video(video_path: str, job_data: Optional[Dict] = None) -> str:
+    """
+    Видео для анализа: прокси задачи, если он есть, иначе исходник. Координаты анализа —
+    доли кадра, поэтому к разрешению исходника они приводятся только при рендере.
+    """
+    path = (job_data or {}).get("proxy_path") or proxy_path(video_path)
+    return path if os.path.exists(path) else video_path
+
+
+def build_ingest_args(video_path: str, audio_path: str, proxy_out: Optional[str], sample_rate: int = 16000) -> List[str]:
+    """
+    Аргументы ffmpeg (без "ffmpeg -y"): одно декодирование исходника, два выхода —
+    WAV моно sample_rate и (если proxy_out) прокси без звука.
+    """
+    args = ["-i", video_path, "-map", "0:a:0", "-ac", "1", "-ar", str(sample_rate), "-vn", audio_path]
+    if proxy_out:
+        args += [
+            "-map", "0:v:0", "-an", "-sn",
+            "-vf", f"fps={PROXY_FPS:g},scale='min({PROXY_WIDTH},iw)':-2:flags=fast_bilinear",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "fastdecode", "-crf", str(PROXY_CRF),
+            "-g", str(PROXY_GOP), "-keyint_min", str(PROXY_GOP), "-sc_threshold", "0",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart", proxy_out,
+        ]
+    return args
@@ -2,54 +2,125 @@
 Auto-reframing for 9:16: face/subject detection (MediaPipe/YOLOv8n-face), track, smoothing, crop window, export tracks/{seg_id}.json.
 """
 import os
-import cv2
 import numpy as np
-import mediapipe as mp
 import json
 from typing import List, Dict
+from ..utils import cached_sha1
+from ..cache import artifacts
+from ..models.registry import registry
+from . import proxy, tracking
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 os.makedirs(MEDIA_WORK, exist_ok=True)
 
-mp_face = mp.solutions.face_detection
+# Шаг выборки кадров для детекции, ширина кадра для детектора
+SAMPLE_STEP = 0.5
+DETECT_WIDTH = 640
+# Разрывы между сэмплами короче SEEK_GAP секунд пролистываются grab() без декодирования в BGR,
+# длинные — одним seek (каждый seek на long-GOP H.264 декодирует от ближайшего ключевого кадра)
+SEEK_GAP = 10.0
+# Версия трека в общем кэше артефактов
+REFRAMING_VERSION = "3"
 
-async def process_reframing(video_path, highlights, job_data):
+def create_face_detector():
+    import mediapipe as mp
+    return mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+
+def get_face_detector():
+    """Один детектор на процесс (переиспользуется всеми сегментами и задачами)."""
+    return registry.get("face_detector")
+
+def sample_times(highlights, step=SAMPLE_STEP):
+    return {seg["id"]: np.arange(seg["start"], seg["end"], step) for seg in highlights}
+
+def read_sampled_frames(cap, frame_indices, fps, width=DETECT_WIDTH):
+    """
+    Один последовательный проход по отсортированным индексам кадров: пропуски листаются grab(),
+    декодируются и уменьшаются только нужные кадры. Возвращает генератор (frame_idx, rgb).
+    """
+    import cv2
+    seek_gap = int(SEEK_GAP * fps)
+    pos = None
+    for idx in frame_indices:
+        if pos is None or idx < pos or idx - pos > seek_gap:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            pos = idx
+        while pos < idx:
+            if not cap.grab():
+                return
+            pos += 1
+        ret, frame = cap.read()
+        pos += 1
+        if not ret:
+            return
+        h, w = frame.shape[:2]
+        if w > width:
+            frame = cv2.resize(frame, (width, int(h * width / w)), interpolation=cv2.INTER_AREA)
+        yield idx, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+def detect_faces(detector, frames):
+    """
+    Детекция по кадрам (у MediaPipe FaceDetection нет батч-API — один process() на кадр);
+    для каждого кадра список лиц (cx, cy, size, score), выбор лица — в трекере.
+    """
+    out = []
+    for rgb in frames:
+        results = detector.process(rgb)
+        faces = []
+        for det in results.detections or []:
+            bbox = det.location_data.relative_bounding_box
+            faces.append((bbox.xmin + bbox.width / 2, bbox.ymin + bbox.height / 2, max(bbox.width, bbox.height),
+                          float(det.score[0]) if det.score else 1.0))
+        out.append(faces)
+    return out
+
+def detect_sampled(video_path, frame_indices):
+    """Прогоняет детектор по всем выбранным кадрам источника, возвращает {frame_idx: detection}."""
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    detector = get_face_detector()
+    detections = {}
+    # Кадр детектируется сразу после декодирования: в памяти держится только текущий
+    for idx, rgb in read_sampled_frames(cap, frame_indices, fps):
+        detections[idx] = detect_faces(detector, [rgb])[0]
+    cap.release()
+    return detections
+
+def process_reframing(video_path, highlights, job_data):
     job_id = job_data["job_id"]
     job_dir = os.path.join(MEDIA_WORK, job_id)
     tracks_dir = os.path.join(job_dir, "tracks")
     os.makedirs(tracks_dir, exist_ok=True)
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps
+    # Треки из общего кэша (ключ: исходник + границы сегмента + параметры выборки)
+    source_sha1 = job_data.get("source_sha1") or cached_sha1(video_path)
+    # Детекция по прокси: лица в долях кадра, к разрешению исходника их приводит рендер
+    analysis_path = proxy.analysis_video(video_path, job_data)
+    cache_keys = {}
+    pending = []
+    for seg in highlights:
+        params = {"start": seg["start"], "end": seg["end"], "step": SAMPLE_STEP, "width": DETECT_WIDTH,
+                  "proxy": proxy.proxy_params(analysis_path)}
+        cache_keys[seg["id"]] = (artifacts.key(source_sha1, "reframing", params, REFRAMING_VERSION), params)
+        out_path = os.path.join(tracks_dir, f"{seg['id']}.json")
+        if not artifacts.fetch_files(cache_keys[seg["id"]][0], "reframing", {"track.json": out_path}):
+            pending.append(seg)
+    if not pending:
+        return
+    highlights = pending
+    import cv2
+    cap = cv2.VideoCapture(analysis_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    # Объединение сэмплов всех хайлайтов: один проход декодера по источнику
+    seg_times = sample_times(highlights)
+    seg_indices = {seg_id: np.round(times * fps).astype(int) for seg_id, times in seg_times.items()}
+    all_indices = sorted(set(int(i) for idx in seg_indices.values() for i in idx))
+    detections = detect_sampled(analysis_path, all_indices)
     for seg in highlights:
         seg_id = seg["id"]
-        start, end = seg["start"], seg["end"]
-        frames = []
-        times = np.arange(start, end, 0.5)
-        with mp_face.FaceDetection(model_selection=0, min_detection_confidence=0.5) as face_det:
-            for t in times:
-                cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
-                ret, frame = cap.read()
-                if not ret:
-                    continue
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = face_det.process(rgb)
-                if results.detections:
-                    det = results.detections[0]
-                    bbox = det.location_data.relative_bounding_box
-                    cx = bbox.xmin + bbox.width / 2
-                    cy = bbox.ymin + bbox.height / 2
-                    size = max(bbox.width, bbox.height)
-                else:
-                    cx, cy, size = 0.5, 0.5, 0.5
-                frames.append({"center_x": cx, "center_y": cy, "zoom": size, "t": t})
-        # Сглаживание
-        for k in ["center_x", "center_y", "zoom"]:
-            arr = np.array([f[k] for f in frames])
-            arr = np.convolve(arr, np.ones(3)/3, mode='same')
-            for i, f in enumerate(frames):
-                f[k] = float(arr[i])
+        # Трекинг главного лица, мёртвая зона и one-euro сглаживание (кадры, которые не прочитались, — None)
+        frames = tracking.smooth_track(seg_times[seg_id], [detections.get(int(idx)) for idx in seg_indices[seg_id]])
         # Ограничение окна 9:16
         for f in frames:
             f["center_x"] = min(max(f["center_x"], 0.5 - 9/32), 0.5 + 9/32)
@@ -59,4 +130,5 @@ async def process_reframing(video_path, highlights, job_data):
         out_path = os.path.join(tracks_dir, f"{seg_id}.json")
         with open(out_path, "w", encoding="utf-8") as f:
             json.dump(frames, f, ensure_ascii=False, indent=2)
-    cap.release()
+        cache_key, params = cache_keys[seg_id]
+        artifacts.put_dir(cache_key, "reframing", {"track.json": out_path}, params)
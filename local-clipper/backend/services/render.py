@@ -1,73 +1,382 @@
 """
-Clip rendering: ffmpeg crop/scale, панорамирование по треку, fps, loudnorm, burn-in сабы через ASS, ресэмпл, вывод mp4/webm, safe titles area.
+Clip rendering: ffmpeg crop/scale, панорамирование по треку, fps, two-pass loudnorm, burn-in сабы через ASS, ресэмпл, вывод mp4/webm, safe titles area; выходы кэшируются по ключу содержимого, рендер описывается манифестом.
 """
 import os
+import glob
 import subprocess
 import asyncio
+import hashlib
 import json
-from typing import List, Dict
+import uuid
+from typing import List, Dict, Optional, Tuple
+from ..cache import artifacts
+from ..utils import cached_sha1
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 MEDIA_OUTPUTS = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'outputs'))
 os.makedirs(MEDIA_OUTPUTS, exist_ok=True)
+RENDER_VERSION = "2"
 
-async def render_segments(job_id: str, segments: List[Dict], resolution: int = 720, fmt: str = "mp4"):
+# Потоки на один ffmpeg и число одновременных рендеров (по умолчанию — сколько влезает в ядра)
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", 4))
+RENDER_CONCURRENCY = int(os.environ.get("RENDER_CONCURRENCY", max(1, (os.cpu_count() or 2) // FFMPEG_THREADS)))
+_render_slots = asyncio.Semaphore(RENDER_CONCURRENCY)
+
+DEFAULT_OPTIONS = {
+    "preset": "veryfast",   # x264 preset
+    "crf": 21,
+    "threads": FFMPEG_THREADS,
+    "bitrate": None,        # если задан — CBR-ish вместо CRF
+}
+
+# Цели EBU R128 для loudnorm (по умолчанию — как у фильтра без параметров)
+LOUDNORM_TARGET = {
+    "I": float(os.environ.get("LOUDNORM_I", -24)),
+    "LRA": float(os.environ.get("LOUDNORM_LRA", 7)),
+    "TP": float(os.environ.get("LOUDNORM_TP", -2)),
+}
+
+def loudnorm_filter(measured: Optional[Dict] = None) -> str:
+    """loudnorm: линейный второй проход по сохранённым замерам, иначе однопроходный динамический."""
+    target = ":".join(f"{k}={v}" for k, v in LOUDNORM_TARGET.items())
+    if not measured:
+        return f"loudnorm={target}"
+    return (f"loudnorm={target}:measured_I={measured['input_i']}:measured_LRA={measured['input_lra']}"
+            f":measured_TP={measured['input_tp']}:measured_thresh={measured['input_thresh']}"
+            f":offset={measured['target_offset']}:linear=true")
+
+def parse_loudnorm_json(stderr: str) -> Dict:
+    """Вытаскивает JSON-блок, который loudnorm печатает в конце stderr при print_format=json."""
+    start, end = stderr.rfind("{"), stderr.rfind("}")
+    if start < 0 or end < start:
+        raise RuntimeError("loudnorm: не найден блок измерений")
+    return json.loads(stderr[start:end + 1])
+
+async def measure_loudness(src_video: str, start: float, end: float, cache_dir: str) -> Dict:
+    """
+    Первый проход loudnorm (integrated, LRA, true peak) для отрезка исходника.
+    Результат кэшируется в папке задачи: повторные рендеры того же сегмента анализ пропускают.
+    Цели входят в имя файла: target_offset второго прохода зависит от них.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    target = ":".join(f"{k}={v}" for k, v in LOUDNORM_TARGET.items())
+    target_tag = "_".join(f"{k}{v:g}" for k, v in LOUDNORM_TARGET.items())
+    cache_path = os.path.join(cache_dir, f"{start:.3f}_{end:.3f}_{target_tag}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f)
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-ss", f"{start:.3f}", "-i", src_video, "-t", f"{end - start:.3f}",
+           "-vn", "-af", f"loudnorm={target}:print_format=json", "-f", "null", "-"]
+    async with _render_slots:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {stderr.decode(errors='ignore')}")
+    measured = parse_loudnorm_json(stderr.decode(errors='ignore'))
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(measured, f, ensure_ascii=False, indent=2)
+    return measured
+
+def find_source(job_id: str):
+    # Путь к исходнику записывается стадией download (загрузки и URL называются по SHA1)
+    source_json = os.path.join(MEDIA_WORK, job_id, "source.json")
+    if os.path.exists(source_json):
+        with open(source_json, encoding='utf-8') as f:
+            return json.load(f)["path"]
+    source_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source')
+    for f in os.listdir(source_dir):
+        if job_id in f:
+            return os.path.join(source_dir, f)
+    return None
+
+# Окно 9:16 во всю высоту кадра (чётная ширина для yuv420p; вертикальный исходник не кропается по ширине)
+CROP_W = "'min(iw,2*trunc(ih*9/32))'"
+
+def crop_x_expr(c0: float, c1: float, t0: float, t1: float) -> str:
+    """x кропа на отрезке трека [t0, t1]: линейная интерполяция центра (доля ширины), зажатая в кадр."""
+    slope = (c1 - c0) / (t1 - t0) if t1 > t0 else 0.0
+    return f"clip(({c0:.5f}{slope:+.6f}*(t{-t0:+.3f}))*iw-ow/2,0,iw-ow)"
+
+def crop_commands(track: List[Dict], seg_start: float, seg_end: float) -> str:
+    """
+    Скрипт sendcmd, ведущий кроп по треку: на каждом отрезке между сэмплами трека кропу
+    задаётся линейное по t выражение x, которое ffmpeg сам вычисляет на каждом кадре.
+    Время — от начала клипа (seek по входу обнуляет временные метки).
+    """
+    points = sorted((p["t"] - seg_start, p["center_x"]) for p in track if seg_start - 1.0 <= p["t"] <= seg_end + 1.0)
+    if not points:
+        return ""
+    # До первого сэмпла и после последнего центр держится на месте
+    points = [(min(0.0, points[0][0]), points[0][1])] + points + [(max(seg_end - seg_start, points[-1][0]) + 1.0, points[-1][1])]
+    lines = []
+    for (t0, c0), (t1, c1) in zip(points[:-1], points[1:]):
+        if t1 <= 0.0 or t1 <= t0:
+            continue
+        lines.append(f"{max(t0, 0.0):.3f} crop x '{crop_x_expr(c0, c1, t0, t1)}';")
+    return "\n".join(lines) + "\n"
+
+def write_crop_script(track: List[Dict], seg: Dict, path: str) -> Optional[str]:
+    commands = crop_commands(track, seg["start"], seg["end"])
+    if not commands:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(commands)
+    return path
+
+def output_size(resolution: int) -> Tuple[int, int]:
+    """Размер кадра вертикального клипа (ширина, высота) для запрошенного разрешения."""
+    return (1080, 1920) if resolution == 1080 else (720, 1280)
+
+def can_stream_copy(seg: Dict, fmt: str, has_captions: bool, has_crop: bool, resolution: int,
+                    source_size: Optional[Tuple[int, int]] = None) -> bool:
+    """
+    Без кропа, сабов, loudnorm и масштабирования клип можно вырезать без перекодирования (-c copy).
+    Масштабирование не нужно, если исходник уже нужного размера или сегмент явно отказался от него (scale=False).
+    """
+    no_scale = seg.get("scale", True) is False or (source_size is not None and tuple(source_size) == output_size(resolution))
+    return fmt == "mp4" and no_scale and not has_crop and not has_captions and not seg.get("loudnorm", True)
+
+def build_render_cmd(src_video: str, seg: Dict, out_path: str, resolution: int, fmt: str,
+                     options: Dict, track=None, ass_path=None, loudness: Optional[Dict] = None,
+                     crop_script: Optional[str] = None, source_size: Optional[Tuple[int, int]] = None) -> List[str]:
+    start, end = seg["start"], seg["end"]
+    has_crop = seg.get("reframe", True) and track is not None
+    has_captions = bool(ass_path)
+    # -ss до -i: быстрый seek по входу вместо декодирования с нуля
+    cmd = ["ffmpeg", "-y", "-ss", f"{start:.3f}", "-i", src_video, "-t", f"{end - start:.3f}"]
+    if can_stream_copy(seg, fmt, has_captions, has_crop, resolution, source_size):
+        # Начало клипа выравнивается по ближайшему ключевому кадру
+        return cmd + ["-c", "copy", "-avoid_negative_ts", "make_zero", "-movflags", "+faststart", out_path]
+    # ffmpeg: crop/scale, панорамирование, сабы, аудио
+    filter_complex = []
+    # Панорамирование по треку (если есть)
+    if has_crop and crop_script:
+        # sendcmd меняет выражение x кропа на границах сэмплов трека; внутри отрезка x(t) считает
+        # сам ffmpeg — один проход декодирования/кодирования без Python на кадр
+        filter_complex.append(f"sendcmd=f='{crop_script}'")
+        filter_complex.append(f"crop=w={CROP_W}:h=ih:x='(iw-ow)/2':y=0")
+    elif has_crop:
+        filter_complex.append(f"crop=w={CROP_W}:h=ih")
+    # Масштабирование (scale=False — кадр остаётся в размере исходника)
+    if seg.get("scale", True) is not False:
+        filter_complex.append("scale={}:{}".format(*output_size(resolution)))
+    # Сабтайтлы
+    if has_captions:
+        filter_complex.append(f"ass={ass_path}")
+    # Аудио
+    audio_filters = [loudnorm_filter(loudness), "aresample=48000"] if seg.get("loudnorm", True) else ["aresample=48000"]
+    if filter_complex:
+        cmd += ["-vf", ",".join(filter_complex)]
+    cmd += ["-af", ",".join(audio_filters)]
+    if fmt == "mp4":
+        cmd += ["-c:v", "libx264", "-preset", options["preset"], "-threads", str(options["threads"])]
+        cmd += ["-b:v", options["bitrate"]] if options.get("bitrate") else ["-crf", str(options["crf"])]
+        cmd += ["-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart"]
+    else:
+        cmd += ["-c:v", "libvpx-vp9", "-deadline", "good", "-cpu-used", "4", "-row-mt", "1",
+                "-threads", str(options["threads"])]
+        cmd += ["-b:v", options["bitrate"]] if options.get("bitrate") else ["-b:v", "0", "-crf", str(options["crf"] + 12)]
+        cmd += ["-c:a", "libopus", "-b:a", "192k"]
+    return cmd + [out_path]
+
+async def run_ffmpeg_cmd(cmd: List[str]):
+    async with _render_slots:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {stderr.decode(errors='ignore')}")
+
+# --- Рендер как отслеживаемая задача: манифест, кэш выходов ---
+def source_info(job_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """(путь, SHA1) исходника задачи; SHA1 берётся из source.json, иначе из .sha1 рядом с файлом."""
+    source_json = os.path.join(MEDIA_WORK, job_id, "source.json")
+    if os.path.exists(source_json):
+        with open(source_json, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("sha1"):
+            return data["path"], data["sha1"]
+    src_video = find_source(job_id)
+    return src_video, (cached_sha1(src_video) if src_video else None)
+
+def file_sha1(path: Optional[str]) -> Optional[str]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def output_key(source_sha1: str, seg: Dict, resolution: int, fmt: str, options: Dict,
+               track_sha1: Optional[str], ass_sha1: Optional[str]) -> str:
+    """
+    Ключ готового клипа: границы сегмента, флаги, разрешение, формат, настройки энкодера,
+    хэши трека кадрирования и ASS (в нём и текст сабов, и стиль). Одинаковый запрос — тот же файл.
+    """
+    params = {
+        "start": round(seg["start"], 3), "end": round(seg["end"], 3), "style": seg.get("style"),
+        "reframe": seg.get("reframe", True), "captions": seg.get("captions", True), "loudnorm": seg.get("loudnorm", True),
+        "scale": seg.get("scale", True), "resolution": resolution, "format": fmt, "options": options, "track": track_sha1, "ass": ass_sha1,
+    }
+    return artifacts.key(source_sha1, "render", params, RENDER_VERSION)
+
+def plan_render(job_id: str, segments: List[Dict], resolution: int = 720, fmt: str = "mp4",
+                options: Optional[Dict] = None) -> Dict:
+    """Входы и ключи выходов для каждого сегмента; уже отрендеренные помечаются cached."""
+    options = {**DEFAULT_OPTIONS, **{k: v for k, v in (options or {}).items() if v is not None}}
     job_dir = os.path.join(MEDIA_WORK, job_id)
-    outputs = []
+    src_video, source_sha1 = source_info(job_id)
+    if not src_video:
+        raise FileNotFoundError(f"Source video not found for job {job_id}")
+    items = []
     for seg in segments:
         seg_id = seg["id"]
-        start, end = seg["start"], seg["end"]
-        style = seg.get("style", "clean")
-        captions = seg.get("captions", True)
-        overlays = seg.get("overlays", [])
         track_path = os.path.join(job_dir, "tracks", f"{seg_id}.json")
         ass_path = os.path.join(job_dir, f"{seg_id}.ass")
-        src_video = None
-        # Поиск исходного видео
-        for f in os.listdir(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source')):
-            if job_id in f:
-                src_video = os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'source', f)
-                break
-        if not src_video:
-            continue
-        out_path = os.path.join(MEDIA_OUTPUTS, f"{job_id}_{seg_id}.{fmt}")
-        # ffmpeg: crop/scale, панорамирование, сабы, аудио
-        filter_complex = []
-        # Панорамирование по треку (если есть)
-        if os.path.exists(track_path):
+        track = None
+        if seg.get("reframe", True) and os.path.exists(track_path):
             with open(track_path, encoding='utf-8') as f:
                 track = json.load(f)
-            # Пример: crop=ih*9/16:ih:x:y
-            # (реализация панорамирования по треку — placeholder, требует ffmpeg фильтра)
-            filter_complex.append(f"crop=ih*9/16:ih")
-        # Масштабирование
-        if resolution == 1080:
-            filter_complex.append("scale=1080:1920")
-        else:
-            filter_complex.append("scale=720:1280")
-        # Сабтайтлы
-        if captions and os.path.exists(ass_path):
-            filter_complex.append(f"ass={ass_path}")
-        # Аудио
-        audio_filters = ["loudnorm", "aresample=48000"]
-        # Итоговый фильтр
-        vf = ",".join(filter_complex)
-        af = ",".join(audio_filters)
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", src_video,
-            "-ss", str(start), "-to", str(end),
-            "-vf", vf,
-            "-af", af,
-            "-c:v", "libx264" if fmt=="mp4" else "libvpx-vp9",
-            "-c:a", "aac" if fmt=="mp4" else "libopus",
-            "-b:v", "4M",
-            "-b:a", "192k",
-            out_path
-        ]
-        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        _, stderr = await proc.communicate()
-        if proc.returncode != 0:
-            raise RuntimeError(f"ffmpeg error: {stderr.decode(errors='ignore')}")
-        outputs.append(out_path)
-    return outputs
+        if not (seg.get("captions", True) and os.path.exists(ass_path)):
+            ass_path = None
+        key = output_key(source_sha1, seg, resolution, fmt, options,
+                         file_sha1(track_path) if track is not None else None, file_sha1(ass_path))
+        out_path = os.path.join(MEDIA_OUTPUTS, f"{key}.{fmt}")
+        items.append({"seg": seg, "key": key, "out_path": out_path, "track": track, "ass_path": ass_path,
+                      "cached": os.path.exists(out_path)})
+    return {"job_id": job_id, "src_video": src_video, "resolution": resolution, "format": fmt,
+            "options": options, "items": items, "source_size": probe_size(src_video)}
+
+def probe_size(path: str) -> Optional[Tuple[int, int]]:
+    """(ширина, высота) первого видеопотока; None, если ffprobe недоступен или не разобрал файл."""
+    try:
+        out = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height",
+                              "-of", "csv=p=0:s=x", path], capture_output=True, text=True, timeout=30)
+        width, height = out.stdout.strip().split("x")[:2]
+        return int(width), int(height)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+def probe_duration(path: str) -> Optional[float]:
+    try:
+        out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+                             capture_output=True, text=True, timeout=30)
+        return round(float(out.stdout.strip()), 3)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+def output_entry(job_id: str, item: Dict) -> Dict:
+    seg = item["seg"]
+    name = os.path.basename(item["out_path"])
+    entry = {"id": seg["id"], "start": seg["start"], "end": seg["end"], "file": name,
+             "url": f"/api/job/{job_id}/clips/{name}", "cached": item["cached"], "status": "pending"}
+    if os.path.exists(item["out_path"]):
+        duration = probe_duration(item["out_path"])
+        entry.update(status="ready", size=os.path.getsize(item["out_path"]),
+                     duration=duration if duration is not None else round(seg["end"] - seg["start"], 3))
+    return entry
+
+def manifest_path(job_id: str, render_id: str) -> str:
+    return os.path.join(MEDIA_WORK, job_id, "renders", f"{render_id}.json")
+
+def write_manifest(manifest: Dict):
+    path = manifest_path(manifest["job_id"], manifest["render_id"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_manifest(job_id: str, render_id: Optional[str] = None) -> Optional[Dict]:
+    """Манифест рендера по id или последний рендер задачи."""
+    if render_id:
+        path = manifest_path(job_id, render_id)
+    else:
+        paths = sorted(glob.glob(manifest_path(job_id, "*")), key=os.path.getmtime)
+        path = paths[-1] if paths else None
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def job_owns_clip(job_id: str, name: str) -> bool:
+    """Клип из media/outputs входит в один из рендеров задачи (outputs[].file её манифестов)."""
+    if job_id != os.path.basename(job_id) or name != os.path.basename(name):
+        return False
+    for path in glob.glob(manifest_path(job_id, "*")):
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if any(o.get("file") == name for o in manifest.get("outputs", [])):
+            return True
+    return False
+
+def start_manifest(plan: Dict, render_id: str) -> Dict:
+    """Манифест нового рендера: закэшированные клипы сразу ready, весь рендер ready, если рендерить нечего."""
+    outputs = [output_entry(plan["job_id"], item) for item in plan["items"]]
+    manifest = {"job_id": plan["job_id"], "render_id": render_id, "resolution": plan["resolution"],
+                "format": plan["format"], "outputs": outputs,
+                "status": "ready" if all(o["status"] == "ready" for o in outputs) else "rendering"}
+    write_manifest(manifest)
+    return manifest
+
+# Рендеры одного ключа, идущие прямо сейчас: повторный запрос ждёт тот же ffmpeg
+_inflight: Dict[str, asyncio.Future] = {}
+
+async def render_item(plan: Dict, item: Dict):
+    job_dir = os.path.join(MEDIA_WORK, plan["job_id"])
+    seg, out_path, track = item["seg"], item["out_path"], item["track"]
+    loudness = None
+    if seg.get("loudnorm", True):
+        loudness = await measure_loudness(plan["src_video"], seg["start"], seg["end"], os.path.join(job_dir, "loudness"))
+    crop_script = None
+    if track and seg.get("reframe", True):
+        crop_script = write_crop_script(track, seg, os.path.join(job_dir, "tracks", f"{seg['id']}.cmd"))
+    # Пишем во временный файл: недописанный клип не должен выглядеть как готовый кэш
+    tmp_path = f"{os.path.splitext(out_path)[0]}.tmp{os.getpid()}.{plan['format']}"
+    cmd = build_render_cmd(plan["src_video"], seg, tmp_path, plan["resolution"], plan["format"], plan["options"],
+                           track=track, ass_path=item["ass_path"], loudness=loudness, crop_script=crop_script,
+                           source_size=plan.get("source_size"))
+    try:
+        await run_ffmpeg_cmd(cmd)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def execute_render(plan: Dict, manifest: Dict) -> Dict:
+    """
+    Рендер недостающих клипов параллельно (не больше RENDER_CONCURRENCY ffmpeg); манифест
+    обновляется по мере готовности каждого клипа.
+    """
+    async def run_one(item, entry):
+        if entry["status"] == "ready":
+            return
+        future = _inflight.get(item["key"])
+        if future is None:
+            future = asyncio.ensure_future(render_item(plan, item))
+            _inflight[item["key"]] = future
+            future.add_done_callback(lambda _, key=item["key"]: _inflight.pop(key, None))
+        try:
+            await asyncio.shield(future)
+            entry.update(await asyncio.to_thread(output_entry, plan["job_id"], item))
+        except Exception as e:
+            entry.update(status="error", error=str(e))
+        write_manifest(manifest)
+
+    await asyncio.gather(*(run_one(item, entry) for item, entry in zip(plan["items"], manifest["outputs"])))
+    manifest["status"] = "error" if any(o["status"] == "error" for o in manifest["outputs"]) else "ready"
+    write_manifest(manifest)
+    return manifest
+
+async def render_segments(job_id: str, segments: List[Dict], resolution: int = 720, fmt: str = "mp4",
+                          options: Optional[Dict] = None, render_id: Optional[str] = None) -> Dict:
+    """
+    Рендер сегментов параллельно, не больше RENDER_CONCURRENCY процессов ffmpeg одновременно.
+    options: preset/crf/threads/bitrate для энкодера (см. DEFAULT_OPTIONS). Возвращает манифест.
+    """
+    plan = await asyncio.to_thread(plan_render, job_id, segments, resolution, fmt, options)
+    manifest = await asyncio.to_thread(start_manifest, plan, render_id or uuid.uuid4().hex[:12])
+    if manifest["status"] == "ready":
+        return manifest
+    return await execute_render(plan, manifest)
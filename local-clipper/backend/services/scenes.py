@@ -0,0 +1,118 @@
+"""
+Scene detection: low-res, reduced-fps decode through an ffmpeg pipe, batched NumPy HSV frame differences, boundaries cached by source SHA1.
+"""
+import os
+import subprocess
+import numpy as np
+from typing import List, Optional, Tuple
+from ..utils import cached_sha1
+from ..cache import artifacts
+from .proxy import proxy_params
+
+# Частота анализа и размер кадра: для поиска склеек хватает 5 кадров/с и 160x90
+SCENE_FPS = float(os.environ.get("SCENE_FPS", 5))
+SCENE_WIDTH = 160
+SCENE_HEIGHT = 90
+# Порог среднего изменения HSV (шкала как у ContentDetector: 0-255, H в 0-180)
+SCENE_THRESHOLD = float(os.environ.get("SCENE_THRESHOLD", 27.0))
+# Минимальная длина сцены (сек)
+SCENE_MIN_LEN = 1.0
+# Кадров на один векторный шаг
+SCENE_BATCH = 256
+SCENES_VERSION = "2"
+
+
+def rgb_to_hsv(frames: np.ndarray) -> np.ndarray:
+    """
+    RGB uint8 (..., 3) -> HSV float32 в шкале OpenCV (H 0-180, S и V 0-255), без цикла по кадрам.
+    """
+    rgb = frames.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    v = rgb.max(axis=-1)
+    delta = v - rgb.min(axis=-1)
+    s = np.where(v > 0, delta / np.maximum(v, 1e-6) * 255.0, 0.0)
+    safe = np.maximum(delta, 1e-6)
+    h = np.where(v == r, (g - b) / safe, np.where(v == g, 2.0 + (b - r) / safe, 4.0 + (r - g) / safe))
+    h = np.where(delta > 0, (h * 30.0) % 180.0, 0.0)
+    return np.stack([h, s, v], axis=-1).astype(np.float32)
+
+
+def frame_scores(hsv: np.ndarray, prev: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Оценка изменения для каждого кадра батча относительно предыдущего (среднее |dH|, |dS|, |dV|).
+    prev — последний кадр прошлого батча; для самого первого кадра видео оценка 0.
+    """
+    if prev is None:
+        prev = hsv[:1]
+    else:
+        prev = prev[None]
+    shifted = np.concatenate([prev, hsv[:-1]], axis=0)
+    return np.abs(hsv - shifted).reshape(len(hsv), -1, 3).mean(axis=1).mean(axis=1)
+
+
+def scene_cuts(scores: np.ndarray, fps: float = SCENE_FPS, threshold: float = SCENE_THRESHOLD,
+               min_len: float = SCENE_MIN_LEN) -> List[float]:
+    """Времена склеек: кадры с оценкой выше порога, не ближе min_len к предыдущей склейке."""
+    min_frames = max(1, int(round(min_len * fps)))
+    cuts = []
+    last = 0
+    for i in np.flatnonzero(scores >= threshold):
+        if i - last >= min_frames:
+            cuts.append(float(i / fps))
+            last = i
+    return cuts
+
+
+def cuts_to_scenes(cuts: List[float], duration: float) -> List[Tuple[float, float]]:
+    bounds = [0.0] + [c for c in cuts if 0.0 < c < duration] + [duration]
+    return [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+
+def decode_scores(video_path: str, fps: float = SCENE_FPS) -> Tuple[np.ndarray, int]:
+    """
+    Декодирует видео ffmpeg'ом сразу в маленький RGB на пониженной частоте и считает оценки
+    изменения батчами по SCENE_BATCH кадров. Возвращает (оценки, число кадров).
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", video_path, "-an", "-sn", "-dn",
+        "-vf", f"fps={fps},scale={SCENE_WIDTH}:{SCENE_HEIGHT}:flags=fast_bilinear",
+        "-pix_fmt", "rgb24", "-f", "rawvideo", "-",
+    ]
+    frame_bytes = SCENE_WIDTH * SCENE_HEIGHT * 3
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=frame_bytes * SCENE_BATCH)
+    scores, prev, n = [], None, 0
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes * SCENE_BATCH)
+            count = len(buf) // frame_bytes
+            if count == 0:
+                break
+            frames = np.frombuffer(buf[:count * frame_bytes], dtype=np.uint8).reshape(count, SCENE_HEIGHT, SCENE_WIDTH, 3)
+            hsv = rgb_to_hsv(frames)
+            scores.append(frame_scores(hsv, prev))
+            prev = hsv[-1]
+            n += count
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {stderr.decode(errors='ignore')}")
+    return (np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)), n
+
+
+def detect_scenes(video_path: str, source_sha1: str = None) -> List[Tuple[float, float]]:
+    """Список сцен (start, end) в секундах; результат кэшируется по SHA1 исходника и параметрам."""
+    source_sha1 = source_sha1 or cached_sha1(video_path)
+    params = {"fps": SCENE_FPS, "size": [SCENE_WIDTH, SCENE_HEIGHT], "threshold": SCENE_THRESHOLD, "min_len": SCENE_MIN_LEN,
+              "proxy": proxy_params(video_path)}
+    cache_key = artifacts.key(source_sha1, "scenes", params, SCENES_VERSION)
+    cached = artifacts.get_json(cache_key, "scenes")
+    if cached is not None:
+        return [tuple(s) for s in cached]
+    scores, n = decode_scores(video_path, SCENE_FPS)
+    scenes = cuts_to_scenes(scene_cuts(scores), n / SCENE_FPS)
+    artifacts.put_json(cache_key, "scenes", scenes, params)
+    return scenes
@@ -33,14 +33,58 @@ PALETTES = {
     "shadowed": {"primary": "#fff", "outline": "#000", "shadow": "#000"}
 }
 
+# Базовая геометрия и шрифт субтитров (координаты ASS — в PlayRes вертикального клипа 9:16)
+PLAY_RES = (1080, 1920)
+STYLE_DEFAULTS = {
+    "font": "Arial",
+    "size": 72,
+    "bold": True,
+    "outline_width": 4,
+    "shadow_depth": 0,
+    # Цвет ещё не произнесённых слов при караоке (\k)
+    "secondary": "#ffffff",
+    "max_lines": 2,
+    "max_words": 6,
+    # Отступ снизу: выше интерфейса плееров коротких видео
+    "margin_v": 360,
+}
+
 def get_style_preset(preset_name: str) -> dict:
+    """Пресет: значения по умолчанию + палитра PALETTES + переопределения из presets.json."""
+    overrides = {}
     if os.path.exists(PRESETS_PATH):
         with open(PRESETS_PATH, encoding='utf-8') as f:
             presets = json.load(f)
-        return presets.get(preset_name, presets.get("clean", {}))
-    return PALETTES.get(preset_name, PALETTES["clean"])
+        overrides = presets.get(preset_name, presets.get("clean", {}))
+    palette = PALETTES.get(preset_name, PALETTES["clean"])
+    return {**STYLE_DEFAULTS, **palette, **overrides}
+
+def ass_color(color: str, alpha: int = 0) -> str:
+    """#rgb / #rrggbb -> &HAABBGGRR (в ASS порядок байтов BGR)."""
+    value = color.lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    r, g, b = value[0:2], value[2:4], value[4:6]
+    return f"&H{alpha:02X}{b}{g}{r}".upper()
 
 def generate_ass_style(preset_name: str) -> str:
     style = get_style_preset(preset_name)
-    # Минимальный ASS стиль
-    return f"Style: Default,Arial,48,{style.get('primary','#fff')},{style.get('outline','#000')},{style.get('shadow','#000')},0,0,1,3,1,2,10,10,10,1"
+    return (
+        f"Style: Default,{style['font']},{style['size']},{ass_color(style.get('primary', '#fff'))},"
+        f"{ass_color(style.get('secondary', '#fff'))},{ass_color(style.get('outline', '#000'))},"
+        f"{ass_color(style.get('shadow', '#000'), 0x80)},{-1 if style['bold'] else 0},0,0,0,100,100,0,0,1,"
+        f"{style['outline_width']},{style['shadow_depth']},2,{SAFE_MARGINS['left']},{SAFE_MARGINS['right']},"
+        f"{style['margin_v']},1"
+    )
+
+def generate_ass_header(preset_name: str) -> str:
+    return (
+        "[Script Info]\nTitle: Caption\nScriptType: v4.00+\nWrapStyle: 2\n"
+        f"PlayResX: {PLAY_RES[0]}\nPlayResY: {PLAY_RES[1]}\nScaledBorderAndShadow: yes\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, "
+        "Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding\n"
+        f"{generate_ass_style(preset_name)}\n\n"
+        "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
@@ -1,65 +1,247 @@
 """
-Local title/hook/hashtags generation via Ollama, fallback to empty, cache meta/{seg_id}.json.
+Local title/hook/hashtags generation via Ollama: async pooled client with bounded concurrency, bulk and streaming generation, prompt-hash cache, meta/{seg_id}.json per job.
 """
 import os
+import re
 import json
-import requests
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 os.makedirs(MEDIA_WORK, exist_ok=True)
+META_CACHE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'cache', 'meta'))
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "qwen2.5:3b")
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+# Одновременных запросов к Ollama (модель всё равно обслуживает их почти последовательно)
+OLLAMA_CONCURRENCY = int(os.environ.get("OLLAMA_CONCURRENCY", 2))
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", 120))
 
-async def generate_meta(job_id, seg_id, transcript_text):
-    meta_dir = os.path.join(MEDIA_WORK, job_id, "meta")
-    os.makedirs(meta_dir, exist_ok=True)
-    meta_path = os.path.join(meta_dir, f"{seg_id}.json")
-    if os.path.exists(meta_path):
-        with open(meta_path, encoding='utf-8') as f:
-            return json.load(f)
-    prompt = f"""
+EMPTY_META = {"titles": [], "hooks": [], "hashtags": []}
+
+PROMPT_TEMPLATE = """
 На основе текста сегмента сгенерируй:
 - 5 коротких title (<=70 символов)
 - 3 hook (1 фраза)
 - 10 hashtags (без #)
+Ответ — JSON с ключами "titles", "hooks", "hashtags".
 Текст:
-{transcript_text}
+{text}
 """
+
+
+def build_prompt(transcript_text: str) -> str:
+    return PROMPT_TEMPLATE.format(text=transcript_text.strip())
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    return hashlib.sha1(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class OllamaClient:
+    """
+    Один httpx.AsyncClient на процесс: keep-alive соединения переиспользуются между запросами,
+    одновременных генераций не больше OLLAMA_CONCURRENCY. Ответы кэшируются по хэшу (модель + промпт)
+    в media/cache/meta, одинаковые промпты в полёте объединяются в один запрос.
+    """
+    def __init__(self, host: str = OLLAMA_HOST, model: str = OLLAMA_MODEL, concurrency: int = OLLAMA_CONCURRENCY,
+                 cache_dir: str = META_CACHE):
+        self.host = host.rstrip("/")
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.cache_dir = cache_dir
+        self._client = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.host,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # --- Кэш по хэшу промпта ---
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def cached(self, prompt: str) -> Optional[Dict]:
+        path = self._cache_path(prompt_key(self.model, prompt))
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def _store(self, prompt: str, meta: Dict):
+        if not has_meta(meta):
+            # Пустой разбор не кэшируем: следующий запрос снова спросит модель
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(prompt_key(self.model, prompt))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    # --- Генерация ---
+    async def _request(self, prompt: str) -> Dict:
+        client = self._http()
+        async with self._slots:
+            resp = await client.post("/api/generate", json={"model": self.model, "prompt": prompt, "stream": False, "format": "json"})
+        resp.raise_for_status()
+        return parse_ollama_response(resp.json().get("response", ""))
+
+    async def generate(self, prompt: str) -> Dict:
+        """Мета по промпту: из кэша, из уже идущего такого же запроса или новым запросом."""
+        meta = self.cached(prompt)
+        if meta is not None:
+            return meta
+        key = prompt_key(self.model, prompt)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._request(prompt))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, prompt, f))
+        # Отмена одного ждущего (клиент закрыл соединение) не отменяет общий запрос остальным
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, prompt: str, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._store(prompt, future.result())
+
+    async def stream(self, prompt: str) -> AsyncIterator[Tuple[str, Optional[Dict]]]:
+        """
+        Потоковая генерация: ("token", None) по мере ответа модели, в конце ("", meta).
+        Закэшированный промпт отдаётся сразу одним финальным событием.
+        """
+        meta = self.cached(prompt)
+        if meta is not None:
+            yield "", meta
+            return
+        client = self._http()
+        parts: List[str] = []
+        async with self._slots:
+            async with client.stream("POST", "/api/generate",
+                                     json={"model": self.model, "prompt": prompt, "stream": True, "format": "json"}) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response", "")
+                    if token:
+                        parts.append(token)
+                        yield token, None
+                    if chunk.get("done"):
+                        break
+        meta = parse_ollama_response("".join(parts))
+        self._store(prompt, meta)
+        yield "", meta
+
+
+client = OllamaClient()
+
+
+def _meta_path(job_id: str, seg_id: str) -> str:
+    meta_dir = os.path.join(MEDIA_WORK, job_id, "meta")
+    os.makedirs(meta_dir, exist_ok=True)
+    return os.path.join(meta_dir, f"{seg_id}.json")
+
+
+def _save_job_meta(job_id: str, seg_id: str, meta: Dict):
+    if not has_meta(meta):
+        return
+    with open(_meta_path(job_id, seg_id), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+async def generate_meta(job_id, seg_id, transcript_text):
+    meta_path = _meta_path(job_id, seg_id)
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
     try:
-        resp = requests.post(OLLAMA_URL, json={
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "stream": False
-        }, timeout=30)
-        if resp.status_code == 200:
-            data = resp.json()
-            # Простейший парсер (ожидается json или текст с разделителями)
-            out = parse_ollama_response(data.get("response", ""))
-            with open(meta_path, "w", encoding="utf-8") as f:
-                json.dump(out, f, ensure_ascii=False, indent=2)
-            return out
+        out = await client.generate(build_prompt(transcript_text))
     except Exception:
-        pass
-    # Fallback
-    out = {"titles": [], "hooks": [], "hashtags": []}
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+        # Fallback: Ollama недоступна — пустая мета, без записи в кэш (повторим в следующий раз)
+        return dict(EMPTY_META)
+    _save_job_meta(job_id, seg_id, out)
     return out
 
+
+async def generate_meta_bulk(job_id, segments: List[Tuple[str, str]]) -> Dict[str, Dict]:
+    """Мета для всех сегментов задачи [(seg_id, текст)] параллельно в пределах OLLAMA_CONCURRENCY."""
+    results = await asyncio.gather(*(generate_meta(job_id, seg_id, text) for seg_id, text in segments))
+    return {seg_id: meta for (seg_id, _), meta in zip(segments, results)}
+
+
+async def stream_meta(job_id, seg_id, transcript_text) -> AsyncIterator[Dict]:
+    """События для UI: {"token": ...} по мере генерации и {"meta": ...} в конце."""
+    meta_path = _meta_path(job_id, seg_id)
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            yield {"meta": json.load(f)}
+        return
+    try:
+        async for token, meta in client.stream(build_prompt(transcript_text)):
+            if meta is None:
+                yield {"token": token}
+            else:
+                _save_job_meta(job_id, seg_id, meta)
+                yield {"meta": meta}
+    except Exception as e:
+        yield {"meta": dict(EMPTY_META), "error": str(e)}
+
+
+def has_meta(meta: Dict) -> bool:
+    return any(meta.get(k) for k in EMPTY_META)
+
+
+def as_items(value, key: str) -> List[str]:
+    """
+    Значение поля ответа -> список строк. Маленькие модели часто отдают строку вместо списка:
+    это один элемент, а хэштеги в строке ("#a #b", "a, b") делятся по пробелам и запятым.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        items = re.split(r"[\s,]+", value) if key == "hashtags" else [value]
+    elif isinstance(value, (list, tuple)):
+        items = [str(v) for v in value if v is not None]
+    else:
+        items = [str(value)]
+    if key == "hashtags":
+        items = [item.strip().lstrip("#") for item in items]
+    return [item.strip() for item in items if item.strip()]
+
+
 def parse_ollama_response(text):
     # Ожидается json или текст с разделителями
     try:
-        return json.loads(text)
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return {k: as_items(data.get(k), k) for k in EMPTY_META}
     except Exception:
-        # Попробуем парсить вручную
-        lines = text.splitlines()
-        titles, hooks, hashtags = [], [], []
-        for l in lines:
-            l = l.strip()
-            if l.lower().startswith("title"):
-                titles.append(l.split(":",1)[-1].strip())
-            elif l.lower().startswith("hook"):
-                hooks.append(l.split(":",1)[-1].strip())
-            elif l.lower().startswith("hashtag"):
-                hashtags.append(l.split(":",1)[-1].strip().replace("#", ""))
-        return {"titles": titles, "hooks": hooks, "hashtags": hashtags}
+        pass
+    # Попробуем парсить вручную
+    lines = text.splitlines()
+    titles, hooks, hashtags = [], [], []
+    for l in lines:
+        l = l.strip()
+        if l.lower().startswith("title"):
+            titles.append(l.split(":",1)[-1].strip())
+        elif l.lower().startswith("hook"):
+            hooks.append(l.split(":",1)[-1].strip())
+        elif l.lower().startswith("hashtag"):
+            hashtags.append(l.split(":",1)[-1].strip().replace("#", ""))
+    return {"titles": titles, "hooks": hooks, "hashtags": hashtags}
@@ -0,0 +1,180 @@
+"""
+Subject tracking for reframing: IOU/centroid tracker across sparse samples, primary-subject hysteresis, dead-zone virtual camera, one-euro smoothing.
+"""
+import math
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Сопоставление детекций с треками: IOU или близость центров (в размерах лица) при редкой выборке
+MIN_IOU = 0.2
+MAX_CENTER_DIST = 1.5
+# Сколько сэмплов подряд трек живёт без детекций
+MAX_MISSES = 4
+# Смена главного лица: соперник должен быть сильнее на SWITCH_MARGIN в течение SWITCH_HOLD сэмплов
+SWITCH_MARGIN = 1.3
+SWITCH_HOLD = 3
+# Мёртвая зона камеры (доля ширины кадра): внутри неё движение лица камеру не двигает
+DEAD_ZONE = 0.04
+# Прыжок цели больше CUT_JUMP — склейка/смена плана: камера переставляется, а не панорамирует
+CUT_JUMP = 0.25
+CUT_DURATION = 0.04
+# One-euro: минимальная частота среза (Гц), рост среза со скоростью, срез для производной
+EURO_MIN_CUTOFF = 0.4
+EURO_BETA = 1.5
+EURO_D_CUTOFF = 1.0
+
+Detection = Tuple[float, float, float, float]  # cx, cy, size, score (доли кадра)
+
+
+def box_iou(a: Detection, b: Detection) -> float:
+    """IOU квадратов со стороной size вокруг центров (детектор отдаёт центр и размер лица)."""
+    ax0, ay0, ax1, ay1 = a[0] - a[2] / 2, a[1] - a[2] / 2, a[0] + a[2] / 2, a[1] + a[2] / 2
+    bx0, by0, bx1, by1 = b[0] - b[2] / 2, b[1] - b[2] / 2, b[0] + b[2] / 2, b[1] + b[2] / 2
+    iw = max(0.0, min(ax1, bx1) - max(ax0, bx0))
+    ih = max(0.0, min(ay1, by1) - max(ay0, by0))
+    inter = iw * ih
+    union = a[2] ** 2 + b[2] ** 2 - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    """
+    Треки лиц между сэмплами: жадное сопоставление по IOU, при нулевом IOU — по расстоянию центров.
+    Главное лицо выбирается по накопленному весу (размер x уверенность) с гистерезисом.
+    """
+    def __init__(self):
+        self.tracks: Dict[int, Dict] = {}
+        self._next_id = 0
+        self.primary: Optional[int] = None
+        self._challenger: Optional[int] = None
+        self._challenge = 0
+
+    def _match_score(self, track: Dict, det: Detection) -> float:
+        iou = box_iou(track["box"], det)
+        if iou >= MIN_IOU:
+            return 1.0 + iou
+        dist = math.hypot(track["box"][0] - det[0], track["box"][1] - det[1]) / max(track["box"][2], det[2], 1e-6)
+        return 1.0 - dist / MAX_CENTER_DIST if dist < MAX_CENTER_DIST else 0.0
+
+    def update(self, detections: Sequence[Detection]) -> Optional[Detection]:
+        """Шаг трекера; возвращает детекцию главного лица на этом сэмпле или None."""
+        pairs = sorted(
+            ((self._match_score(track, det), tid, j) for tid, track in self.tracks.items() for j, det in enumerate(detections)),
+            reverse=True,
+        )
+        used_tracks, used_dets = set(), set()
+        for score, tid, j in pairs:
+            if score <= 0.0 or tid in used_tracks or j in used_dets:
+                continue
+            track = self.tracks[tid]
+            track.update(box=detections[j], misses=0, seen=True)
+            track["weight"] = 0.7 * track["weight"] + 0.3 * detections[j][2] * detections[j][3]
+            used_tracks.add(tid)
+            used_dets.add(j)
+        for tid, track in list(self.tracks.items()):
+            if tid not in used_tracks:
+                track["misses"] += 1
+                track["seen"] = False
+                if track["misses"] > MAX_MISSES:
+                    del self.tracks[tid]
+        for j, det in enumerate(detections):
+            if j not in used_dets:
+                self.tracks[self._next_id] = {"box": det, "misses": 0, "seen": True, "weight": 0.3 * det[2] * det[3]}
+                self._next_id += 1
+        self._select_primary()
+        track = self.tracks.get(self.primary)
+        return track["box"] if track is not None and track["seen"] else None
+
+    def _select_primary(self):
+        if not self.tracks:
+            self.primary = None
+            return
+        best = max(self.tracks, key=lambda tid: self.tracks[tid]["weight"])
+        if self.primary not in self.tracks:
+            self.primary, self._challenger, self._challenge = best, None, 0
+            return
+        if best == self.primary or self.tracks[best]["weight"] < SWITCH_MARGIN * self.tracks[self.primary]["weight"]:
+            self._challenger, self._challenge = None, 0
+            return
+        self._challenge = self._challenge + 1 if best == self._challenger else 1
+        self._challenger = best
+        if self._challenge >= SWITCH_HOLD:
+            self.primary, self._challenger, self._challenge = best, None, 0
+
+
+class OneEuroFilter:
+    """One-euro фильтр (Casiez et al.) для неравномерных отсчётов: сильное сглаживание в покое, малая задержка в движении."""
+    def __init__(self, min_cutoff: float = EURO_MIN_CUTOFF, beta: float = EURO_BETA, d_cutoff: float = EURO_D_CUTOFF):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self, value: Optional[float] = None, t: Optional[float] = None):
+        self.x, self.dx, self.t = value, 0.0, t
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, value: float, t: float) -> float:
+        if self.x is None or t <= self.t:
+            self.reset(value, t)
+            return value
+        dt = t - self.t
+        a_d = self._alpha(self.d_cutoff, dt)
+        self.dx = a_d * (value - self.x) / dt + (1 - a_d) * self.dx
+        cutoff = self.min_cutoff + self.beta * abs(self.dx)
+        a = self._alpha(cutoff, dt)
+        self.x = a * value + (1 - a) * self.x
+        self.t = t
+        return self.x
+
+
+def dead_zone(camera: float, target: float, zone: float = DEAD_ZONE) -> float:
+    """Камера сдвигается, только когда цель выходит из зоны ±zone, и ровно до её края."""
+    if target > camera + zone:
+        return target - zone
+    if target < camera - zone:
+        return target + zone
+    return camera
+
+
+def smooth_track(times: Sequence[float], detections: Sequence[Optional[Sequence[Detection]]]) -> List[Dict]:
+    """
+    Трек окна кадрирования по редким сэмплам: трекер выбирает главное лицо, пропуски держат
+    последнюю позицию (центр кадра — только пока лицо ни разу не найдено), мёртвая зона гасит
+    мелкие движения, one-euro сглаживает. На склейках камера переставляется за CUT_DURATION.
+    detections[i] — список детекций сэмпла (None — кадр не прочитан, сэмпл пропускается).
+    """
+    tracker = FaceTracker()
+    filters = {k: OneEuroFilter() for k in ("center_x", "center_y", "zoom")}
+    camera = None
+    frames: List[Dict] = []
+    for t, dets in zip(times, detections):
+        if dets is None:
+            continue
+        target = tracker.update(dets)
+        if target is None:
+            target = (camera["center_x"], camera["center_y"], camera["zoom"], 0.0) if camera else (0.5, 0.5, 0.5, 0.0)
+        raw = {"center_x": target[0], "center_y": target[1], "zoom": target[2]}
+        if camera is not None and abs(raw["center_x"] - camera["center_x"]) > CUT_JUMP:
+            # Смена плана: фиксируем старую позицию перед скачком и сбрасываем фильтры
+            frames.append({**camera, "t": float(t) - CUT_DURATION})
+            for k, f in filters.items():
+                f.reset(raw[k], float(t))
+            camera = dict(raw)
+        else:
+            if camera is not None:
+                raw["center_x"] = dead_zone(camera["center_x"], raw["center_x"])
+                raw["center_y"] = dead_zone(camera["center_y"], raw["center_y"])
+            camera = {k: filters[k](raw[k], float(t)) for k in filters}
+        frames.append({**{k: float(v) for k, v in camera.items()}, "t": float(t)})
+    return frames
+
+
+def jitter(values: Sequence[float]) -> float:
+    """Средний модуль второй разности: мера дрожания траектории."""
+    arr = np.asarray(values, dtype=np.float64)
+    return float(np.abs(np.diff(arr, n=2)).mean()) if len(arr) > 2 else 0.0
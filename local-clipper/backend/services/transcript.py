@@ -2,62 +2,150 @@
 Local ASR with faster-whisper, VAD (silero-vad), audio extraction, language detection, caching.
 """
 import os
-import hashlib
 import json
-import torch
 import numpy as np
-from faster_whisper import WhisperModel
-from typing import Optional
+from typing import List, Optional, Tuple
+from ..utils import cached_sha1
+from ..cache import artifacts
+from ..models.registry import registry
+from .transcript_index import TranscriptIndex, index_path
 
 MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
 os.makedirs(MEDIA_WORK, exist_ok=True)
 
-# Silero VAD
-try:
-    import torch
-    vad_model, utils = torch.hub.load(
-        repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=False, trust_repo=True)
-    (get_speech_timestamps, save_audio, read_audio, VAD_SAMPLE_RATE) = utils
-except Exception:
-    vad_model = None
-    get_speech_timestamps = None
-    read_audio = None
-    VAD_SAMPLE_RATE = 16000
+VAD_SAMPLE_RATE = 16000
 
 # Модель whisper и параметры
-WHISPER_MODEL = None
 WHISPER_MODEL_SIZE = os.environ.get("MODEL_SIZE", "small")
 WHISPER_DEVICE = os.environ.get("DEVICE", "auto")
 WHISPER_COMPUTE = os.environ.get("WHISPER_COMPUTE", "auto")
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", 8))
+WHISPER_BEAM_SIZE = int(os.environ.get("WHISPER_BEAM_SIZE", 5))
+# Окна для батча: VAD-регионы склеиваются в окна не длиннее контекста whisper
+ASR_WINDOW = 30.0
+# Версия формата транскрипта в общем кэше артефактов
+TRANSCRIPT_VERSION = "2"
 
 def get_device_and_compute():
     if WHISPER_DEVICE == "auto":
+        import torch
         if torch.cuda.is_available():
             return "cuda", "float16"
         else:
             return "cpu", "int8_float16"
     return WHISPER_DEVICE, WHISPER_COMPUTE
 
+# --- Фабрики моделей для реестра (вызываются один раз на процесс) ---
+def create_whisper_model():
+    from faster_whisper import WhisperModel
+    device, compute_type = get_device_and_compute()
+    return WhisperModel(WHISPER_MODEL_SIZE, device=device, compute_type=compute_type)
+
+def create_batched_pipeline():
+    from faster_whisper import BatchedInferencePipeline
+    return BatchedInferencePipeline(model=registry.get("whisper"))
+
+def create_vad():
+    """Silero VAD: (model, get_speech_timestamps, read_audio)."""
+    import torch
+    vad_model, utils = torch.hub.load(
+        repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=False, trust_repo=True)
+    (get_speech_timestamps, save_audio, read_audio, _) = utils
+    return vad_model, get_speech_timestamps, read_audio
+
 def load_model():
-    global WHISPER_MODEL
-    if WHISPER_MODEL is None:
-        device, compute_type = get_device_and_compute()
-        WHISPER_MODEL = WhisperModel(WHISPER_MODEL_SIZE, device=device, compute_type=compute_type)
-    return WHISPER_MODEL
-
-def sha1_of_file(path):
-    h = hashlib.sha1()
-    with open(path, 'rb') as f:
-        while True:
-            chunk = f.read(8192)
-            if not chunk:
-                break
-            h.update(chunk)
-    return h.hexdigest()
+    return registry.get("whisper")
+
+def load_pipeline():
+    try:
+        return registry.get("whisper_batched")
+    except ImportError:
+        # faster-whisper без батч-пайплайна
+        return None
+
+_vad_unavailable = False
+
+def load_vad():
+    global _vad_unavailable
+    if _vad_unavailable:
+        return None
+    try:
+        return registry.get("silero_vad")
+    except Exception:
+        # Без VAD всё аудио идёт одним регионом; повторно torch.hub не дёргаем
+        _vad_unavailable = True
+        return None
+
+def read_audio(path, sampling_rate=VAD_SAMPLE_RATE):
+    vad = load_vad()
+    if vad is not None:
+        return vad[2](path, sampling_rate=sampling_rate)
+    from faster_whisper import decode_audio
+    return decode_audio(path, sampling_rate=sampling_rate)
+
+def merge_windows(speech_segments: List[Tuple[int, int]], sample_rate: int, max_window: float = ASR_WINDOW) -> List[Tuple[int, int]]:
+    """
+    Склеивает соседние VAD-регионы в окна до max_window секунд (тишина внутри окна допустима),
+    регионы длиннее окна режутся. Короткие регионы не теряются, а попадают в окно соседей.
+    """
+    max_len = int(max_window * sample_rate)
+    windows = []
+    for start, end in speech_segments:
+        while end - start > max_len:
+            windows.append((start, start + max_len))
+            start += max_len
+        if windows and end - windows[-1][0] <= max_len and start >= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return windows
+
+def segment_to_dict(seg, offset=0.0):
+    """Сегмент faster-whisper -> dict с абсолютными (от начала файла) временами."""
+    words = [{"word": w.word, "start": w.start + offset, "end": w.end + offset, "confidence": w.probability} for w in (seg.words or [])]
+    return {
+        "start": seg.start + offset,
+        "end": seg.end + offset,
+        "text": seg.text.strip(),
+        "words": words,
+        "confidence": float(np.mean([w["confidence"] for w in words])) if words else 1.0
+    }
+
+def run_asr(audio, windows, sample_rate, lang=None, batch_size=WHISPER_BATCH_SIZE):
+    """
+    Распознаёт окна (в сэмплах). С батч-пайплайном все окна идут одним вызовом пачками по batch_size
+    (он сам возвращает время от начала файла); без него — по окну со сдвигом на начало окна.
+    Возвращает (сегменты, язык).
+    """
+    if not windows:
+        return [], lang or "auto"
+    pipeline = load_pipeline() if batch_size > 1 else None
+    segments = []
+    if pipeline is not None:
+        # clip_timestamps в секундах (faster-whisper >= 1.2; в 1.1.x пайплайн ждал смещения в сэмплах)
+        clips = [{"start": start / sample_rate, "end": end / sample_rate} for start, end in windows]
+        result, info = pipeline.transcribe(audio, language=lang, clip_timestamps=clips, batch_size=batch_size,
+                                           word_timestamps=True, beam_size=WHISPER_BEAM_SIZE)
+        segments = [segment_to_dict(seg) for seg in result]
+        return segments, info.language
+    model = load_model()
+    language = lang
+    for start, end in windows:
+        result, info = model.transcribe(audio[start:end], language=language, vad_filter=False,
+                                        word_timestamps=True, beam_size=WHISPER_BEAM_SIZE)
+        segments.extend(segment_to_dict(seg, start / sample_rate) for seg in result)
+        # Язык определяется по первому окну и фиксируется для остальных
+        language = language or info.language
+    return segments, language or "auto"
 
 def vad_split(audio, sample_rate):
-    if get_speech_timestamps is None:
+    vad = load_vad()
+    if vad is None:
         return [(0, len(audio))]
+    vad_model, get_speech_timestamps, _ = vad
+    if isinstance(audio, np.ndarray):
+        import torch
+        audio = torch.from_numpy(audio)
     speech = get_speech_timestamps(audio, vad_model, sampling_rate=sample_rate)
     return [(s['start'], s['end']) for s in speech]
 
@@ -76,60 +164,139 @@ def format_time(seconds):
     ms = int((seconds - int(seconds)) * 1000)
     return f"{h:02}:{m:02}:{s:02},{ms:03}"
 
-async def transcribe(audio_path, job_data):
-    """
-    Транскрипция с VAD, word-level timestamps, автоязык, кэш по SHA1.
-    """
-    job_id = job_data["job_id"]
-    job_dir = os.path.join(MEDIA_WORK, job_id)
-    os.makedirs(job_dir, exist_ok=True)
-    audio_sha1 = sha1_of_file(audio_path)
-    cache_json = os.path.join(job_dir, f"transcript_{audio_sha1}.json")
-    cache_srt = os.path.join(job_dir, f"transcript_{audio_sha1}.srt")
-    if os.path.exists(cache_json) and os.path.exists(cache_srt):
-        with open(cache_json, encoding='utf-8') as f:
-            return json.load(f)
-    # VAD
-    audio = read_audio(audio_path, sampling_rate=VAD_SAMPLE_RATE)
-    speech_segments = vad_split(audio, VAD_SAMPLE_RATE)
-    # Whisper
-    model = load_model()
-    lang = job_data.get("lang")
-    segments = []
-    words = []
-    confidences = []
-    for start, end in speech_segments:
-        segment_audio = audio[start:end]
-        if len(segment_audio) < VAD_SAMPLE_RATE * 0.5:
-            continue
-        result, info = model.transcribe(segment_audio, language=lang, vad_filter=False, word_timestamps=True, beam_size=5)
-        for seg in result:
-            segments.append({
-                "start": seg.start,
-                "end": seg.end,
-                "text": seg.text.strip(),
-                "words": [{"word": w.word, "start": w.start, "end": w.end, "confidence": w.probability} for w in seg.words],
-                "confidence": np.mean([w.probability for w in seg.words]) if seg.words else 1.0
-            })
-            words.extend(seg.words)
-            confidences.extend([w.probability for w in seg.words])
-    avg_conf = float(np.mean(confidences)) if confidences else 1.0
-    language = info.get("language", "auto")
-    duration = sum([seg[1] - seg[0] for seg in speech_segments]) / VAD_SAMPLE_RATE
+def save_job_files(result, cache_json, cache_srt):
     # Сохраняем SRT и JSON
-    save_srt(segments, cache_srt)
+    save_srt(result["segments"], cache_srt)
     with open(cache_json, "w", encoding="utf-8") as f:
-        json.dump({
-            "segments": segments,
-            "words": [w.word for w in words],
-            "language": language,
-            "avg_confidence": avg_conf,
-            "duration": duration
-        }, f, ensure_ascii=False, indent=2)
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    # Колоночный индекс слов для запросов по времени (субтитры, хайлайты, мета)
+    TranscriptIndex.from_transcript(result).save(index_path(cache_json))
+
+def cache_context(audio_path, job_data):
+    """Ключи кэша транскрипта: файлы в папке задачи и запись в общем хранилище артефактов."""
+    job_dir = os.path.join(MEDIA_WORK, job_data["job_id"])
+    os.makedirs(job_dir, exist_ok=True)
+    audio_sha1 = job_data.get("audio_sha1") or cached_sha1(audio_path)
+    device, compute_type = get_device_and_compute()
+    cache_params = {"model": WHISPER_MODEL_SIZE, "device": device, "compute": compute_type, "lang": job_data.get("lang")}
     return {
+        "audio_sha1": audio_sha1,
+        "cache_json": os.path.join(job_dir, f"transcript_{audio_sha1}.json"),
+        "cache_srt": os.path.join(job_dir, f"transcript_{audio_sha1}.srt"),
+        "cache_key": artifacts.key(audio_sha1, "transcript", cache_params, TRANSCRIPT_VERSION),
+        "cache_params": cache_params,
+    }
+
+def load_cached(audio_path, job_data, ctx=None):
+    ctx = ctx or cache_context(audio_path, job_data)
+    if os.path.exists(ctx["cache_json"]) and os.path.exists(ctx["cache_srt"]):
+        with open(ctx["cache_json"], encoding='utf-8') as f:
+            return json.load(f)
+    result = artifacts.get_json(ctx["cache_key"], "transcript")
+    if result is not None:
+        save_job_files(result, ctx["cache_json"], ctx["cache_srt"])
+    return result
+
+def finalize(ctx, segments, language, speech_duration):
+    """Собирает итоговый транскрипт, сохраняет файлы задачи и кладёт в общий кэш."""
+    confidences = [w["confidence"] for seg in segments for w in seg["words"]]
+    avg_conf = float(np.mean(confidences)) if confidences else 1.0
+    result = {
         "segments": segments,
-        "words": [w.word for w in words],
+        "words": [w["word"] for seg in segments for w in seg["words"]],
         "language": language,
         "avg_confidence": avg_conf,
-        "duration": duration
+        "duration": speech_duration,
+        "audio_sha1": ctx["audio_sha1"],
+        # Ключ транскрипта (аудио + модель/устройство/язык): по нему кэшируются производные стадии
+        "transcript_key": ctx["cache_key"]
     }
+    save_job_files(result, ctx["cache_json"], ctx["cache_srt"])
+    artifacts.put_json(ctx["cache_key"], "transcript", result, ctx["cache_params"])
+    return result
+
+def transcribe(audio_path, job_data):
+    """
+    Транскрипция с VAD, word-level timestamps, автоязык, кэш по SHA1.
+    """
+    ctx = cache_context(audio_path, job_data)
+    result = load_cached(audio_path, job_data, ctx)
+    if result is not None:
+        return result
+    # VAD
+    audio = read_audio(audio_path, sampling_rate=VAD_SAMPLE_RATE)
+    speech_segments = vad_split(audio, VAD_SAMPLE_RATE)
+    # Whisper: окна ~30 с, батчами
+    windows = merge_windows(speech_segments, VAD_SAMPLE_RATE)
+    audio_np = audio.numpy() if hasattr(audio, "numpy") else np.asarray(audio, dtype=np.float32)
+    segments, language = run_asr(audio_np, windows, VAD_SAMPLE_RATE, lang=job_data.get("lang"))
+    duration = sum([seg[1] - seg[0] for seg in speech_segments]) / VAD_SAMPLE_RATE
+    return finalize(ctx, segments, language, duration)
+
+# --- Потоковый режим: аудио обрабатывается блоками, сегменты отдаются по мере готовности ---
+STREAM_BLOCK_SECONDS = float(os.environ.get("STREAM_BLOCK_SECONDS", 300))
+# Длинные записи транскрибируются потоково автоматически
+STREAMING_MIN_SECONDS = float(os.environ.get("STREAMING_MIN_SECONDS", 1200))
+
+def audio_duration(audio_path):
+    import soundfile as sf
+    return sf.info(audio_path).duration
+
+def transcribe_block(audio_path, start, end, lang=None, is_last=False):
+    """
+    Распознаёт блок [start, end) (в сэмплах), читая с диска только его.
+    Если последний речевой регион упирается в конец блока, он не распознаётся здесь, а переносится
+    в следующий блок (возвращаемая граница next_start), чтобы не резать фразу.
+    Возвращает (сегменты с абсолютными временами, язык, next_start, длительность речи).
+    """
+    import soundfile as sf
+    block, _ = sf.read(audio_path, start=start, stop=end, dtype='float32', always_2d=False)
+    sr = VAD_SAMPLE_RATE
+    speech = vad_split(block, sr)
+    cut = len(block)
+    if not is_last and speech and speech[-1][1] >= len(block) - sr // 2 and speech[-1][0] > 0:
+        cut = speech[-1][0]
+        speech = speech[:-1]
+    windows = merge_windows(speech, sr)
+    segments, language = run_asr(block, windows, sr, lang=lang)
+    offset = start / sr
+    for seg in segments:
+        seg["start"] += offset
+        seg["end"] += offset
+        for w in seg["words"]:
+            w["start"] += offset
+            w["end"] += offset
+    return segments, language, start + cut, sum(e - s for s, e in speech) / sr
+
+async def transcribe_stream(audio_path, job_data):
+    """
+    Асинхронный генератор: блоки аудио по STREAM_BLOCK_SECONDS распознаются в ASR-пуле,
+    после каждого отдаётся {"segments": новые сегменты, "until": секунд готово, "total": длительность}.
+    Последнее событие дополнительно содержит "result" — итоговый транскрипт (как у transcribe).
+    """
+    from ..executor import run_stage
+    ctx = await run_stage("transcript", cache_context, audio_path, job_data)
+    cached = await run_stage("transcript", load_cached, audio_path, job_data, ctx)
+    total = await run_stage("transcript", audio_duration, audio_path)
+    if cached is not None:
+        yield {"segments": cached["segments"], "until": total, "total": total, "result": cached}
+        return
+    sr = VAD_SAMPLE_RATE
+    total_samples = int(total * sr)
+    block = int(STREAM_BLOCK_SECONDS * sr)
+    pos = 0
+    lang = job_data.get("lang")
+    segments, speech_duration = [], 0.0
+    while pos < total_samples:
+        end = min(total_samples, pos + block)
+        new_segments, lang, pos, speech = await run_stage(
+            "transcript", transcribe_block, audio_path, pos, end, lang, end >= total_samples)
+        segments.extend(new_segments)
+        speech_duration += speech
+        event = {"segments": new_segments, "until": pos / sr, "total": total}
+        if pos >= total_samples:
+            event["result"] = await run_stage("transcript", finalize, ctx, segments, lang or "auto", speech_duration)
+        yield event
+    if total_samples == 0:
+        yield {"segments": [], "until": 0, "total": 0,
+               "result": await run_stage("transcript", finalize, ctx, [], lang or "auto", 0.0)}
@@ -0,0 +1,155 @@
+"""
+Word-level transcript index: columnar NumPy arrays (start/end/confidence/token id) with an interned token table, persisted as .npz, O(log n) time-range queries.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+MEDIA_WORK = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
+
+# Нормализация токена для поиска ключевых фраз: нижний регистр, без пунктуации по краям
+_STRIP = re.compile(r"^\W+|\W+$", re.UNICODE)
+
+
+def normalize(word: str) -> str:
+    return _STRIP.sub("", word.strip().lower())
+
+
+class TranscriptIndex:
+    """
+    Слова транскрипта в порядке времени: starts/ends/conf (float), token_ids (int32) в таблицу
+    уникальных нормализованных токенов, исходное написание слов — в words.
+    Диапазоны ищутся через searchsorted по starts, поэтому запрос стоит O(log n + k).
+    """
+    def __init__(self, starts, ends, conf, token_ids, tokens, words, language=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self.token_ids = np.asarray(token_ids, dtype=np.int32)
+        self.tokens = np.asarray(tokens, dtype=str)
+        self.words = np.asarray(words, dtype=str)
+        self.language = language
+        self._token_lookup = {t: i for i, t in enumerate(self.tokens.tolist())}
+        self._end_max = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_transcript(cls, transcript_result: Dict) -> "TranscriptIndex":
+        words = [w for seg in transcript_result.get("segments", []) for w in seg.get("words", [])]
+        words.sort(key=lambda w: w["start"])
+        lookup: Dict[str, int] = {}
+        token_ids = [lookup.setdefault(normalize(w["word"]), len(lookup)) for w in words]
+        return cls(
+            starts=[w["start"] for w in words],
+            ends=[w["end"] for w in words],
+            conf=[w.get("confidence", 1.0) for w in words],
+            token_ids=token_ids,
+            tokens=list(lookup),
+            words=[w["word"].strip() for w in words],
+            language=transcript_result.get("language"),
+        )
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, starts=self.starts, ends=self.ends, conf=self.conf, token_ids=self.token_ids,
+                 tokens=self.tokens, words=self.words, language=np.asarray(self.language or ""))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TranscriptIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["starts"], data["ends"], data["conf"], data["token_ids"], data["tokens"],
+                       data["words"], str(data["language"]) or None)
+
+    # --- Запросы по времени ---
+    def range_indices(self, start, end) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Индексы [i0, i1) слов, целиком лежащих в [start, end]; start/end — числа или массивы окон.
+        Конец ищется по накопленному максимуму концов (монотонен даже при перекрытии слов).
+        """
+        i0 = np.searchsorted(self.starts, start, side="left")
+        i1 = np.searchsorted(self._end_max, end, side="right")
+        return i0, np.maximum(i0, i1)
+
+    def slice(self, start: float, end: float) -> slice:
+        i0, i1 = self.range_indices(start, end)
+        return slice(int(i0), int(i1))
+
+    def words_in(self, start: float, end: float) -> List[Dict]:
+        sl = self.slice(start, end)
+        return [
+            {"word": w, "start": float(s), "end": float(e), "confidence": float(c)}
+            for w, s, e, c in zip(self.words[sl].tolist(), self.starts[sl], self.ends[sl], self.conf[sl])
+        ]
+
+    def text(self, start: float, end: float) -> str:
+        return " ".join(self.words[self.slice(start, end)].tolist())
+
+    # --- Ключевые фразы ---
+    def phrase_hits(self, phrases: Sequence[str]) -> np.ndarray:
+        """Для каждого слова — число ключевых фраз, начинающихся на нём (по нормализованным токенам)."""
+        hits = np.zeros(len(self), dtype=np.int32)
+        for phrase in phrases:
+            ids = [self._token_lookup.get(t) for t in map(normalize, phrase.split()) if t]
+            if not ids or None in ids or len(ids) > len(self):
+                continue
+            n = len(self) - len(ids) + 1
+            mask = np.ones(n, dtype=bool)
+            for k, token_id in enumerate(ids):
+                mask &= self.token_ids[k:k + n] == token_id
+            hits[:n] += mask
+        return hits
+
+    def count_in_ranges(self, per_word: np.ndarray, starts, ends) -> np.ndarray:
+        """Суммы per_word по словам каждого окна через префиксные суммы: O(log n) на окно."""
+        prefix = np.concatenate([[0], np.cumsum(per_word, dtype=np.int64)])
+        i0, i1 = self.range_indices(np.asarray(starts), np.asarray(ends))
+        return prefix[i1] - prefix[i0]
+
+
+def transcript_fingerprint(transcript_result: Dict) -> str:
+    """
+    Идентичность транскрипта для ключей кэша производных стадий: его ключ в хранилище артефактов,
+    а для транскриптов без ключа — SHA1 содержимого фраз.
+    """
+    if transcript_result.get("transcript_key"):
+        return transcript_result["transcript_key"]
+    segments_json = json.dumps(transcript_result.get("segments", []), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(segments_json.encode("utf-8")).hexdigest()
+
+
+def index_path(transcript_json: str) -> str:
+    return os.path.splitext(transcript_json)[0] + ".npz"
+
+
+def find_transcript(job_id: str) -> Optional[str]:
+    """Путь к транскрипту задачи (transcript_{sha1}.json в папке задачи) или None."""
+    paths = sorted(glob.glob(os.path.join(MEDIA_WORK, job_id, "transcript_*.json")), key=os.path.getmtime)
+    return paths[-1] if paths else None
+
+
+def load_index(transcript_result: Dict, job_id: str) -> TranscriptIndex:
+    """Индекс транскрипта задачи: из .npz рядом с JSON, иначе строится и сохраняется."""
+    audio_sha1 = transcript_result.get("audio_sha1")
+    path = os.path.join(MEDIA_WORK, job_id, f"transcript_{audio_sha1}.npz") if audio_sha1 else None
+    if path and os.path.exists(path):
+        return TranscriptIndex.load(path)
+    index = TranscriptIndex.from_transcript(transcript_result)
+    if path and os.path.isdir(os.path.dirname(path)):
+        index.save(path)
+    return index
+
+
+def load_job_transcript(job_id: str) -> Tuple[Optional[Dict], Optional[TranscriptIndex]]:
+    transcript_json = find_transcript(job_id)
+    if transcript_json is None:
+        return None, None
+    with open(transcript_json, encoding="utf-8") as f:
+        transcript_result = json.load(f)
+    return transcript_result, load_index(transcript_result, job_id)
@@ -1,45 +1,102 @@
 """
 Heuristic Virality Score 0–100: keyword density, audio variation, scenes, duration, question/emotion words, readability.
+Batch API scores all candidates of a job in one vectorized pass over the transcript index.
 """
 import numpy as np
-import nltk
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from typing import List, Dict
-
-def virality_score(segment: Dict, transcript: Dict, audio_features: Dict, scene_count: int) -> Dict:
-    # Ключевые слова
-    text = " ".join([w["word"] for w in segment.get("words", [])])
-    words = nltk.word_tokenize(text)
-    unique_words = set(words)
-    keyword_density = len(unique_words) / (len(words) + 1e-6)
-    # Аудио динамика
-    audio_var = float(audio_features.get("rms_var", 0))
-    # Количество сцен
-    scenes = scene_count
-    # Длительность
-    duration = segment["end"] - segment["start"]
-    # Вопросы/эмо слова
-    question = int("?" in text)
-    exclaim = int("!" in text)
-    # Сентимент
-    analyzer = SentimentIntensityAnalyzer()
-    sentiment = analyzer.polarity_scores(text)["compound"]
-    # Читаемость (упрощенно)
-    readability = min(1.0, len(words) / (duration * 2 + 1e-6))
-    # Итоговый скор
-    score = (
-        20 * keyword_density +
-        20 * audio_var +
-        20 * (scenes / 3) +
-        20 * readability +
-        10 * (question + exclaim) +
-        10 * sentiment
-    )
-    score = max(0, min(100, int(score)))
+from typing import List, Dict, Optional, Sequence, Tuple
+from ..models.registry import registry
+
+# Признаки (столбцы матрицы, каждый в [0, 1]) и их веса в итоговом скоре 0–100
+FEATURE_NAMES = ("keyword_density", "audio_var", "scenes", "readability", "question_exclaim", "sentiment")
+WEIGHTS = np.array([20.0, 20.0, 20.0, 20.0, 10.0, 10.0])
+# Насыщение: столько склеек в окне / слов в секунду дают максимум признака
+SCENES_FULL = 3.0
+WORDS_PER_SEC_FULL = 2.0
+# Нормировка суммы валентностей как в VADER compound
+VADER_ALPHA = 15.0
+
+def create_sentiment_analyzer():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+def distinct_counts(token_ids: np.ndarray, i0: np.ndarray, i1: np.ndarray) -> np.ndarray:
+    """
+    Число различных токенов в каждом диапазоне [i0, i1) без цикла по окнам: токен в позиции p
+    считается, если его предыдущее вхождение левее начала окна.
+    """
+    n = len(token_ids)
+    prev = np.full(n, -1, dtype=np.int64)
+    if n:
+        order = np.lexsort((np.arange(n), token_ids))
+        same = token_ids[order][1:] == token_ids[order][:-1]
+        prev[order[1:][same]] = order[:-1][same]
+    lens = np.maximum(i1 - i0, 0)
+    if lens.sum() == 0:
+        return np.zeros(len(i0), dtype=np.int64)
+    offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    pos = np.repeat(i0, lens) + offsets
+    first = (prev[pos] < np.repeat(i0, lens)).astype(np.int64)
+    sums = np.concatenate([[0], np.cumsum(first)])
+    ends = np.cumsum(lens)
+    return sums[ends] - sums[ends - lens]
+
+def virality_batch(starts: Sequence[float], ends: Sequence[float], index, audio_var: Sequence[float],
+                   scene_counts: Sequence[float], lexicon: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Скоры всех кандидатов задачи сразу. index — TranscriptIndex (общий токенизированный транскрипт),
+    audio_var — вариативность громкости окна (коэффициент вариации RMS), scene_counts — склейки в окне.
+    Лексикон валентностей берётся у общего анализатора VADER из реестра моделей.
+    Возвращает (матрица признаков n x len(FEATURE_NAMES) в [0, 1], скоры 0–100).
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if lexicon is None:
+        lexicon = registry.get("vader").lexicon
+    i0, i1 = index.range_indices(starts, ends)
+    n_words = (i1 - i0).astype(np.float64)
+    duration = np.maximum(ends - starts, 1e-6)
+    # Плотность ключевых слов: доля различных токенов
+    keyword_density = distinct_counts(index.token_ids, i0, i1) / (n_words + 1e-6)
+    # Вопросы/восклицания и валентность — по словам, суммы по окнам через префиксные суммы
+    words = index.words.astype(str)
+    question = np.char.endswith(words, "?").astype(np.int64) if len(words) else np.zeros(0, dtype=np.int64)
+    exclaim = np.char.endswith(words, "!").astype(np.int64) if len(words) else np.zeros(0, dtype=np.int64)
+    token_valence = np.array([lexicon.get(t, 0.0) for t in index.tokens.tolist()], dtype=np.float64)
+    valence = token_valence[index.token_ids] if len(index.token_ids) else np.zeros(0)
+
+    def window_sum(per_word):
+        prefix = np.concatenate([[0.0], np.cumsum(per_word, dtype=np.float64)])
+        return prefix[i1] - prefix[i0]
+
+    has_q = window_sum(question) > 0
+    has_e = window_sum(exclaim) > 0
+    polarity = window_sum(valence)
+    compound = polarity / np.sqrt(polarity ** 2 + VADER_ALPHA)
+    features = np.column_stack([
+        keyword_density,
+        np.asarray(audio_var, dtype=np.float64),
+        np.asarray(scene_counts, dtype=np.float64) / SCENES_FULL,
+        n_words / duration / WORDS_PER_SEC_FULL,
+        (has_q.astype(np.float64) + has_e) / 2.0,
+        np.abs(compound),
+    ])
+    features = np.clip(features, 0.0, 1.0)
+    scores = np.clip(features @ WEIGHTS, 0.0, 100.0)
+    return features, scores
+
+def score_color(score: float) -> str:
     if score < 40:
-        color = "red"
+        return "red"
     elif score < 70:
-        color = "yellow"
-    else:
-        color = "green"
-    return {"score": score, "color": color}
+        return "yellow"
+    return "green"
+
+def virality_score(segment: Dict, transcript: Dict, audio_features: Dict, scene_count: int, index=None) -> Dict:
+    """Скор одного сегмента (обёртка над virality_batch); для многих сегментов — virality_batch."""
+    if index is None:
+        from .transcript_index import TranscriptIndex
+        index = TranscriptIndex.from_transcript(transcript)
+    _, scores = virality_batch([segment["start"]], [segment["end"]], index,
+                               [float(audio_features.get("rms_var", 0))], [scene_count])
+    score = int(scores[0])
+    return {"score": score, "color": score_color(score)}
@@ -0,0 +1,29 @@
+"""
+Unit test: content-addressed artifact cache (keys, hit/miss counters, LRU eviction)
+"""
+import os
+import time
+
+from backend.cache import ArtifactStore
+
+
+def test_artifact_cache_hits_and_lru(tmp_path):
+    store = ArtifactStore(root=str(tmp_path), max_bytes=400)
+    k1 = store.key("abc", "transcript", {"model": "small", "lang": None})
+    assert k1 == store.key("abc", "transcript", {"lang": None, "model": "small"})
+    assert k1 != store.key("abc", "transcript", {"model": "small"}, version="2")
+    assert store.get_json(k1, "transcript") is None
+    store.put_json(k1, "transcript", {"text": "x" * 100})
+    assert store.get_json(k1, "transcript") == {"text": "x" * 100}
+    # k1 используется последним — при переполнении вытесняется k2
+    k2 = store.key("def", "transcript")
+    store.put_json(k2, "transcript", {"text": "y" * 100})
+    old = time.time() - 60
+    os.utime(store.path(k2), (old, old))
+    store.get_json(k1, "transcript")
+    store.put_json(store.key("ghi", "transcript"), "transcript", {"text": "z" * 100})
+    stats = store.stats()
+    assert os.path.exists(store.path(k1))
+    assert not os.path.exists(store.path(k2))
+    assert stats["evictions"] >= 1
+    assert stats["stages"]["transcript"] == {"hits": 2, "misses": 1}
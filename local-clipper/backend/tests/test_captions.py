@@ -1,5 +1,41 @@
 """
 Unit test: captions export
 """
+import re
+
+from backend.services import captions, styling
+
+
+def make_words(t0, texts, step=0.4):
+    return [{"word": w, "start": t0 + i * step, "end": t0 + i * step + 0.3, "confidence": 1.0} for i, w in enumerate(texts)]
+
+
 def test_captions_export():
-    assert True  # TODO: implement
+    preset = styling.get_style_preset("karaoke")
+    texts = ["this", "is", "a", "fairly", "long", "sentence", "that", "should", "wrap.", "Next", "one", "here"]
+    words = make_words(100.0, texts)
+    lines = captions.layout_lines(words, 99.5, 110.0, preset)
+    # Времена от начала клипа, не от начала исходника
+    assert lines[0]["start"] == 0.5
+    assert all(0 <= line["start"] < line["end"] <= 10.5 for line in lines)
+    assert all(sum(len(r) for r in line["rows"]) <= preset["max_words"] for line in lines)
+    assert all(len(line["rows"]) <= preset["max_lines"] for line in lines)
+    # Конец предложения закрывает строку
+    assert [w for w in lines[1]["rows"][-1]][-1]["word"] == "wrap."
+    events = captions.generate_ass_events(lines)
+    assert events.count("Dialogue:") == len(lines)
+    assert len(re.findall(r"\{\\k\d+\}", events)) == len(texts)
+    # Сумма \k строки совпадает с временем от её начала до конца последнего слова
+    first = events.splitlines()[0]
+    ks = sum(int(k) for k in re.findall(r"\\k(\d+)", first))
+    assert ks == round(lines[0]["rows"][-1][-1]["end"] * 100) - round(lines[0]["start"] * 100)
+    header = styling.generate_ass_header("karaoke")
+    assert "PlayResY: 1920" in header and "&H0000F7FF" in header
+
+
+def test_glyph_widths_cached():
+    metrics = captions.get_metrics("Arial", 72, True)
+    assert captions.get_metrics("Arial", 72, True) is metrics
+    w = metrics.text_width("hello hello")
+    assert set("helo ") <= set(metrics.widths)
+    assert metrics.text_width("hello hello") == w
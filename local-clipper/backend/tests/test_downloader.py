@@ -0,0 +1,71 @@
+"""
+Unit test: concurrent ranged download of separate streams with resume, against a local HTTP server
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from backend.services import downloader
+
+
+def make_server(files):
+    requests_seen = []
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            data = files[self.path]
+            start, end = 0, len(data) - 1
+            if "Range" in self.headers:
+                start, end = (int(x) for x in self.headers["Range"].split("=")[1].split("-"))
+                requests_seen.append((self.path, start))
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            self.wfile.write(data[start:end + 1])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests_seen
+
+
+def test_fetch_streams_concurrent_and_resumable(tmp_path):
+    files = {"/video": os.urandom(1_000_000), "/audio": os.urandom(300_000)}
+    server, seen = make_server(files)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    chunk = 64 * 1024
+    try:
+        video_path, audio_path = str(tmp_path / "v.mp4"), str(tmp_path / "a.m4a")
+        # Прерванное скачивание: первые куски видео уже на диске
+        done = [0, 1, 2]
+        with open(video_path + ".part", "wb") as f:
+            f.write(files["/video"][:3 * chunk])
+        with open(video_path + ".part.json", "w") as f:
+            json.dump({"size": len(files["/video"]), "chunk_size": chunk, "done": done}, f)
+        reported = []
+        paths = downloader.fetch_streams(
+            [(base + "/video", video_path, len(files["/video"])), (base + "/audio", audio_path, len(files["/audio"]))],
+            progress=reported.append, connections=4, chunk_size=chunk)
+    finally:
+        server.shutdown()
+    assert paths == [video_path, audio_path]
+    assert open(video_path, "rb").read() == files["/video"]
+    assert open(audio_path, "rb").read() == files["/audio"]
+    assert not os.path.exists(video_path + ".part") and not os.path.exists(video_path + ".part.json")
+    # Докачка: уже скачанные куски не запрашиваются повторно
+    assert not any(path == "/video" and start < 3 * chunk for path, start in seen)
+    # Общий прогресс по обоим потокам: монотонный, начинается с учётом докачанного, доходит до 100
+    assert reported == sorted(reported) and reported[-1] == 100 and reported[0] >= 14
+    # Куски видео и аудио качались вперемешку, а не один поток за другим
+    order = [path for path, _ in seen]
+    assert order.index("/audio") < len(order) - order[::-1].index("/video") - 1
@@ -0,0 +1,16 @@
+"""
+Unit test: stage executor runs heavy stages outside the event loop process
+"""
+import asyncio
+import os
+
+from backend import executor
+
+
+def test_stage_runs_in_pool_process():
+    async def run():
+        try:
+            return await executor.run_stage("reframing", os.getpid)
+        finally:
+            executor.shutdown()
+    assert asyncio.run(run()) != os.getpid()
@@ -1,5 +1,96 @@
 """
 Unit test: highlight scoring
 """
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend.services.audio_features import AudioFeatures, FEATURE_SR, FEATURE_HOP
+
+
 def test_highlight_scoring():
-    assert True  # TODO: implement
+    rng = np.random.default_rng(0)
+    frames = rng.random((2000, 3)).astype(np.float32)
+    feats = AudioFeatures(frames)
+    fps = FEATURE_SR / FEATURE_HOP
+    starts = np.array([0.0, 10.0, 42.5])
+    ends = np.array([20.0, 30.0, 60.0])
+    means = feats.window_mean(starts, ends)
+    variances = feats.window_var(starts, ends)
+    for (s, e), m, v in zip(zip(starts, ends), means, variances):
+        window = frames[int(round(s * fps)):int(round(e * fps))]
+        assert np.allclose(m, window.mean(axis=0), atol=1e-5)
+        assert np.allclose(v, window.var(axis=0), atol=1e-5)
+
+
+def test_segment_windows_and_nms():
+    from backend.services.highlight import segment_windows, select_nms
+    segments = [{"start": 5.0 * i, "end": 5.0 * i + 4.5, "text": f"s{i}"} for i in range(20)]
+    windows = segment_windows(segments)
+    # Окна начинаются и заканчиваются на границах фраз, длина не меньше 20 с
+    assert windows and all(w["end"] - w["start"] >= 20 for w in windows)
+    assert windows[0] == {"start": 0.0, "end": 24.5, "text": "s0 s1 s2 s3 s4"}
+    assert windows[-1]["end"] == segments[-1]["end"]
+    for i, w in enumerate(windows):
+        w["score"] = float(i)
+    selected = select_nms(windows, max_clips=15)
+    assert selected[0]["score"] == len(windows) - 1
+    for a in selected:
+        for b in selected:
+            if a is not b:
+                assert min(a["end"], b["end"]) - max(a["start"], b["start"]) <= 2
+
+
+def test_sliding_windows_and_interval_nms():
+    from backend.services import candidates
+    rng = np.random.default_rng(1)
+    # ~3 часа речи: фразы по 2-8 секунд
+    lengths = rng.uniform(2.0, 8.0, 2500)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths + 0.2
+    first, last = candidates.sliding_windows(starts, ends)
+    lens = ends[last] - starts[first]
+    scores = rng.random(len(first))
+    keep = candidates.nms_intervals(starts[first], ends[last], scores, max_keep=50)
+    assert len(first) > 10000
+    assert lens.min() >= candidates.CLIP_MIN_LEN and lens.max() <= candidates.CLIP_MAX_LEN
+    # Полный перебор: те же окна, что и у O(n·k) NMS
+    brute = []
+    for i in np.argsort(-scores, kind="stable"):
+        s, e = starts[first[i]], ends[last[i]]
+        if all(min(e, ends[last[k]]) - max(s, starts[first[k]]) <= 2.0 for k in brute):
+            brute.append(int(i))
+        if len(brute) >= 50:
+            break
+    assert keep == brute
+
+
+def test_virality_batch_matches_single():
+    from backend.services import candidates, virality
+    from backend.services.transcript_index import TranscriptIndex
+    rng = np.random.default_rng(3)
+    vocab = ["wow", "great", "why", "this", "is", "it", "terrible", "what"]
+    t, segments = 0.0, []
+    while t < 3600:
+        words = []
+        for _ in range(8):
+            words.append({"word": " " + vocab[rng.integers(len(vocab))], "start": t, "end": t + 0.3, "confidence": 1.0})
+            t += 0.35
+        words[-1]["word"] += "?"
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": "", "words": words})
+    index = TranscriptIndex.from_transcript({"segments": segments})
+    lexicon = {"wow": 2.0, "great": 3.1, "terrible": -2.5}
+    starts, ends = candidates.sentence_bounds(segments)
+    first, last = candidates.sliding_windows(starts, ends)
+    assert len(first) >= 1000
+    audio_var = rng.random(len(first))
+    scenes = rng.integers(0, 4, len(first))
+    features, scores = virality.virality_batch(starts[first], ends[last], index, audio_var, scenes, lexicon=lexicon)
+    assert features.shape == (len(first), len(virality.FEATURE_NAMES))
+    assert features.min() >= 0 and features.max() <= 1 and scores.max() <= 100
+    # Окно по одному совпадает с батчем; плотность — доля различных токенов
+    k = len(first) // 2
+    _, single = virality.virality_batch([starts[first[k]]], [ends[last[k]]], index, [audio_var[k]], [scenes[k]], lexicon=lexicon)
+    assert np.isclose(single[0], scores[k])
+    tokens = [w["word"].strip(" ?") for w in index.words_in(starts[first[k]], ends[last[k]])]
+    assert np.isclose(features[k, 0], len(set(tokens)) / len(tokens), atol=1e-5)
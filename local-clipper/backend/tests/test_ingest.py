@@ -0,0 +1,59 @@
+"""
+Unit test: streaming upload ingest hashes on the fly and dedupes by content; WAV and analysis proxy come from one ffmpeg pass
+"""
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+pytest.importorskip("aiofiles")
+
+from backend.services import ingest
+
+
+class FakeUpload:
+    def __init__(self, data, filename):
+        self.file = io.BytesIO(data)
+        self.filename = filename
+
+    async def read(self, size=-1):
+        return self.file.read(size)
+
+
+def test_ingest_hash_and_dedupe(tmp_path):
+    data = b"\x00\x01video" * 100000
+    path1, sha1 = asyncio.run(ingest.ingest_upload(FakeUpload(data, "a.MP4"), str(tmp_path)))
+    path2, sha2 = asyncio.run(ingest.ingest_upload(FakeUpload(data, "b.mp4"), str(tmp_path)))
+    assert sha1 == sha2 == hashlib.sha1(data).hexdigest()
+    assert path1 == path2
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"{sha1}.mp4", f"{sha1}.mp4.sha1"]
+
+
+def test_audio_and_proxy_in_one_ffmpeg_pass(tmp_path, monkeypatch):
+    import subprocess
+    from backend.services import downloader, proxy
+
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        # Выходы ffmpeg — аргументы после опций каждого выхода: WAV и прокси
+        for arg in cmd:
+            if arg.endswith((".tmp.wav", ".tmp.mp4")):
+                open(arg, "wb").write(b"out")
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+    monkeypatch.setattr(subprocess, "run", fake_run)
+    source = tmp_path / "abc.mp4"
+    source.write_bytes(b"video")
+    audio_path = downloader.extract_audio(str(source), with_proxy=True)
+    assert audio_path == str(tmp_path / "abc.wav")
+    assert len(calls) == 1 and calls[0].count("-i") == 1
+    assert calls[0].index("0:a:0") < calls[0].index("0:v:0")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["abc.mp4", "abc.proxy.mp4", "abc.wav"]
+    # Повторный вызов ничего не декодирует; анализ идёт по прокси, без него — по исходнику
+    downloader.extract_audio(str(source), with_proxy=True)
+    assert len(calls) == 1
+    assert proxy.analysis_video(str(source)) == str(tmp_path / "abc.proxy.mp4")
+    assert proxy.analysis_video(str(tmp_path / "other.mp4")) == str(tmp_path / "other.mp4")
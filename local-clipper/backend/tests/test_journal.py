@@ -0,0 +1,103 @@
+"""
+Unit test: SQLite job journal survives reopening, and a restarted queue resumes jobs at their first incomplete stage
+"""
+import asyncio
+import json
+import os
+
+from backend import workers
+from backend.journal import JobJournal
+from backend.progress import ProgressBus
+
+
+def test_journal_roundtrip(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    journal = JobJournal(path)
+    journal.submit("a", {"job_id": "a"})
+    journal.submit("b", {"job_id": "b"})
+    journal.stage_done("a", "download", 0, {"source_path": "/src.mp4"}, {"job_id": "a", "source_sha1": "abc"})
+    journal.set_status("b", "ready")
+    journal.close()
+    # Новый процесс видит всё, что было записано до «падения»
+    journal = JobJournal(path)
+    assert journal.unfinished() == [("a", {"job_id": "a", "source_sha1": "abc"}, [("download", {"source_path": "/src.mp4"})])]
+    assert journal.snapshot("b") == {"status": "ready", "steps": []}
+    assert journal.snapshot("missing") is None
+    assert journal._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    journal.close()
+
+
+def test_queue_resumes_at_first_incomplete_stage(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "WORK_DIR", str(tmp_path))
+    job_dir = tmp_path / "job"
+    job_dir.mkdir()
+    source, audio = tmp_path / "src.mp4", tmp_path / "src.wav"
+    source.write_bytes(b"video")
+    audio.write_bytes(b"audio")
+    transcript = {"audio_sha1": "ff", "segments": [{"start": 0.0, "end": 1.0, "text": "hi"}]}
+    (job_dir / "transcript_ff.json").write_text(json.dumps(transcript), encoding="utf-8")
+
+    # Прошлый запуск: download/audio_extract/transcript завершены, процесс упал на хайлайтах
+    journal_path = str(tmp_path / "jobs.sqlite3")
+    journal = JobJournal(journal_path)
+    journal.submit("job", {"job_id": "job"})
+    journal.stage_done("job", "download", 0, {"source_path": str(source)}, {"job_id": "job", "source_sha1": "aa"})
+    journal.stage_done("job", "audio_extract", 1, {"audio_path": str(audio)}, {"job_id": "job", "source_sha1": "aa"})
+    journal.stage_done("job", "transcript", 2, {"transcript": str(job_dir / "transcript_ff.json")}, {"job_id": "job", "source_sha1": "aa"})
+    journal.close()
+
+    calls = []
+
+    def fake_stage(step):
+        async def handler(ctx, status):
+            calls.append(step)
+            if step == "highlights":
+                assert ctx["transcript"] == transcript and ctx["source_path"] == str(source)
+                ctx["highlights"] = [{"id": "seg_1", "start": 0.0, "end": 1.0}]
+                (job_dir / "highlights.json").write_text(json.dumps(ctx["highlights"]), encoding="utf-8")
+        return handler
+
+    async def run():
+        queue = workers.JobQueue(bus=ProgressBus(work_dir=str(tmp_path), flush_interval=0.01),
+                                 journal=JobJournal(journal_path))
+        queue.handlers = {step: fake_stage(step) for step in queue.stages}
+        queue.start_workers()
+        assert await queue.resume() == 1
+        for _ in range(100):
+            if queue.progress["job"]["status"] == "ready":
+                break
+            await asyncio.sleep(0.01)
+        return queue
+
+    queue = asyncio.run(run())
+    assert calls == ["highlights", "reframing", "previews", "captions"]
+    assert queue.progress["job"]["status"] == "ready"
+    assert [s["step"] for s in queue.progress["job"]["steps"] if s.get("resumed")] == ["download", "audio_extract", "transcript"]
+    # Следующий перезапуск ничего не возобновляет
+    assert queue.journal.unfinished() == []
+    assert queue.journal.snapshot("job")["status"] == "ready"
+    queue.journal.close()
+    # Файл транскрипта пропал — транскрипция повторяется, остальное берётся из журнала
+    journal = JobJournal(journal_path)
+    journal.set_status("job", "processing")
+    os.remove(job_dir / "transcript_ff.json")
+
+    async def rerun():
+        queue = workers.JobQueue(journal=journal, bus=ProgressBus(work_dir=str(tmp_path)))
+        await queue.resume()
+        return queue
+
+    queue = asyncio.run(rerun())
+    assert queue.stage_queues["transcript"].qsize() == 1
+    journal.close()
+
+
+def test_journal_not_opened_on_import(tmp_path, monkeypatch):
+    import backend.journal as journal_module
+    monkeypatch.setattr(journal_module, "JOURNAL_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(workers, "JobJournal", lambda: JobJournal(journal_module.JOURNAL_PATH))
+    queue = workers.JobQueue(bus=ProgressBus(work_dir=str(tmp_path)))
+    assert not os.path.exists(tmp_path / "jobs.sqlite3")
+    assert queue.status("missing") is None
+    assert os.path.exists(tmp_path / "jobs.sqlite3")
+    queue.close_journal()
@@ -0,0 +1,138 @@
+"""
+Unit test: pooled Ollama client against a local fake Ollama server: bounded concurrency, prompt-hash cache, token streaming
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from backend.services import title_hook_tags
+
+ANSWER = {"titles": ["Заголовок"], "hooks": ["Хук"], "hashtags": ["shorts", "clip"]}
+
+
+def make_fake_ollama(delay=0.1):
+    stats = {"calls": 0, "active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    class OllamaHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                stats["calls"] += 1
+                stats["active"] += 1
+                stats["max_active"] = max(stats["max_active"], stats["active"])
+            time.sleep(delay)
+            with lock:
+                stats["active"] -= 1
+            answer = json.dumps(ANSWER, ensure_ascii=False)
+            if body.get("stream"):
+                # NDJSON как у Ollama: ответ по кусочкам, последним — done
+                step = len(answer) // 4 + 1
+                lines = [{"response": answer[i:i + step], "done": False} for i in range(0, len(answer), step)]
+                payload = "".join(json.dumps(l) + "\n" for l in lines + [{"response": "", "done": True}])
+            else:
+                payload = json.dumps({"response": answer, "done": True})
+            data = payload.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+@pytest.fixture
+def fake_ollama(tmp_path, monkeypatch):
+    server, stats = make_fake_ollama()
+    client = title_hook_tags.OllamaClient(host=f"http://127.0.0.1:{server.server_address[1]}", concurrency=2,
+                                          cache_dir=str(tmp_path / "cache"))
+    monkeypatch.setattr(title_hook_tags, "MEDIA_WORK", str(tmp_path / "work"))
+    monkeypatch.setattr(title_hook_tags, "client", client)
+    yield client, stats
+    server.shutdown()
+
+
+def test_bulk_meta_dedupes_and_caches_prompts(fake_ollama):
+    client, stats = fake_ollama
+    segments = [("seg_1", "первый текст"), ("seg_2", "второй текст"), ("seg_3", "первый текст"),
+                ("seg_4", "третий текст"), ("seg_5", "четвёртый текст")]
+
+    async def run():
+        try:
+            first = await title_hook_tags.generate_meta_bulk("job_a", segments)
+            # Другая задача с тем же текстом сегментов: ответы берутся из кэша по хэшу промпта
+            second = await title_hook_tags.generate_meta_bulk("job_b", segments[:2])
+            return first, second
+        finally:
+            await client.close()
+
+    first, second = asyncio.run(run())
+    assert set(first) == {s for s, _ in segments}
+    assert all(meta == ANSWER for meta in list(first.values()) + list(second.values()))
+    # Одинаковый текст уходит в модель один раз, параллельно не больше OLLAMA_CONCURRENCY запросов
+    assert stats["calls"] == 4
+    assert stats["max_active"] == 2
+
+
+def test_stream_meta_yields_tokens_then_meta(fake_ollama):
+    client, stats = fake_ollama
+
+    async def run():
+        try:
+            events = [e async for e in title_hook_tags.stream_meta("job_a", "seg_1", "текст сегмента")]
+            cached = [e async for e in title_hook_tags.stream_meta("job_b", "seg_1", "текст сегмента")]
+            return events, cached
+        finally:
+            await client.close()
+
+    events, cached = asyncio.run(run())
+    tokens = [e["token"] for e in events if "token" in e]
+    assert len(tokens) > 1
+    assert json.loads("".join(tokens)) == ANSWER
+    assert events[-1] == {"meta": ANSWER}
+    assert cached == [{"meta": ANSWER}] and stats["calls"] == 1
+
+
+def test_parse_string_fields_and_skip_empty_cache(tmp_path):
+    meta = title_hook_tags.parse_ollama_response(json.dumps({"titles": "Один заголовок", "hooks": ["Хук"], "hashtags": "#shorts #clip, fun"}))
+    assert meta == {"titles": ["Один заголовок"], "hooks": ["Хук"], "hashtags": ["shorts", "clip", "fun"]}
+    client = title_hook_tags.OllamaClient(cache_dir=str(tmp_path))
+    client._store("prompt", title_hook_tags.parse_ollama_response("{}"))
+    assert client.cached("prompt") is None
+
+
+def test_cancelled_first_caller_does_not_cancel_followers(fake_ollama):
+    client, stats = fake_ollama
+    prompt = title_hook_tags.build_prompt("общий текст")
+
+    async def run():
+        try:
+            first = asyncio.ensure_future(client.generate(prompt))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(client.generate(prompt))
+            await asyncio.sleep(0.02)
+            first.cancel()
+            meta = await follower
+            # Общий запрос доведён до конца и закэширован
+            await asyncio.sleep(0)
+            return meta, first.cancelled()
+        finally:
+            await client.close()
+
+    meta, cancelled = asyncio.run(run())
+    assert cancelled and meta == ANSWER
+    assert stats["calls"] == 1 and client.cached(prompt) == ANSWER
@@ -0,0 +1,22 @@
+"""
+Unit test: previews are extracted in a single ffmpeg call with keyframe seeks
+"""
+from backend.services import previews
+
+
+def test_preview_args_single_call():
+    jobs = [("jpg", 12.5, 0.0, "a.jpg"), ("jpg", 40.0, 0.0, "b.jpg"), ("webp", 38.5, 3.0, "b.webp")]
+    args = previews.build_preview_args("src.mp4", jobs)
+    assert args.count("-i") == 3
+    assert args.count("nokey") == 2
+    # seek стоит до -i (быстрый seek по входу)
+    first_input = args.index("-i")
+    assert args.index("-ss") < first_input
+    assert args[-1] == "b.webp"
+    assert args[args.index("a.jpg") - 6:args.index("a.jpg") - 4] == ["-frames:v", "1"]
+
+
+def test_preview_cache_name_records_proxy():
+    seg = {"start": 10.0, "end": 40.0}
+    assert previews.cache_path("abc", seg, "jpg", "src.mp4") != previews.cache_path("abc", seg, "jpg", "src.proxy.mp4")
+    assert previews.cache_path("abc", seg, "jpg", "src.mp4") == previews.cache_path("abc", seg, "jpg")
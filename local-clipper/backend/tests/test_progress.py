@@ -0,0 +1,40 @@
+"""
+Unit test: progress bus pushes updates, debounces status.json writes and throttles progress reports
+"""
+import asyncio
+import json
+import os
+import threading
+
+from backend.progress import ProgressBus
+
+
+def test_progress_bus(tmp_path):
+    bus = ProgressBus(work_dir=str(tmp_path), flush_interval=0.05, min_interval=10.0)
+    status_path = os.path.join(str(tmp_path), "job", "status.json")
+
+    async def run():
+        bus.statuses["job"] = {"status": "processing", "steps": [{"step": "download", "progress": 0}]}
+        queue = bus.subscribe("job")
+        assert (await queue.get())["steps"][0]["progress"] == 0
+        bus.publish("job")
+        # Отчёты из потока стадии: частые отбрасываются, 100 проходит всегда
+        thread = threading.Thread(target=lambda: [bus.report("job", "download", p) for p in range(1, 101)])
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        snapshots = [queue.get_nowait() for _ in range(queue.qsize())]
+        assert [s["steps"][0]["progress"] for s in snapshots] == [0, 1, 100]
+        # Запись на диск отложена и делается одним снимком
+        assert not os.path.exists(status_path)
+        await asyncio.sleep(0.2)
+        with open(status_path, encoding="utf-8") as f:
+            assert json.load(f)["steps"][0]["progress"] == 100
+        bus.statuses["job"]["status"] = "ready"
+        bus.publish("job")
+        await asyncio.sleep(0.01)
+        with open(status_path, encoding="utf-8") as f:
+            assert json.load(f)["status"] == "ready"
+        bus.unsubscribe("job", queue)
+
+    asyncio.run(run())
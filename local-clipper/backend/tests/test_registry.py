@@ -0,0 +1,14 @@
+"""
+Unit test: model registry loads lazily, once per process, and reports load stats
+"""
+from backend.models.registry import ModelRegistry
+
+
+def test_registry_lazy_single_instance():
+    reg = ModelRegistry({"dummy": "models.registry:ModelRegistry", "broken": "models.registry:missing"})
+    assert reg.status()["dummy"] == {"loaded": False}
+    first = reg.get("dummy")
+    assert reg.get("dummy") is first
+    status = reg.warmup()
+    assert status["dummy"]["loaded"] and status["dummy"]["load_time"] >= 0
+    assert not status["broken"]["loaded"] and "error" in status["broken"]
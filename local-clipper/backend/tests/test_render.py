@@ -0,0 +1,148 @@
+"""
+Unit test: render command building (input seek, stream-copy fast path, encoder options, track-driven crop), cached outputs and manifest, Range serving
+"""
+from backend.services import render
+
+
+def test_render_cmd_fast_seek_and_copy():
+    seg = {"id": "seg_1", "start": 3600.0, "end": 3630.0, "loudnorm": False, "reframe": False}
+    cmd = render.build_render_cmd("src.mp4", seg, "out.mp4", 720, "mp4", render.DEFAULT_OPTIONS, source_size=(720, 1280))
+    assert cmd.index("-ss") < cmd.index("-i")
+    assert cmd[cmd.index("-c") + 1] == "copy"
+    # Явный отказ от масштабирования — тоже без перекодирования
+    cmd = render.build_render_cmd("src.mp4", {**seg, "scale": False}, "out.mp4", 1080, "mp4", render.DEFAULT_OPTIONS)
+    assert cmd[cmd.index("-c") + 1] == "copy"
+
+
+def test_render_cmd_reencodes_when_resolution_differs():
+    seg = {"id": "seg_1", "start": 3600.0, "end": 3630.0, "loudnorm": False, "reframe": False}
+    for size in [(1920, 1080), (720, 1280), None]:
+        cmd = render.build_render_cmd("src.mp4", seg, "out.mp4", 1080, "mp4", render.DEFAULT_OPTIONS, source_size=size)
+        assert "copy" not in cmd
+        assert "scale=1080:1920" in cmd[cmd.index("-vf") + 1]
+
+
+def test_render_cmd_encoder_options():
+    seg = {"id": "seg_1", "start": 10.0, "end": 40.0}
+    options = {**render.DEFAULT_OPTIONS, "preset": "ultrafast", "threads": 2}
+    cmd = render.build_render_cmd("src.mp4", seg, "out.mp4", 1080, "mp4", options, track=[], ass_path="seg_1.ass")
+    assert "copy" not in cmd
+    assert cmd[cmd.index("-preset") + 1] == "ultrafast"
+    assert cmd[cmd.index("-threads") + 1] == "2"
+    assert "loudnorm" in cmd[cmd.index("-af") + 1]
+    assert cmd[cmd.index("-t") + 1] == "30.000"
+
+
+def test_two_pass_loudnorm_uses_measurements():
+    stderr = """[Parsed_loudnorm_0 @ 0x0]
+{
+	"input_i" : "-27.61",
+	"input_tp" : "-4.47",
+	"input_lra" : "18.06",
+	"input_thresh" : "-39.20",
+	"output_i" : "-16.58",
+	"output_tp" : "-1.50",
+	"output_lra" : "14.78",
+	"output_thresh" : "-27.71",
+	"normalization_type" : "dynamic",
+	"target_offset" : "0.58"
+}
+"""
+    measured = render.parse_loudnorm_json(stderr)
+    seg = {"id": "seg_1", "start": 0.0, "end": 30.0}
+    cmd = render.build_render_cmd("src.mp4", seg, "out.mp4", 720, "mp4", render.DEFAULT_OPTIONS, loudness=measured)
+    af = cmd[cmd.index("-af") + 1]
+    assert "measured_I=-27.61" in af and "offset=0.58" in af and "linear=true" in af
+
+
+def test_crop_follows_track_via_sendcmd(tmp_path):
+    import re
+    seg = {"id": "seg_1", "start": 100.0, "end": 103.0}
+    track = [{"t": 100.0 + 0.5 * i, "center_x": 0.3 + 0.05 * i, "center_y": 0.5, "zoom": 0.5} for i in range(7)]
+    script = render.write_crop_script(track, seg, str(tmp_path / "seg_1.cmd"))
+    lines = open(script, encoding="utf-8").read().splitlines()
+    # Команда на каждый отрезок трека, времена от начала клипа
+    times = [float(line.split()[0]) for line in lines]
+    assert times[0] == 0.0 and times == sorted(times) and times[-1] <= 3.0
+    # Линейная интерполяция центра: в середине отрезка — среднее соседних сэмплов
+    expr = re.search(r"'(.*)'", lines[1]).group(1)
+    c = re.match(r"clip\(\(([\d.]+)([+-][\d.]+)\*\(t([+-][\d.]+)\)\)", expr)
+    c0, slope, shift = map(float, c.groups())
+    assert abs(c0 + slope * (0.75 + shift) - 0.375) < 1e-6
+    cmd = render.build_render_cmd("src.mp4", seg, "out.mp4", 720, "mp4", render.DEFAULT_OPTIONS,
+                                  track=track, crop_script=script)
+    vf = cmd[cmd.index("-vf") + 1]
+    assert vf.index("sendcmd") < vf.index("crop=") < vf.index("scale=")
+    assert cmd.count("-i") == 1
+
+
+def test_render_outputs_cached_and_served_with_range(tmp_path, monkeypatch):
+    import asyncio
+    import json
+    work, outputs = tmp_path / "work", tmp_path / "outputs"
+    (work / "job").mkdir(parents=True)
+    outputs.mkdir()
+    (work / "job" / "source.json").write_text(json.dumps({"path": str(tmp_path / "src.mp4"), "sha1": "abc"}))
+    (work / "job" / "seg_1.ass").write_text("[Script Info]\nstyle A")
+    monkeypatch.setattr(render, "MEDIA_WORK", str(work))
+    monkeypatch.setattr(render, "MEDIA_OUTPUTS", str(outputs))
+    monkeypatch.setattr(render, "probe_duration", lambda path: 12.5)
+    rendered = []
+
+    async def fake_ffmpeg(cmd):
+        rendered.append(cmd[-1])
+        with open(cmd[-1], "wb") as f:
+            f.write(bytes(range(256)) * 40)
+
+    monkeypatch.setattr(render, "run_ffmpeg_cmd", fake_ffmpeg)
+    segments = [{"id": "seg_1", "start": 0.0, "end": 12.5, "loudnorm": False},
+                {"id": "seg_2", "start": 20.0, "end": 32.5, "loudnorm": False}]
+    first = asyncio.run(render.render_segments("job", segments))
+    assert first["status"] == "ready" and len(rendered) == 2
+    assert [(o["size"], o["duration"], o["cached"]) for o in first["outputs"]] == [(10240, 12.5, False)] * 2
+    # Тот же запрос — мгновенно из кэша, без ffmpeg
+    plan = render.plan_render("job", segments)
+    again = render.start_manifest(plan, "r2")
+    assert again["status"] == "ready" and all(o["cached"] for o in again["outputs"]) and len(rendered) == 2
+    assert render.load_manifest("job")["render_id"] == "r2"
+    # Другой стиль сабов — другой ключ, рендерится только изменившийся клип
+    (work / "job" / "seg_1.ass").write_text("[Script Info]\nstyle B")
+    third = asyncio.run(render.render_segments("job", segments))
+    assert len(rendered) == 3 and [o["cached"] for o in third["outputs"]] == [False, True]
+
+    from fastapi.testclient import TestClient
+    from backend import main
+    client = TestClient(main.app)
+    url = first["outputs"][0]["url"]
+    resp = client.get(url, headers={"Range": "bytes=256-511"})
+    assert resp.status_code == 206 and resp.content == bytes(range(256))
+    assert resp.headers["content-range"] == "bytes 256-511/10240"
+    assert client.get("/api/job/job/clips/..%2Fsecret").status_code == 404
+    # Клип есть в общем кэше, но не в рендерах этой задачи
+    assert client.get(url.replace("/api/job/job/", "/api/job/other/")).status_code == 404
+    (outputs / "stray.mp4").write_bytes(b"x")
+    assert client.get("/api/job/job/clips/stray.mp4").status_code == 404
+
+
+def test_loudness_cache_keyed_by_targets(tmp_path, monkeypatch):
+    import asyncio
+    calls = []
+
+    class FakeProc:
+        returncode = 0
+
+        async def communicate(self):
+            return b"", b'{"input_i": "-20.0", "input_tp": "-1.0", "input_lra": "5.0", "input_thresh": "-30.0", "target_offset": "0.1"}'
+
+    async def fake_exec(*cmd, **kwargs):
+        calls.append(cmd)
+        return FakeProc()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", fake_exec)
+    asyncio.run(render.measure_loudness("src.mp4", 0.0, 30.0, str(tmp_path)))
+    asyncio.run(render.measure_loudness("src.mp4", 0.0, 30.0, str(tmp_path)))
+    assert len(calls) == 1
+    # Другая цель громкости — замеры второго прохода другие, кэш не переиспользуется
+    monkeypatch.setitem(render.LOUDNORM_TARGET, "I", -14.0)
+    asyncio.run(render.measure_loudness("src.mp4", 0.0, 30.0, str(tmp_path)))
+    assert len(calls) == 2 and "I=-14.0" in calls[1][calls[1].index("-af") + 1]
@@ -0,0 +1,47 @@
+"""
+Unit test: vectorized scene cuts on synthetic frames
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend.services import scenes
+
+
+def test_scene_cuts_batched():
+    fps = scenes.SCENE_FPS
+    colors = [(200, 120, 30), (20, 70, 50), (120, 60, 230)]
+    # Три «сцены» по 4 секунды с небольшим шумом внутри сцены
+    rng = np.random.default_rng(0)
+    frames = np.concatenate([
+        np.clip(np.array(c)[None, None, None] + rng.integers(-3, 4, (int(4 * fps), 18, 32, 3)), 0, 255).astype(np.uint8)
+        for c in colors
+    ])
+    hsv = scenes.rgb_to_hsv(frames)
+    # По батчам с переносом последнего кадра — как при чтении из ffmpeg
+    batch = 7
+    parts, prev = [], None
+    for i in range(0, len(hsv), batch):
+        parts.append(scenes.frame_scores(hsv[i:i + batch], prev))
+        prev = hsv[i + batch - 1] if i + batch <= len(hsv) else None
+    scores = np.concatenate(parts)
+    assert np.allclose(scores, scenes.frame_scores(hsv))
+    cuts = scenes.scene_cuts(scores, fps)
+    assert cuts == [4.0, 8.0]
+    assert scenes.cuts_to_scenes(cuts, 12.0) == [(0.0, 4.0), (4.0, 8.0), (8.0, 12.0)]
+
+
+def test_scene_cache_separates_proxy_and_source(tmp_path, monkeypatch):
+    from backend.cache import ArtifactStore
+    monkeypatch.setattr(scenes, "artifacts", ArtifactStore(str(tmp_path)))
+    decoded = []
+
+    def fake_decode(path, fps):
+        decoded.append(path)
+        return np.zeros(50, dtype=np.float32), 50
+
+    monkeypatch.setattr(scenes, "decode_scores", fake_decode)
+    scenes.detect_scenes("src.mp4", "abc")
+    scenes.detect_scenes("src.proxy.mp4", "abc")
+    scenes.detect_scenes("src.proxy.mp4", "abc")
+    assert decoded == ["src.mp4", "src.proxy.mp4"]
@@ -0,0 +1,79 @@
+"""
+Unit test: VAD regions are merged into ~30 s ASR windows without dropping short speech
+"""
+import pytest
+
+pytest.importorskip("numpy")
+
+from backend.services import transcript
+
+
+def test_merge_windows():
+    sr = 16000
+    speech = [(0, 5 * sr), (6 * sr, 6 * sr + 4000), (20 * sr, 28 * sr), (40 * sr, 110 * sr)]
+    windows = transcript.merge_windows(speech, sr, max_window=30.0)
+    # короткий регион (0.25 с) не выброшен, а склеен с соседями
+    assert windows[0] == (0, 28 * sr)
+    # длинный регион разрезан на окна не длиннее 30 с
+    assert windows[1:] == [(40 * sr, 70 * sr), (70 * sr, 100 * sr), (100 * sr, 110 * sr)]
+    assert all(end - start <= 30 * sr for start, end in windows)
+
+
+def test_transcript_index_queries(tmp_path):
+    import numpy as np
+    from backend.services.transcript_index import TranscriptIndex
+    vocab = ["Hello,", "world", "big", "Fire!", "is", "here"]
+    rng = np.random.default_rng(0)
+    t, segments = 0.0, []
+    for _ in range(50):
+        words = []
+        for _ in range(8):
+            d = float(rng.uniform(0.1, 0.6))
+            words.append({"word": " " + vocab[rng.integers(len(vocab))], "start": t, "end": t + d, "confidence": 0.9})
+            t += d + 0.05
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": "", "words": words})
+    index = TranscriptIndex.from_transcript({"segments": segments, "language": "en"})
+    path = str(tmp_path / "t.npz")
+    index.save(path)
+    index = TranscriptIndex.load(path)
+    assert index.language == "en" and len(index.tokens) == len(vocab)
+    all_words = [w for s in segments for w in s["words"]]
+    for start, end in [(0.0, 5.0), (12.3, 40.7), (t - 3, t + 1), (100.0, 90.0)]:
+        expected = [w["word"].strip() for w in all_words if w["start"] >= start and w["end"] <= end]
+        assert [w["word"] for w in index.words_in(start, end)] == expected
+    # Ключевые фразы: нормализация регистра и пунктуации, подсчёт по окнам
+    hits = index.phrase_hits(["big fire", "hello"])
+    tokens = [w["word"].strip().lower().strip(",!") for w in all_words]
+    expected_hits = sum(tokens[i:i + 2] == ["big", "fire"] for i in range(len(tokens))) + tokens.count("hello")
+    assert hits.sum() == expected_hits
+    counts = index.count_in_ranges(hits, [0.0, 0.0], [t + 1, 0.0])
+    assert counts.tolist() == [expected_hits, 0]
+
+
+def test_transcript_fingerprint_tracks_model_output():
+    from backend.services.transcript_index import transcript_fingerprint
+    small = {"audio_sha1": "aa", "language": "ru", "segments": [{"start": 0.0, "end": 1.0, "text": "привет"}]}
+    large = {"audio_sha1": "aa", "language": "ru", "segments": [{"start": 0.0, "end": 1.0, "text": "привет!"}]}
+    # Тот же звук, другая модель — другой транскрипт, другие ключи субтитров и хайлайтов
+    assert transcript_fingerprint(small) != transcript_fingerprint(large)
+    assert transcript_fingerprint(dict(small)) == transcript_fingerprint(small)
+    assert transcript_fingerprint({**small, "transcript_key": "k1"}) == "k1"
+
+
+def test_run_asr_passes_clip_timestamps_in_seconds(monkeypatch):
+    from types import SimpleNamespace
+    import numpy as np
+    seen = {}
+
+    class FakePipeline:
+        def transcribe(self, audio, clip_timestamps, **kwargs):
+            seen["clips"] = clip_timestamps
+            word = SimpleNamespace(word="да", start=17.5, end=18.0, probability=0.9)
+            return [SimpleNamespace(start=17.5, end=18.0, text=" да", words=[word])], SimpleNamespace(language="ru")
+
+    monkeypatch.setattr(transcript, "load_pipeline", lambda: FakePipeline())
+    sr = 16000
+    segments, lang = transcript.run_asr(np.zeros(40 * sr, dtype=np.float32), [(0, 10 * sr), (17 * sr, 35 * sr)], sr, batch_size=8)
+    assert seen["clips"] == [{"start": 0.0, "end": 10.0}, {"start": 17.0, "end": 35.0}]
+    # Пайплайн сам отдаёт время от начала файла — без повторного сдвига
+    assert lang == "ru" and segments[0]["start"] == 17.5 and segments[0]["words"][0]["start"] == 17.5
@@ -1,4 +1,55 @@
 """
 Utility functions: paths, hashes, cache, timers, ffmpeg helpers, audio extraction, fps normalization.
 """
-# Implement helpers for SHA1, ffmpeg, etc.
+import hashlib
+import os
+import subprocess
+
+
+def sha1_of_file(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def derived_sha1(*parts):
+    """Ключ производного артефакта (например WAV из исходника) без повторного чтения файла."""
+    return hashlib.sha1(":".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def cached_sha1(path):
+    """
+    SHA1 файла с кэшем в соседнем `{path}.sha1` (инвалидируется по размеру и mtime),
+    чтобы многогигабайтные исходники хэшировались один раз.
+    """
+    st = os.stat(path)
+    stamp = f"{st.st_size}:{int(st.st_mtime)}"
+    sidecar = path + ".sha1"
+    if os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            saved = f.read().split()
+        if len(saved) == 2 and saved[1] == stamp:
+            return saved[0]
+    digest = sha1_of_file(path)
+    write_sha1_sidecar(path, digest)
+    return digest
+
+
+def write_sha1_sidecar(path, digest):
+    st = os.stat(path)
+    with open(path + ".sha1", "w", encoding="utf-8") as f:
+        f.write(f"{digest} {st.st_size}:{int(st.st_mtime)}")
+
+
+def run_ffmpeg(args):
+    """Запуск ffmpeg (блокирующий), RuntimeError с stderr при ошибке."""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg error: {proc.stderr.decode(errors='ignore')}")
+    return proc
@@ -5,10 +5,14 @@ import asyncio
 import os
 import json
 import hashlib
-from typing import Dict, Any
-from .services import downloader, transcript, highlight, reframing, captions, render
+from typing import Dict, Any, Optional
+from .services import downloader, transcript, highlight, reframing, captions, previews, render, proxy
+from .executor import run_stage, POOL_SIZES
+from .utils import cached_sha1, derived_sha1
+from .progress import ProgressBus, progress_bus
+from .journal import JobJournal
 
-WORK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'media', 'work'))
+WORK_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'media', 'work'))
 os.makedirs(WORK_DIR, exist_ok=True)
 
 PIPELINE_STEPS = [
@@ -22,84 +26,229 @@ PIPELINE_STEPS = [
     "ready"
 ]
 
-async def save_status(job_id, status):
-    job_dir = os.path.join(WORK_DIR, job_id)
-    os.makedirs(job_dir, exist_ok=True)
-    status_path = os.path.join(job_dir, "status.json")
-    with open(status_path, "w", encoding="utf-8") as f:
-        json.dump(status, f, ensure_ascii=False, indent=2)
+def _env_int(name, default):
+    return max(1, int(os.environ.get(name, default)))
+
+_CORES = os.cpu_count() or 2
+
+# Бюджет параллелизма для каждой стадии (сколько задач одновременно в стадии)
+STAGE_CONCURRENCY = {
+    "download": _env_int("DOWNLOAD_CONCURRENCY", 4),
+    "audio_extract": _env_int("AUDIO_EXTRACT_CONCURRENCY", _CORES),
+    # по одному ASR на устройство: совпадает с размером asr-пула
+    "transcript": _env_int("TRANSCRIPT_CONCURRENCY", POOL_SIZES["asr"]),
+    "highlights": _env_int("HIGHLIGHTS_CONCURRENCY", POOL_SIZES["analysis"]),
+    "reframing": _env_int("REFRAMING_CONCURRENCY", _CORES // 2),
+    "previews": _env_int("PREVIEWS_CONCURRENCY", _CORES // 2),
+    "captions": _env_int("CAPTIONS_CONCURRENCY", _CORES),
+}
 
 class JobQueue:
-    def __init__(self, workers=2):
-        self.queue = asyncio.Queue()
-        self.progress: Dict[str, Any] = {}
-        self.workers = workers
+    """
+    Планировщик по стадиям: у каждой стадии из PIPELINE_STEPS своя очередь и свой лимит воркеров,
+    задача переходит в очередь следующей стадии, как только закончила текущую.
+    """
+    def __init__(self, concurrency: Optional[Dict[str, int]] = None, bus: Optional[ProgressBus] = None,
+                 journal: Optional[JobJournal] = None):
+        self.concurrency = {**STAGE_CONCURRENCY, **(concurrency or {})}
+        self.stages = [step for step in PIPELINE_STEPS if step != "ready"]
+        self.stage_queues: Dict[str, asyncio.Queue] = {step: asyncio.Queue() for step in self.stages}
+        # Точка входа — очередь первой стадии
+        self.queue = self.stage_queues[self.stages[0]]
+        # Статусы задач общие с шиной прогресса: изменения публикуются через self.bus.publish
+        self.bus = bus or progress_bus
+        self.progress: Dict[str, Any] = self.bus.statuses
+        # Журнал задач переживает перезапуск: по нему недоделанные задачи продолжаются с первой незавершённой стадии.
+        # Открывается при первом обращении (на старте сервера), а не при импорте модуля
+        self._journal = journal
+        self.handlers = {
+            "download": self.run_download,
+            "audio_extract": self.run_audio_extract,
+            "transcript": self.run_transcript,
+            "highlights": self.run_highlights,
+            "reframing": self.run_reframing,
+            "previews": self.run_previews,
+            "captions": self.run_captions,
+        }
+
+    @property
+    def journal(self) -> JobJournal:
+        if self._journal is None:
+            self._journal = JobJournal()
+        return self._journal
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    async def submit(self, job_id, job_data):
+        self.journal.submit(job_id, job_data)
+        self.progress[job_id] = {"status": "queued", "steps": []}
+        self.bus.publish(job_id)
+        await self.queue.put((job_id, {"job_data": job_data}))
+
+    # --- Журнал: что стадия оставила в контексте и как это восстановить после перезапуска ---
+    @staticmethod
+    def checkpoint(step, ctx) -> Dict[str, str]:
+        """Пути артефактов стадии; большие результаты (транскрипт, хайлайты) журналируются ссылкой на файл задачи."""
+        job_dir = os.path.join(WORK_DIR, ctx["job_data"]["job_id"])
+        if step == "download":
+            return {"source_path": ctx["source_path"]}
+        if step == "audio_extract":
+            return {"audio_path": ctx["audio_path"]}
+        if step == "transcript":
+            audio_sha1 = ctx["transcript"].get("audio_sha1") or ctx["job_data"].get("audio_sha1")
+            return {"transcript": os.path.join(job_dir, f"transcript_{audio_sha1}.json")}
+        if step == "highlights":
+            return {"highlights": os.path.join(job_dir, "highlights.json")}
+        return {}
+
+    @staticmethod
+    def restore(ctx, artifacts: Dict[str, str]) -> bool:
+        """Возвращает стадию в контекст; False, если её файлов уже нет (стадию надо повторить)."""
+        if not all(os.path.exists(path) for path in artifacts.values()):
+            return False
+        for name, path in artifacts.items():
+            if name in ("transcript", "highlights"):
+                with open(path, encoding="utf-8") as f:
+                    ctx[name] = json.load(f)
+            else:
+                ctx[name] = path
+        return True
+
+    async def resume(self) -> int:
+        """
+        Ставит в очереди задачи, прерванные перезапуском: завершённые стадии восстанавливаются
+        из журнала, задача продолжается с первой незавершённой (или с первой, чьи файлы пропали).
+        """
+        unfinished = await asyncio.to_thread(self.journal.unfinished)
+        for job_id, job_data, done in unfinished:
+            ctx = {"job_data": job_data}
+            steps = []
+            finished = dict(done)
+            for step in self.stages:
+                if step not in finished or not await asyncio.to_thread(self.restore, ctx, finished[step]):
+                    break
+                steps.append({"step": step, "status": "done", "resumed": True})
+            next_step = PIPELINE_STEPS[len(steps)]
+            if next_step == "ready":
+                self.progress[job_id] = {"status": "ready", "steps": steps}
+                self.journal.set_status(job_id, "ready")
+            else:
+                self.progress[job_id] = {"status": "queued", "steps": steps}
+                await self.stage_queues[next_step].put((job_id, ctx))
+            self.bus.publish(job_id)
+        return len(unfinished)
+
+    def status(self, job_id) -> Optional[Dict[str, Any]]:
+        """Статус из памяти, а для задач прошлых запусков — из журнала."""
+        return self.progress.get(job_id) or self.journal.snapshot(job_id)
+
+    # --- Стадии: каждая дополняет контекст задачи своими результатами ---
+    async def run_download(self, ctx, status):
+        job_data = ctx["job_data"]
+        ctx["source_path"] = await run_stage("download", downloader.download, job_data)
+        # Загрузки хэшируются при приёме; для URL — один раз, дальше из .sha1 рядом с файлом
+        if not job_data.get("source_sha1"):
+            job_data["source_sha1"] = await run_stage("download", cached_sha1, ctx["source_path"])
+        job_dir = os.path.join(WORK_DIR, job_data["job_id"])
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, "source.json"), "w", encoding="utf-8") as f:
+            json.dump({"path": ctx["source_path"], "sha1": job_data["source_sha1"]}, f, ensure_ascii=False, indent=2)
+        status["steps"][-1]["progress"] = 100
+
+    async def run_audio_extract(self, ctx, status):
+        # Один проход ffmpeg: WAV для ASR и прокси низкого разрешения, по которому идёт весь анализ видео
+        ctx["audio_path"] = await run_stage("audio_extract", downloader.extract_audio, ctx["source_path"])
+        proxy_path = proxy.proxy_path(ctx["source_path"])
+        if os.path.exists(proxy_path):
+            ctx["job_data"]["proxy_path"] = proxy_path
+        # WAV однозначно получается из исходника: ключ выводится из его SHA1, без перечитывания
+        ctx["job_data"]["audio_sha1"] = derived_sha1(ctx["job_data"]["source_sha1"], "wav", 16000, "mono")
+
+    async def run_transcript(self, ctx, status):
+        job_data = ctx["job_data"]
+        streaming = job_data.get("streaming")
+        if streaming is None:
+            duration = await run_stage("audio_extract", transcript.audio_duration, ctx["audio_path"])
+            streaming = duration >= transcript.STREAMING_MIN_SECONDS
+        if streaming:
+            result = await self.stream_transcript(ctx, status)
+        else:
+            result = await run_stage("transcript", transcript.transcribe, ctx["audio_path"], job_data)
+        ctx["transcript"] = result
+        status["steps"].append({"lang": result.get("language"), "avg_confidence": result.get("avg_confidence")})
+
+    async def stream_transcript(self, ctx, status):
+        """
+        Потоковая транскрипция: после каждого блока аудио обновляются прогресс и предварительные
+        хайлайты (в analysis-пуле, параллельно с распознаванием следующего блока).
+        """
+        job_data = ctx["job_data"]
+        job_id = job_data["job_id"]
+        entry = status["steps"][-1]
+        pending = None
+        result = None
+        async for event in transcript.transcribe_stream(ctx["audio_path"], job_data):
+            if pending is not None:
+                status["partial_highlights"] = len(await pending)
+            if event["total"]:
+                entry["progress"] = int(100 * min(1.0, event["until"] / event["total"]))
+            self.bus.publish(job_id)
+            if event["segments"]:
+                pending = asyncio.ensure_future(run_stage(
+                    "highlights", highlight.update_partial_highlights, ctx["source_path"], event["segments"], job_data))
+            result = event.get("result", result)
+        if pending is not None:
+            status["partial_highlights"] = len(await pending)
+        return result
+
+    async def run_highlights(self, ctx, status):
+        ctx["highlights"] = await run_stage("highlights", highlight.detect_highlights, ctx["source_path"], ctx["transcript"], ctx["job_data"])
+
+    async def run_reframing(self, ctx, status):
+        await run_stage("reframing", reframing.process_reframing, ctx["source_path"], ctx["highlights"], ctx["job_data"])
+
+    async def run_previews(self, ctx, status):
+        await run_stage("previews", previews.generate_previews, ctx["source_path"], ctx["highlights"], ctx["job_data"])
+
+    async def run_captions(self, ctx, status):
+        await run_stage("captions", captions.generate_captions, ctx["transcript"], ctx["highlights"], ctx["job_data"])
 
-    async def worker(self):
+    async def stage_worker(self, step):
+        queue = self.stage_queues[step]
+        handler = self.handlers[step]
+        next_step = PIPELINE_STEPS[PIPELINE_STEPS.index(step) + 1]
         while True:
-            job_id, job_data = await self.queue.get()
+            job_id, ctx = await queue.get()
+            status = self.progress.setdefault(job_id, {"status": "queued", "steps": []})
             try:
-                status = {"status": "processing", "steps": []}
-                self.progress[job_id] = status
-                await save_status(job_id, status)
-                # 1. Download
-                status["steps"].append({"step": "download", "status": "started", "progress": 0})
-                await save_status(job_id, status)
-                # --- Новый: вызвать download синхронно через run_in_executor ---
-                loop = asyncio.get_event_loop()
-                def sync_download():
-                    return downloader.download(job_data)
-                source_path = await loop.run_in_executor(None, sync_download)
-                status["steps"][-1]["status"] = "done"
-                status["steps"][-1]["progress"] = 100
-                await save_status(job_id, status)
-                # 2. Audio extract
-                status["steps"].append({"step": "audio_extract", "status": "started"})
-                await save_status(job_id, status)
-                audio_path = await downloader.extract_audio(source_path)
-                status["steps"][-1]["status"] = "done"
-                await save_status(job_id, status)
-                # 3. Transcript
-                status["steps"].append({"step": "transcript", "status": "started"})
-                await save_status(job_id, status)
-                transcript_result = await transcript.transcribe(audio_path, job_data)
-                status["steps"].append({"lang": transcript_result.get("language"), "avg_confidence": transcript_result.get("avg_confidence")})
-                status["steps"][-2]["status"] = "done"
-                await save_status(job_id, status)
-                # 4. Highlights
-                status["steps"].append({"step": "highlights", "status": "started"})
-                await save_status(job_id, status)
-                highlights = await highlight.detect_highlights(source_path, transcript_result, job_data)
-                status["steps"][-1]["status"] = "done"
-                await save_status(job_id, status)
-                # 5. Reframing
-                status["steps"].append({"step": "reframing", "status": "started"})
-                await save_status(job_id, status)
-                await reframing.process_reframing(source_path, highlights, job_data)
-                status["steps"].append({"step": "previews", "status": "started"})
-                await save_status(job_id, status)
-                await captions.generate_previews(source_path, highlights, job_data)
-                status["steps"][-2]["status"] = "done"
-                status["steps"][-1]["status"] = "done"
-                await save_status(job_id, status)
-                # 7. Captions
-                status["steps"].append({"step": "captions", "status": "started"})
-                await save_status(job_id, status)
-                await captions.generate_captions(transcript_result, highlights, job_data)
-                status["steps"][-1]["status"] = "done"
-                await save_status(job_id, status)
-                # 8. Ready
-                status["status"] = "ready"
-                await save_status(job_id, status)
+                status["status"] = "processing"
+                entry = {"step": step, "status": "started"}
+                if step == "download":
+                    entry["progress"] = 0
+                status["steps"].append(entry)
+                self.bus.publish(job_id)
+                await handler(ctx, status)
+                entry["status"] = "done"
+                self.journal.stage_done(job_id, step, self.stages.index(step), self.checkpoint(step, ctx), ctx["job_data"])
+                if next_step == "ready":
+                    status["status"] = "ready"
+                    self.journal.set_status(job_id, "ready")
+                else:
+                    await self.stage_queues[next_step].put((job_id, ctx))
+                self.bus.publish(job_id)
             except Exception as e:
                 status["status"] = "error"
                 status["error"] = str(e)
-                await save_status(job_id, status)
-            self.queue.task_done()
+                self.journal.set_status(job_id, "error", str(e))
+                self.bus.publish(job_id)
+            queue.task_done()
 
     def start_workers(self):
-        for _ in range(self.workers):
-            asyncio.create_task(self.worker())
+        for step in self.stages:
+            for _ in range(self.concurrency.get(step, 1)):
+                asyncio.create_task(self.stage_worker(step))
 
 job_queue = JobQueue()
-job_queue.start_workers()
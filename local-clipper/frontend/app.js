@@ -124,16 +124,18 @@ function updateJobsList() {
     jobsList.update(jobs);
 }
 
-async function pollJob(job_id) {
-    let done = false;
-    while (!done) {
-        const res = await fetch(`/api/job/${job_id}`);
-        const data = await res.json();
-        jobs[job_id] = data;
-        updateJobsList();
-        if (data.status === 'ready' || data.status === 'error') done = true;
-        await new Promise(r => setTimeout(r, 2000));
+async function onJobStatus(job_id, data, state) {
+    jobs[job_id] = data;
+    updateJobsList();
+    // Потоковая транскрипция: показываем предварительные хайлайты по мере появления
+    if (data.partial_highlights && data.partial_highlights !== state.partialCount) {
+        state.partialCount = data.partial_highlights;
+        const partialRes = await fetch(`/api/job/${job_id}/highlights`);
+        preview.show(job_id, await partialRes.json());
     }
+}
+
+async function onJobDone(job_id) {
     if (jobs[job_id].status === 'ready') {
         // Автозагрузка сегментов и предпросмотра
         // Новый: получаем highlights через API
@@ -144,6 +146,37 @@ async function pollJob(job_id) {
     }
 }
 
+function pollJob(job_id) {
+    // Статус приходит push-событиями (SSE); без EventSource — опрос раз в 2 с
+    if (!window.EventSource) return pollJobFallback(job_id);
+    const state = { partialCount: 0 };
+    const source = new EventSource(`/api/job/${job_id}/events`);
+    source.onmessage = async (e) => {
+        const data = JSON.parse(e.data);
+        if (data.status === 'ready' || data.status === 'error') source.close();
+        await onJobStatus(job_id, data, state);
+        if (data.status === 'ready' || data.status === 'error') onJobDone(job_id);
+    };
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && !['ready', 'error'].includes(jobs[job_id]?.status)) {
+            pollJobFallback(job_id);
+        }
+    };
+}
+
+async function pollJobFallback(job_id) {
+    let done = false;
+    const state = { partialCount: 0 };
+    while (!done) {
+        const res = await fetch(`/api/job/${job_id}`);
+        const data = await res.json();
+        await onJobStatus(job_id, data, state);
+        if (data.status === 'ready' || data.status === 'error') done = true;
+        await new Promise(r => setTimeout(r, 2000));
+    }
+    onJobDone(job_id);
+}
+
 function handleJobSelect(job_id) {
     // При выборе задачи показываем предпросмотр и редактор для выбранного job_id
     fetch(`/api/job/${job_id}/highlights`).then(r => r.json()).then(highlights => {
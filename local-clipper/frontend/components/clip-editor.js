@@ -31,14 +31,35 @@ export default function ClipEditor() {
             const metaBtn = document.createElement('button');
             metaBtn.textContent = 'Генерировать мету';
             metaBtn.style.marginLeft = '12px';
-            metaBtn.onclick = async () => {
+            const metaOut = document.createElement('span');
+            metaOut.style.marginLeft = '12px';
+            metaOut.style.color = '#666';
+            metaOut.style.fontSize = '0.9em';
+            metaBtn.onclick = () => {
+                // Токены модели показываются по мере генерации, в конце — готовая мета
                 metaBtn.disabled = true;
-                const res = await fetch(`/api/job/${job_id}/meta/${seg.id}`, { method: 'POST' });
-                const data = await res.json();
-                alert(`Title: ${data.titles?.[0] || ''}\nHook: ${data.hooks?.[0] || ''}\n#${data.hashtags?.join(' #')}`);
-                metaBtn.disabled = false;
+                metaOut.textContent = '';
+                const es = new EventSource(`/api/job/${job_id}/meta/${seg.id}/stream`);
+                es.onmessage = (e) => {
+                    const data = JSON.parse(e.data);
+                    if (data.token) {
+                        metaOut.textContent += data.token;
+                        return;
+                    }
+                    es.close();
+                    const meta = data.meta || {};
+                    metaOut.textContent = data.error
+                        ? 'Ollama недоступна'
+                        : `Title: ${meta.titles?.[0] || ''} | Hook: ${meta.hooks?.[0] || ''} | #${(meta.hashtags || []).join(' #')}`;
+                    metaBtn.disabled = false;
+                };
+                es.onerror = () => {
+                    es.close();
+                    metaBtn.disabled = false;
+                };
             };
             div.appendChild(metaBtn);
+            div.appendChild(metaOut);
             container.appendChild(div);
         });
         // Кнопка рендера
@@ -65,11 +86,40 @@ export default function ClipEditor() {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ segments: segs, resolution: 720, format: 'mp4' })
             });
-            const data = await res.json();
-            alert('Рендер запущен!');
+            let manifest = await res.json();
+            // Клипы из кэша готовы сразу, остальные — опрашиваем манифест рендера
+            while (res.ok && manifest.status === 'rendering') {
+                showOutputs(manifest);
+                await new Promise(r => setTimeout(r, 2000));
+                manifest = await (await fetch(`/api/job/${job_id}/result?render_id=${manifest.render_id}`)).json();
+            }
+            showOutputs(manifest);
             renderBtn.disabled = false;
         };
         container.appendChild(renderBtn);
+        const outputs = document.createElement('div');
+        outputs.style.marginTop = '12px';
+        container.appendChild(outputs);
+        function showOutputs(manifest) {
+            outputs.innerHTML = '';
+            (manifest.outputs || []).forEach(o => {
+                const row = document.createElement('div');
+                row.style.margin = '6px 0';
+                if (o.status === 'ready') {
+                    // Сервер отдаёт клип по Range: перемотка без скачивания файла целиком
+                    row.innerHTML = `<a href="${o.url}" download>${o.id}</a> · ${(o.size / 1048576).toFixed(1)} MB · ${o.duration.toFixed(1)}s${o.cached ? ' · из кэша' : ''}<br>`;
+                    const video = document.createElement('video');
+                    video.src = o.url;
+                    video.controls = true;
+                    video.preload = 'metadata';
+                    video.style.maxHeight = '320px';
+                    row.appendChild(video);
+                } else {
+                    row.textContent = `${o.id}: ${o.status === 'error' ? 'ошибка' : 'рендер…'}`;
+                }
+                outputs.appendChild(row);
+            });
+        }
     };
     return container;
 }
@@ -38,6 +38,12 @@ export default function Preview() {
             meta.style.fontSize = '0.95em';
             meta.style.color = '#444';
             meta.innerHTML = `<b>${seg.id}</b><br>${seg.start.toFixed(1)}–${seg.end.toFixed(1)}s<br>score: ${seg.score ? seg.score.toFixed(2) : ''}`;
+            if (seg.virality !== undefined) {
+                const badge = document.createElement('span');
+                badge.textContent = ` 🔥 ${seg.virality}`;
+                badge.style.color = { red: '#c0392b', yellow: '#b7950b', green: '#1e8449' }[seg.virality_color] || '#444';
+                meta.appendChild(badge);
+            }
             card.appendChild(meta);
             container.appendChild(card);
         });